@@ -1,9 +1,16 @@
 import os
 import time
+import sys
 import argparse
 import multiprocessing as mp
+from multiprocessing import resource_tracker
+from contextlib import contextmanager, nullcontext, ExitStack
 from shutil import copyfile, rmtree
 import auxiliary as aux
+import binary_hypercubes as bh
+import compressed_hypercubes as ch
+import epistasis as ep
+import metrics as mx
 
 
 def divide_genotype_list(num_genotypes: int, num_parts: int) -> list:
@@ -43,21 +50,23 @@ def divide_genotype_list(num_genotypes: int, num_parts: int) -> list:
     return division
 
 
-def write_pairs(genotypes: list, start_index: int, chunk: int, output_file_name: str):
+def iter_pairs(genotypes: list, mutations: list, start_index: int, chunk: int, diagonal_filter: tuple = None):
     """
-    Write pairs at distance 1 to 'output_file_name' file forming by 'chunk'
+    Yield lines with pairs at distance 1 forming by 'chunk'
        genotypes from 'start_index'
 
     Parameters
     ----------
         genotypes : list
-            List of the genotypes.
+            List of the genotypes encoded by 'aux.intern_genotypes'.
+        mutations : list
+            List of the mutations indexed by their ids.
         start_index : int
             The index of the first genotype to use.
         chunk : int
             The size of the chunk.
-        output_file_name : str
-            Name of the file where the pairs will be printed.
+        diagonal_filter : tuple
+            Filter of diagonals made by 'aux.make_diagonal_filter', if any.
     """
     if start_index < 0 or chunk < 0:
         raise Exception("Both start index and number of lines in a chunk must be positive")
@@ -65,33 +74,337 @@ def write_pairs(genotypes: list, start_index: int, chunk: int, output_file_name:
     if start_index >= len(genotypes):
         raise Exception("Start index must be less than the size of genotypes")
 
+    positions, variants = aux.split_mutations(mutations)
+
     # If end_index is too big, we set it equal to the size of genotypes
     chunk = min(chunk, len(genotypes) - start_index)
-    lines: list = list()
+    emitted = 0
     for i in range(start_index, start_index + chunk):
         for j in range(i + 1, len(genotypes)):
-            direction, delta = aux.get_delta(genotypes[i], genotypes[j])
-            if len(delta) == 1:
-                if direction == 'forward':
-                    lines.append(str(delta[0]) + '\t' + ':'.join(genotypes[i]) + '\t' + ':'.join(genotypes[j]))
-                else:
-                    lines.append(str(delta[0]) + '\t' + ':'.join(genotypes[j]) + '\t' + ':'.join(genotypes[i]))
+            direction, delta = aux.get_encoded_delta(genotypes[i], genotypes[j], positions, variants)
+            if len(delta) == 1 and (diagonal_filter is None or aux.mutation_allowed(delta[0], diagonal_filter)):
+                first, last = (i, j) if direction == 'forward' else (j, i)
+                emitted += 1
+                yield (delta[0] + '\t' + aux.decode_genotype(genotypes[first], mutations) + '\t' +
+                       aux.decode_genotype(genotypes[last], mutations))
+    if mx.task is not None:
+        mx.add_pairs(sum(len(genotypes) - i - 1 for i in range(start_index, start_index + chunk)), emitted)
+
+
+def get_pairs(genotypes: list, mutations: list, start_index: int, chunk: int,
+              diagonal_filter: tuple = None) -> list:
+    """Return the list of lines of 'iter_pairs'."""
+    return list(iter_pairs(genotypes, mutations, start_index, chunk, diagonal_filter))
+
+
+def write_pairs(genotypes: list, mutations: list, start_index: int, chunk: int, output_file_name: str,
+                diagonal_filter: tuple = None):
+    """
+    Write pairs at distance 1 to 'output_file_name' file forming by 'chunk'
+       genotypes from 'start_index'. See 'iter_pairs' for parameters.
+       Lines beyond 'worker_memory_limit' are spilled to disk in sorted runs.
+    """
+    lines = iter_pairs(genotypes, mutations, start_index, chunk, diagonal_filter)
 
     # Print pairs to the output file
-    with open(output_file_name, 'w') as fh:
-        for line in sorted(lines):
-            print(line, file=fh)
+    aux.write_sorted_runs(lines, output_file_name, worker_memory_limit)
+
+
+def iter_bucket_pairs(genotypes: list, mutations: list, buckets: list, first_new: int = None):
+    """
+    Yield lines with pairs at distance 1 forming by
+       'buckets' of genotypes differing at one position.
+       With 'first_new', only pairs with a genotype of index at least
+       'first_new' are formed (see 'update_hypercubes').
+
+    Parameters
+    ----------
+        genotypes : list
+            List of the genotypes encoded by 'aux.intern_genotypes'.
+        mutations : list
+            List of the mutations indexed by their ids.
+        buckets : list
+            List of buckets produced by 'aux.index_single_mutants',
+            filtered by 'aux.filter_buckets' if diagonals are filtered.
+        first_new : int
+            Index of the first new genotype, if any.
+    """
+    names: dict = dict()
+    emitted = 0
+    for position, members in buckets:
+        # Decode every genotype of the bucket only once
+        for _, ind in members:
+            if ind not in names:
+                names[ind] = aux.decode_genotype(genotypes[ind], mutations)
+        for i in range(len(members) - 1):
+            first_letter, first = members[i]
+            for j in range(i + 1, len(members)):
+                last_letter, last = members[j]
+                if first_new is None or first >= first_new or last >= first_new:
+                    emitted += 1
+                    yield first_letter + position + last_letter + '\t' + names[first] + '\t' + names[last]
+    if mx.task is not None:
+        mx.add_pairs(sum(len(members) * (len(members) - 1) // 2 for _, members in buckets), emitted)
+
+
+def get_bucket_pairs(genotypes: list, mutations: list, buckets: list, first_new: int = None) -> list:
+    """Return the list of lines of 'iter_bucket_pairs'."""
+    return list(iter_bucket_pairs(genotypes, mutations, buckets, first_new))
+
+
+def write_bucket_pairs(genotypes: list, mutations: list, buckets: list, output_file_name: str):
+    """
+    Write pairs at distance 1 to 'output_file_name' file forming by
+       'buckets' of genotypes differing at one position.
+       See 'iter_bucket_pairs' for parameters and 'write_pairs' for spilling.
+    """
+    lines = iter_bucket_pairs(genotypes, mutations, buckets)
+
+    # Print pairs to the output file
+    aux.write_sorted_runs(lines, output_file_name, worker_memory_limit)
+
+
+# Genotypes and mutations of dimension one attached in the worker by 'attach_genotype_table'
+# together with the name of their table, kept between tasks until 'release_worker'
+worker_genotypes = None
+worker_mutations = None
+worker_table_name = None
+
+# The file with hypercubes kept open in the worker between tasks by 'cached_hypercubes'
+# as the tuple (key, opened file), None if no file is open
+worker_file = None
+
+# Memory budget in bytes for the lines of a chunk kept by a worker before
+# they are spilled to disk in sorted runs (see 'aux.write_sorted_runs'),
+# set by --worker-memory; None keeps the whole chunk in memory
+worker_memory_limit = None
+
+# Barrier of the workers of the pool of the run, see 'release_workers'
+worker_barrier = None
+
+
+@contextmanager
+def genotype_table(genotypes: list, mutations: list):
+    """Share encoded 'genotypes' with workers and yield the table (name,
+       mutations) given to the tasks '*_from_table', so workers attach to
+       a single copy of genotypes instead of getting it with every task."""
+    block = aux.share_genotypes(genotypes)
+    try:
+        yield block.name, mutations
+    finally:
+        block.close()
+        block.unlink()
+
+
+def attach_genotype_table(table: tuple):
+    """Open the genotype 'table' shared by the parent process in the worker, unless it is attached already."""
+    global worker_genotypes, worker_mutations, worker_table_name
+    name, mutations = table
+    if worker_table_name == name:
+        return
+    if worker_genotypes is not None:
+        worker_genotypes.close()
+    worker_genotypes = aux.GenotypeTable(name)
+    worker_mutations = mutations
+    worker_table_name = name
+
+
+def write_pairs_from_table(table: tuple, start_index: int, chunk: int, output_file_name: str,
+                           diagonal_filter: tuple = None):
+    """Run 'write_pairs' on the genotype 'table' attached to the worker."""
+    attach_genotype_table(table)
+    write_pairs(worker_genotypes, worker_mutations, start_index, chunk, output_file_name, diagonal_filter)
+
+
+def write_bucket_pairs_from_table(table: tuple, buckets: list, output_file_name: str):
+    """Run 'write_bucket_pairs' on the genotype 'table' attached to the worker."""
+    attach_genotype_table(table)
+    write_bucket_pairs(worker_genotypes, worker_mutations, buckets, output_file_name)
+
+
+def get_pairs_from_table(table: tuple, chunk_args: tuple) -> list:
+    """Run 'get_pairs' on the genotype 'table' attached to the worker."""
+    attach_genotype_table(table)
+    return get_pairs(worker_genotypes, worker_mutations, *chunk_args)
+
+
+def get_bucket_pairs_from_table(table: tuple, chunk_args: tuple) -> list:
+    """Run 'get_bucket_pairs' on the genotype 'table' attached to the worker."""
+    attach_genotype_table(table)
+    return get_bucket_pairs(worker_genotypes, worker_mutations, *chunk_args)
+
+
+def cached_hypercubes(hypercube_file_name: str, binary: bool = False):
+    """Return the file with hypercubes opened by 'ch.open_hypercubes' (by
+       'bh.BinaryHypercubes' if 'binary') and keep it open in the worker for
+       the next tasks until 'release_worker'. The file replaced since it was
+       opened is opened again."""
+    global worker_file
+    stat = os.stat(hypercube_file_name)
+    key = (os.path.abspath(hypercube_file_name), binary, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if worker_file is None or worker_file[0] != key:
+        close_worker_file()
+        worker_file = (key, bh.BinaryHypercubes(hypercube_file_name) if binary
+                       else ch.open_hypercubes(hypercube_file_name))
+    return worker_file[1]
+
+
+def close_worker_file():
+    """Close the file with hypercubes kept open by the worker, if any."""
+    global worker_file
+    if worker_file is not None:
+        worker_file[1].close()
+        worker_file = None
+
+
+def release_worker(_=None):
+    """Close the file with hypercubes and the genotype table kept by the worker
+       and wait until every worker of the pool of the run does the same."""
+    global worker_genotypes, worker_mutations, worker_table_name
+    close_worker_file()
+    if worker_genotypes is not None:
+        worker_genotypes.close()
+        worker_genotypes = worker_mutations = worker_table_name = None
+    worker_barrier.wait()
+
+
+def init_worker(memory_limit: int = None, barrier=None):
+    """Pass the settings of the main process to the worker started by any start method."""
+    global worker_memory_limit, worker_barrier
+    worker_memory_limit = memory_limit
+    worker_barrier = barrier
+
+
+# Pool of workers kept for the whole run by 'worker_pool' and its number of workers, None outside of it
+run_pool = None
+run_pool_size = 0
+
+
+@contextmanager
+def task_pool(cores: int):
+    """Yield the pool of the run (see 'worker_pool') if there is one, otherwise
+       a new pool of 'cores' workers terminated at the end of the block."""
+    if run_pool is not None:
+        try:
+            yield run_pool
+        finally:
+            # Caches of the stage are never reused by the next one, even if the stage failed
+            release_workers()
+        return
+    with mp.Pool(processes=cores, initializer=init_worker, initargs=(worker_memory_limit,)) as pool:
+        yield pool
+
+
+def release_workers():
+    """Make every worker of the pool of the run release its file and genotype table:
+       every worker runs exactly one task as the tasks wait for each other."""
+    run_pool.map(release_worker, range(run_pool_size), chunksize=1)
 
 
-def make_division_of_hypercube_file(input_file_name: str) -> list:
+@contextmanager
+def worker_pool(cores: int):
+    """
+    Keep one pool of 'cores' workers for all stages started within the block.
+
+    Workers are started once instead of once per stage and dimension, which
+    matters most with the 'spawn' and 'forkserver' start methods importing
+    the modules in every new worker. Within a stage workers keep the genotype
+    table and the file with hypercubes open between tasks; at the end of the
+    stage every worker releases them (see 'release_workers'), so no file is
+    held open while the main process replaces or removes it.
+    """
+    global run_pool, run_pool_size
+    if run_pool is not None:
+        yield run_pool
+        return
+    # Workers share the resource tracker of the main process only if it runs before they are started,
+    # otherwise every worker starts its own one which reports genotype tables as leaked
+    resource_tracker.ensure_running()
+    with mp.Pool(processes=cores, initializer=init_worker,
+                 initargs=(worker_memory_limit, mp.Barrier(cores))) as pool:
+        run_pool, run_pool_size = pool, cores
+        try:
+            yield pool
+        finally:
+            run_pool, run_pool_size = None, 0
+
+
+def scan_hypercube_file(input_file_name: str, start: int, end: int) -> list:
+    """Return the index of diagonal groups, that is, the list of tuples
+       (diagonal, byte offset, number of lines), for the lines of
+       'input_file_name' starting in the byte range from 'start' to 'end'."""
+    index: list = list()
+    with open(input_file_name, 'rb') as fh:
+        position = start
+        if start > 0:
+            # Move to the beginning of the first line starting in the range
+            fh.seek(start - 1)
+            position += len(fh.readline()) - 1
+        while position < end:
+            line = fh.readline()
+            if not line:
+                break
+            diagonal = line[:line.find(b'\t')].decode()
+            if len(index) > 0 and index[-1][0] == diagonal:
+                index[-1][2] += 1
+            else:
+                index.append([diagonal, position, 1])
+            position += len(line)
+    return [tuple(entry) for entry in index]
+
+
+def index_hypercube_file(input_file_name: str, cores: int) -> list:
+    """Return the index of diagonal groups of 'input_file_name' scanning
+       'cores' byte ranges of the file in parallel. The compressed file is
+       scanned sequentially."""
+    if ch.compression_of(input_file_name) is not None:
+        return ch.index_groups(input_file_name)
+
+    with open(input_file_name, 'rb') as fh:
+        # Skip header
+        fh.readline()
+        header_end = fh.tell()
+    size = os.path.getsize(input_file_name) - header_end
+    bounds = [header_end + round(i * size / cores) for i in range(cores + 1)]
+    args = [(input_file_name, bounds[i], bounds[i + 1]) for i in range(cores)]
+
+    if cores > 1:
+        with task_pool(cores) as pool:
+            parts = pool.starmap(scan_hypercube_file, args)
+    else:
+        parts = [scan_hypercube_file(*args[0])]
+
+    # Join diagonal groups split between the ranges
+    index: list = list()
+    for part in parts:
+        for diagonal, position, count in part:
+            if len(index) > 0 and index[-1][0] == diagonal:
+                index[-1] = (diagonal, index[-1][1], index[-1][2] + count)
+            else:
+                index.append((diagonal, position, count))
+    return index
+
+
+def make_division_of_hypercube_file(input_file_name: str, cores: int = 1, include_single: bool = False) -> list:
     """
     Generate division of the hypercube file into the
     chunks of parallel hypercubes.
 
+    The division is made from the index of diagonal groups written
+    next to the file while merging it; without the index (for example,
+    for the file given with '-p') the file is scanned on 'cores' cores.
+    Positions of chunks in the compressed file are virtual offsets
+    (see compressed_hypercubes.py).
+
     Parameters
     ----------
         input_file_name : str
             Name of the file containing the all the hypercubes.
+        cores : int
+            The number of cores to scan the file without index.
+        include_single : bool
+            Keep chunks of a single hypercube, which cannot form
+            next-dimensional hypercubes, in the division.
 
     Returns
     -------
@@ -101,38 +414,18 @@ def make_division_of_hypercube_file(input_file_name: str) -> list:
             The second is the position (in lines) of the genotype in its chunk.
             The third is the chunk start position.
     """
-    with open(input_file_name, 'r') as fh:
-        # Skip header
-        fh.readline()
+    if os.path.isfile(aux.index_file_name(input_file_name)):
+        index = aux.read_index(aux.index_file_name(input_file_name))
+    else:
+        index = index_hypercube_file(input_file_name, cores)
 
-        division = list()
-        chunk_start_line = 1
-        chunk_start_position = fh.tell()
-        current_line = 1
-
-        # Process lines with hypercubes
-        line = fh.readline()
-        previous_diagonal = line.split('\t')[0]
-        previous_position = 0
-        while line:
-            diagonal = line.split('\t')[0]
-
-            if diagonal != previous_diagonal:
-                if current_line - chunk_start_line > 1:
-                    # At least two lines in a chunk => can be a hypercube: add the chunk for processing
-                    division.append((chunk_start_line, current_line - chunk_start_line, chunk_start_position))
-                chunk_start_line = current_line
-                chunk_start_position = previous_position
-
-            previous_position = fh.tell()
-            previous_diagonal = diagonal
-            current_line += 1
-            line = fh.readline()
-
-    # Process correctly the end of file
-    if current_line - chunk_start_line > 1:
-        # At least two lines in a chunk => can be a hypercube: add the chunk for processing
-        division.append((chunk_start_line, current_line - chunk_start_line, chunk_start_position))
+    division = list()
+    chunk_start_line = 1
+    for diagonal, chunk_start_position, chunk_length in index:
+        if chunk_length > 1 or include_single:
+            # At least two lines in a chunk => can be a hypercube: add the chunk for processing
+            division.append((chunk_start_line, chunk_length, chunk_start_position))
+        chunk_start_line += chunk_length
 
     return division
 
@@ -157,105 +450,1208 @@ def print_division(division: list):
     print()
 
 
-def process_diagonal(diagonal: str, same_diag_start: list, same_diag_end: list) -> str:
+def iter_diagonal(diagonal: str, same_diag_start: list, same_diag_end: list,
+                  diagonal_filter: tuple = None, maximal: list = None, new: set = None):
     """Take parallel hypercubes with the same 'diagonal',
-       generate and return next-dimensional hypercubes."""
-    diagonal_list = diagonal.split(':')
-    lines: list = list()
-    for i in range(len(same_diag_start) - 1):
-        for j in range(i + 1, len(same_diag_start)):
-            direction, delta = aux.get_delta(same_diag_start[i].split(':'), same_diag_start[j].split(':'))
-            if len(delta) == 1 and diagonal_list[-1] < delta[0]:
-                new_diagonal = diagonal + ':' + delta[0]
-                if direction == 'forward':
-                    lines.append(new_diagonal + '\t' + same_diag_start[i] + '\t' + same_diag_end[j])
-                else:
-                    lines.append(new_diagonal + '\t' + same_diag_start[j] + '\t' + same_diag_end[i])
-    return lines
-
-
-def process_file_with_hypercubes(hypercube_file_name: str, position: int, chunk_length: int, output_file_name: str):
-    """Generate the next-dimensional hypercubes from 'hypercube_file_name'
-       and write them into 'output_file_name'."""
-    same_diag_start_list = list()
-    same_diag_end_list = list()
-    with open(hypercube_file_name, 'r') as fh:
+       generate and yield next-dimensional hypercubes as lines.
+
+    Only pairs of hypercubes whose first genotypes share a bucket of
+    'aux.index_single_mutants' are considered, that is, the ones
+    differing at exactly one position. With 'diagonal_filter' (see
+    'aux.make_diagonal_filter') buckets of disallowed mutations are
+    dropped before pairs are formed.
+
+    Every hypercube of a bucket is a face of a next-dimensional hypercube
+    (generated from this group or, if the order of mutations requires, from
+    another one), so hypercubes of no bucket are maximal: if the list
+    'maximal' is given, they are appended to it as lines. If the set 'new'
+    of indices of new hypercubes is given, only pairs with a new hypercube
+    are considered (see 'update_hypercubes').
+
+    Pairs compared and emitted and the time spent on the group are
+    counted in the measurements of the task (see 'mx.add_group')."""
+    start_time = time.perf_counter()
+    if diagonal_filter is not None and not aux.diagonal_allowed(diagonal, diagonal_filter):
+        return
+    last_mutation = diagonal.split(':')[-1]
+
+    # Parse every genotype only once
+    mutations, starts = aux.intern_genotypes([start.split(':') for start in same_diag_start])
+    buckets = aux.index_single_mutants(starts, *aux.split_mutations(mutations))
+    if diagonal_filter is not None:
+        buckets = aux.filter_buckets(buckets, diagonal_filter)
+
+    emitted = 0
+    for position, members in buckets:
+        for i in range(len(members) - 1):
+            first_letter, first = members[i]
+            for j in range(i + 1, len(members)):
+                last_letter, last = members[j]
+                delta = first_letter + position + last_letter
+                # Mutations in the diagonal are alphabetically ordered
+                if last_mutation < delta and (new is None or first in new or last in new):
+                    emitted += 1
+                    yield diagonal + ':' + delta + '\t' + same_diag_start[first] + '\t' + same_diag_end[last]
+
+    if maximal is not None:
+        contained = set(ind for _, members in buckets for _, ind in members)
+        maximal.extend(diagonal + '\t' + same_diag_start[ind] + '\t' + same_diag_end[ind]
+                       for ind in range(len(same_diag_start)) if ind not in contained)
+    if mx.task is not None:
+        mx.add_group(diagonal, len(same_diag_start), sum(len(members) * (len(members) - 1) // 2
+                                                         for _, members in buckets),
+                     emitted, time.perf_counter() - start_time)
+
+
+def process_diagonal(diagonal: str, same_diag_start: list, same_diag_end: list,
+                     diagonal_filter: tuple = None, maximal: list = None, new: set = None) -> list:
+    """Return the list of lines of 'iter_diagonal'."""
+    return list(iter_diagonal(diagonal, same_diag_start, same_diag_end, diagonal_filter, maximal, new))
+
+
+def iter_file_hypercubes(hypercube_file_name: str, chunks: list, diagonal_filter: tuple = None,
+                         maximal: list = None, new_starts: list = None):
+    """Generate and yield the next-dimensional hypercubes from the 'chunks'
+       of parallel hypercubes of 'hypercube_file_name', given as tuples
+       (position, number of lines). See 'iter_diagonal' for 'maximal'.
+       If 'new_starts' is given, only pairs with a new hypercube are considered,
+       new hypercubes of every chunk being given by the set of their first genotypes."""
+    # The file stays open in the worker for the next tasks
+    fh = cached_hypercubes(hypercube_file_name)
+    for chunk, (position, chunk_length) in enumerate(chunks):
+        same_diag_start_list = list()
+        same_diag_end_list = list()
         fh.seek(position)
         diagonal = ''
         for i in range(chunk_length):
             line = fh.readline()
-            diagonal, start, end = line.strip().split('\t')
+            line_diagonal, start, end = line.rstrip().split('\t')
+            # Front-coded lines omit the diagonal of the previous line
+            diagonal = line_diagonal or diagonal
             same_diag_start_list.append(start)
             same_diag_end_list.append(end)
 
-        lines = process_diagonal(diagonal, same_diag_start_list, same_diag_end_list)
+        new = None
+        if new_starts is not None:
+            new = set(ind for ind, start in enumerate(same_diag_start_list) if start in new_starts[chunk])
+        yield from iter_diagonal(diagonal, same_diag_start_list, same_diag_end_list, diagonal_filter, maximal, new)
 
-    with open(output_file_name, 'w') as out_fh:
-        for line in sorted(lines):
-            print(line, file=out_fh)
 
+def get_file_hypercubes(hypercube_file_name: str, chunks: list, diagonal_filter: tuple = None,
+                        maximal: list = None, new_starts: list = None) -> list:
+    """Return the list of hypercubes of 'iter_file_hypercubes'."""
+    return list(iter_file_hypercubes(hypercube_file_name, chunks, diagonal_filter, maximal, new_starts))
 
-def process_dimension_one(cores: int, input_file: str, working_dir: str) -> list:
-    """Generate all one-dimensional hypercubes from the list of genotypes"""
-    genotypes = aux.read_genotypes(input_file)
 
-    num_genotypes = len(genotypes)
-    chunks_per_core = 10        # That is, every core has, on average, 10 chunks of work
-    chunks = cores * chunks_per_core
-    chunks = min(chunks, num_genotypes)
-    division = divide_genotype_list(num_genotypes, chunks)
+def maximal_chunk_file_name(output_file_name: str) -> str:
+    """Return the name of the file with maximal hypercubes written next to the chunk file 'output_file_name'."""
+    return os.path.join(os.path.dirname(output_file_name), 'maximal_' + os.path.basename(output_file_name))
 
-    args = list()
-    outfiles = list()
-    for chunk in range(chunks):
-        outfile_name = working_dir + '/' + str(chunk) + '.txt'
-        outfiles.append(outfile_name)
-        args.append((genotypes, division[chunk][0], division[chunk][1], outfile_name))
 
-    with mp.Pool(processes=cores) as pool:
-        pool.starmap(write_pairs, args)
+def process_file_with_hypercubes(hypercube_file_name: str, chunks: list, output_file_name: str,
+                                 diagonal_filter: tuple = None, maximal: bool = False, new_starts: list = None):
+    """Write the hypercubes of 'iter_file_hypercubes' into 'output_file_name',
+       spilling them to disk in sorted runs beyond 'worker_memory_limit'.
+       With 'maximal', maximal hypercubes of the chunks are written into
+       the file 'maximal_chunk_file_name(output_file_name)' too."""
+    maximal_lines = list() if maximal else None
+    lines = iter_file_hypercubes(hypercube_file_name, chunks, diagonal_filter, maximal_lines, new_starts)
+    aux.write_sorted_runs(lines, output_file_name, worker_memory_limit)
+    if maximal:
+        aux.write_sorted_lines(maximal_lines, maximal_chunk_file_name(output_file_name))
+
+
+def iter_binary_group_hypercubes(hypercube_file_name: str, group_indices: list, diagonal_filter: tuple = None,
+                                 maximal: list = None):
+    """Generate and yield the next-dimensional hypercubes from the diagonal
+       groups 'group_indices' of the binary 'hypercube_file_name'.
+       See 'iter_diagonal' for 'maximal'."""
+    hypercubes = cached_hypercubes(hypercube_file_name, True)
+    for group_index in group_indices:
+        yield from iter_diagonal(*hypercubes.group(group_index), diagonal_filter, maximal)
+
+
+def get_binary_group_hypercubes(hypercube_file_name: str, group_indices: list, diagonal_filter: tuple = None,
+                                maximal: list = None) -> list:
+    """Return the list of hypercubes of 'iter_binary_group_hypercubes'."""
+    return list(iter_binary_group_hypercubes(hypercube_file_name, group_indices, diagonal_filter, maximal))
 
-    return division
 
+def process_binary_groups(hypercube_file_name: str, group_indices: list, output_file_name: str,
+                          diagonal_filter: tuple = None, maximal: bool = False):
+    """Write the hypercubes of 'iter_binary_group_hypercubes' into 'output_file_name',
+       see 'process_file_with_hypercubes' for spilling and 'maximal'."""
+    maximal_lines = list() if maximal else None
+    lines = iter_binary_group_hypercubes(hypercube_file_name, group_indices, diagonal_filter, maximal_lines)
+    aux.write_sorted_runs(lines, output_file_name, worker_memory_limit)
+    if maximal:
+        aux.write_sorted_lines(maximal_lines, maximal_chunk_file_name(output_file_name))
 
-def process_dimension(cores: int, hypercube_file_name: str, working_dir: str) -> list:
+
+# Every core has, on average, 10 tasks of work
+CHUNKS_PER_CORE = 10
+
+
+def schedule_chunks(costs: list, num_tasks: int) -> list:
+    """
+    Pack consecutive units of work with estimated 'costs' into about
+    'num_tasks' tasks of comparable cost.
+
+    Units cheaper than the average cost of a task are packed together,
+    units exceeding it form tasks of their own.
+
+    Returns
+    -------
+        tasks : list
+            The list of triples (first unit, number of units, cost)
+            ordered by decreasing cost, so that the heaviest tasks
+            are dispatched first.
+    """
+    if len(costs) == 0:
+        return list()
+    target = sum(costs) / max(num_tasks, 1)
+
+    tasks = list()
+    start = 0
+    cost = 0
+    for unit, unit_cost in enumerate(costs):
+        if unit_cost >= target and unit > start:
+            # Isolate the heavy unit
+            tasks.append((start, unit - start, cost))
+            start = unit
+            cost = 0
+        cost += unit_cost
+        if cost >= target:
+            tasks.append((start, unit + 1 - start, cost))
+            start = unit + 1
+            cost = 0
+    if start < len(costs):
+        tasks.append((start, len(costs) - start, cost))
+
+    tasks.sort(key=lambda task: -task[2])
+    return tasks
+
+
+def call(task: tuple):
+    """Call the function being the first element of 'task' with the other elements as arguments."""
+    return task[0](*task[1:])
+
+
+def call_measured(task: tuple) -> tuple:
+    """Call the task as 'call' does and return the tuple of its result and
+       its measurements (see 'mx.finish_task')."""
+    mx.start_task()
+    result = call(task)
+    return result, mx.finish_task()
+
+
+def call_indexed(indexed_task: tuple) -> tuple:
+    """Call the task of the tuple (index, task) as 'call_measured' does and
+       return the tuple of its index and its measurements."""
+    index, task = indexed_task
+    return index, call_measured(task)[1]
+
+
+def record_measurements(results):
+    """Yield results of 'call_measured' adding their measurements to the active metrics."""
+    for result, measurements in results:
+        if mx.active is not None:
+            mx.active.add_task(measurements)
+        yield result
+
+
+def manifest_file_name(working_dir: str) -> str:
+    """Return the name of the manifest of the run in 'working_dir'."""
+    return working_dir + '/manifest.txt'
+
+
+def run_genotype_file_name(working_dir: str) -> str:
+    """Return the name of the file with all genotypes of the run in 'working_dir' written by updates."""
+    return working_dir + '/genotypes.txt'
+
+
+def record(manifest: str, *fields):
+    """Append the record with tab-separated 'fields' to the 'manifest' of the run.
+
+    The manifest is a log of the run with records
+        run <format> <max dimension>     the run is started or resumed, 0 for all dimensions
+        plan <dimension> <tasks>         number of tasks of the dimension
+        done <dimension> <file> <size>   the task has written the file
+        merged <dimension>               the file with hypercubes is complete
+        finished                         the run is finished
+        update <file> <hypercubes>       hypercubes with new genotypes are added
+    """
+    with open(manifest, 'a') as fh:
+        print(*fields, sep='\t', file=fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def read_manifest(manifest: str) -> dict:
+    """Return the state of the run recorded in 'manifest' as the dictionary
+       with the keys 'plans' ({dimension: tasks}), 'done' ({dimension: {file: size}}),
+       'merged' (set of dimensions), 'finished' and 'max_dim' (the maximal dimension
+       of the last start of the run, 0 for all dimensions, None if not recorded)."""
+    state = {'plans': dict(), 'done': dict(), 'merged': set(), 'finished': False, 'max_dim': None}
+    if not os.path.isfile(manifest):
+        return state
+    with open(manifest, 'r') as fh:
+        for line in fh:
+            if not line.endswith('\n'):
+                # The record interrupted by crash
+                break
+            fields = line.rstrip('\n').split('\t')
+            if fields[0] == 'run' and len(fields) > 2:
+                state['max_dim'] = int(fields[2])
+            elif fields[0] == 'plan':
+                state['plans'][int(fields[1])] = int(fields[2])
+            elif fields[0] == 'done':
+                state['done'].setdefault(int(fields[1]), dict())[fields[2]] = int(fields[3])
+            elif fields[0] == 'merged':
+                state['merged'].add(int(fields[1]))
+            elif fields[0] == 'finished':
+                state['finished'] = True
+    return state
+
+
+def run_tasks(pool, args: list, output_file_names: list, checkpoint: dict = None):
+    """
+    Run tasks 'args' (see 'call') writing files 'output_file_names' in the 'pool'.
+
+    With 'checkpoint', the dictionary with the keys 'manifest', 'dimension'
+    and 'done' (names of the files already written), finished tasks are
+    skipped and every newly finished task is recorded in the manifest.
+    Measurements of tasks are added to the active metrics, if any.
+    """
+    done = set() if checkpoint is None else checkpoint['done']
+    pending = [(index, args[index]) for index in range(len(args))
+               if os.path.basename(output_file_names[index]) not in done]
+    if mx.active is not None:
+        mx.active.start_tasks(len(pending))
+    for index, measurements in pool.imap_unordered(call_indexed, pending):
+        if mx.active is not None:
+            mx.active.add_task(measurements)
+        if checkpoint is not None:
+            record(checkpoint['manifest'], 'done', checkpoint['dimension'],
+                   os.path.basename(output_file_names[index]), os.path.getsize(output_file_names[index]))
+
+
+def divide_dimension_one(cores: int, genotypes: list, mutations: list, all_pairs: bool,
+                         num_tasks: int = None, diagonal_filter: tuple = None) -> tuple:
+    """
+    Divide the search of one-dimensional hypercubes into chunks of comparable
+    cost, 'num_tasks' of them if given. Buckets of single mutants are
+    filtered by 'diagonal_filter' before scheduling.
+
+    The cost of the row of the comparison of all pairs is the number of
+    genotypes compared with it, the cost of the bucket of single mutants
+    of size k is k^2.
+
+    Returns
+    -------
+        division : list
+            The division list of triples (first row or bucket, number of
+            rows or buckets, 0) in the order of rows or buckets.
+        chunks : list
+            Arguments of the chunks, the heaviest first: tuples
+            (start_index, chunk) for the comparison of all pairs
+            or tuples (buckets,) otherwise.
+    """
+    if num_tasks is None:
+        num_tasks = cores * CHUNKS_PER_CORE
+    if all_pairs:
+        num_genotypes = len(genotypes)
+        tasks = schedule_chunks([num_genotypes - i for i in range(num_genotypes)], num_tasks)
+        chunks = [(start, length) for start, length, _ in tasks]
+    else:
+        buckets = aux.index_single_mutants(genotypes, *aux.split_mutations(mutations))
+        if diagonal_filter is not None:
+            buckets = aux.filter_buckets(buckets, diagonal_filter)
+        tasks = schedule_chunks([len(members) ** 2 for position, members in buckets], num_tasks)
+        chunks = [(buckets[start:start + length],) for start, length, _ in tasks]
+    division = sorted((start, length, 0) for start, length, _ in tasks)
+    return division, chunks
+
+
+def process_dimension_one(cores: int, input_file: str, working_dir: str, all_pairs: bool = False,
+                          checkpoint: dict = None, diagonal_filter: tuple = None) -> tuple:
+    """Generate all one-dimensional hypercubes from the list of genotypes.
+
+    By default pairs are looked up in the index of genotypes with one masked
+    position; if 'all_pairs' is set, all pairs of genotypes are compared.
+    The number of tasks is taken from 'checkpoint' (see 'run_tasks') if given.
+    Only hypercubes passing 'diagonal_filter' are generated.
+
+    Returns the division and the list of names of the written files."""
+    mutations, genotypes = aux.intern_genotypes(aux.read_genotypes(input_file))
+    division, chunks = divide_dimension_one(cores, genotypes, mutations, all_pairs,
+                                            None if checkpoint is None else checkpoint['tasks'], diagonal_filter)
+    return division, process_chunks_one(cores, genotypes, mutations, chunks, working_dir, all_pairs, checkpoint,
+                                        diagonal_filter)
+
+
+def process_chunks_one(cores: int, genotypes: list, mutations: list, chunks: list, working_dir: str,
+                       all_pairs: bool = False, checkpoint: dict = None, diagonal_filter: tuple = None) -> list:
+    """Run the chunks of 'divide_dimension_one' on 'cores' cores, see
+       'process_dimension_one', and return the list of names of the written files."""
+    # Workers attach to a single copy of genotypes instead of getting it with every chunk
+    with genotype_table(genotypes, mutations) as table, task_pool(cores) as pool:
+        args = list()
+        output_file_names = list()
+        for chunk in range(len(chunks)):
+            output_file_names.append(working_dir + '/' + str(chunk) + '.txt')
+            if all_pairs:
+                args.append((write_pairs_from_table, table) + chunks[chunk] + (output_file_names[-1], diagonal_filter))
+            else:
+                args.append((write_bucket_pairs_from_table, table) + chunks[chunk] + (output_file_names[-1],))
+        run_tasks(pool, args, output_file_names, checkpoint)
+
+    return output_file_names
+
+
+def divide_hypercube_file(cores: int, hypercube_file_name: str, num_tasks: int, include_single: bool = False) -> tuple:
+    """
+    Divide the text file with hypercubes into about 'num_tasks' tasks of
+    comparable cost, the cost of the chunk of parallel hypercubes being
+    estimated as the squared number of lines. Chunks of a single hypercube
+    are included with 'include_single'.
+
+    Returns
+    -------
+        division : list
+            The division of 'make_division_of_hypercube_file'.
+        task_chunks : list
+            For every task, the heaviest first, the list of chunks
+            given as tuples (position, number of lines).
+    """
+    # Understand where in the hypercube_file_name chunks with the same diagonal
+    division = make_division_of_hypercube_file(hypercube_file_name, cores, include_single)
+    tasks = schedule_chunks([chunk_length ** 2 for _, chunk_length, _ in division], num_tasks)
+    task_chunks = [[(position, chunk_length) for _, chunk_length, position in division[start:start + length]]
+                   for start, length, _ in tasks]
+    return division, task_chunks
+
+
+def divide_binary_file(hypercube_file_name: str, num_tasks: int, include_single: bool = False) -> tuple:
+    """Same as 'divide_hypercube_file' for the binary file, whose table of
+       diagonal groups replaces the division. The division list is formed by
+       triples: the first row of the chunk, the number of hypercubes in the chunk
+       and the index of the diagonal group; tasks are lists of group indices."""
+    with bh.BinaryHypercubes(hypercube_file_name) as hypercubes:
+        division = [(hypercubes.group_starts[index], hypercubes.group_size(index), index)
+                    for index in range(hypercubes.num_groups()) if hypercubes.group_size(index) > 1 or include_single]
+    tasks = schedule_chunks([chunk_length ** 2 for _, chunk_length, _ in division], num_tasks)
+    task_groups = [[group_index for _, _, group_index in division[start:start + length]]
+                   for start, length, _ in tasks]
+    return division, task_groups
+
+
+def process_dimension(cores: int, hypercube_file_name: str, working_dir: str, checkpoint: dict = None,
+                      diagonal_filter: tuple = None, maximal: bool = False) -> tuple:
     """
     Generate all hypercubes of dimension 'dim' from
     hypercubes of lower dimension 'dim-1'.
 
     The hypercubes of lower dimension are given in the file 'hypercube_{dim-1}.txt'.
-
+    Chunks of parallel hypercubes with the same diagonal, whose cost is
+    estimated as the squared number of lines, are packed into tasks of
+    comparable cost. The number of tasks is taken from 'checkpoint'
+    (see 'run_tasks') if given. Only hypercubes passing 'diagonal_filter'
+    are generated. With 'maximal', every task also writes maximal hypercubes
+    of lower dimension (see 'process_file_with_hypercubes'), so chunks of a
+    single hypercube are processed too.
+
+    Returns the division and the list of names of the written files.
     """
 
-    # Understand where in the hypercube_file_name chunks with the same diagonal
-    division = make_division_of_hypercube_file(hypercube_file_name)
-    chunks = len(division)
+    num_tasks = cores * CHUNKS_PER_CORE if checkpoint is None else checkpoint['tasks']
+    division, task_chunks = divide_hypercube_file(cores, hypercube_file_name, num_tasks, maximal)
+    return division, process_chunks(cores, hypercube_file_name, task_chunks, working_dir, checkpoint,
+                                    diagonal_filter, maximal)
 
+
+def process_chunks(cores: int, hypercube_file_name: str, task_chunks: list, working_dir: str,
+                   checkpoint: dict = None, diagonal_filter: tuple = None, maximal: bool = False) -> list:
+    """Run the tasks 'task_chunks' of 'divide_hypercube_file' on 'cores' cores,
+       see 'process_dimension', and return the list of names of the written files."""
     args = list()
-    for chunk in range(chunks):
-        chunk_start, chunk_length, position = division[chunk]
-        output_file_name = working_dir + '/' + str(chunk) + ".txt"
-        args.append((hypercube_file_name, position, chunk_length, output_file_name))
+    output_file_names = list()
+    for task in range(len(task_chunks)):
+        output_file_names.append(working_dir + '/' + str(task) + ".txt")
+        args.append((process_file_with_hypercubes, hypercube_file_name, task_chunks[task], output_file_names[-1],
+                     diagonal_filter, maximal))
 
-    with mp.Pool(processes=cores) as pool:
-        pool.starmap(process_file_with_hypercubes, args)
+    with task_pool(cores) as pool:
+        run_tasks(pool, args, output_file_names, checkpoint)
 
-    return division
+    return output_file_names
+
+
+def process_dimension_binary(cores: int, hypercube_file_name: str, working_dir: str,
+                             checkpoint: dict = None, diagonal_filter: tuple = None, maximal: bool = False) -> tuple:
+    """
+    Same as 'process_dimension' for the hypercubes of lower dimension given
+    in the binary file, see 'divide_binary_file' for the division.
+    """
+    num_tasks = cores * CHUNKS_PER_CORE if checkpoint is None else checkpoint['tasks']
+    division, task_groups = divide_binary_file(hypercube_file_name, num_tasks, maximal)
+
+    args = list()
+    output_file_names = list()
+    for task in range(len(task_groups)):
+        output_file_names.append(working_dir + '/' + str(task) + ".txt")
+        args.append((process_binary_groups, hypercube_file_name, task_groups[task], output_file_names[-1],
+                     diagonal_filter, maximal))
+
+    with task_pool(cores) as pool:
+        run_tasks(pool, args, output_file_names, checkpoint)
+
+    return division, output_file_names
+
+
+# Estimated memory in bytes taken by a hypercube and by a group of
+# hypercubes kept in memory, besides the characters of their strings
+HYPERCUBE_OVERHEAD = 2 * sys.getsizeof('') + 2 * 8
+GROUP_OVERHEAD = sys.getsizeof('') + 2 * sys.getsizeof(list()) + sys.getsizeof(tuple()) + 100
+
+
+def iter_group_hypercubes(groups: dict):
+    """Yield hypercubes from 'groups' as tuples (diagonal, first genotype,
+       last genotype) in sorted order."""
+    for diagonal in sorted(groups):
+        starts, ends = groups[diagonal]
+        for start, end in sorted(zip(starts, ends)):
+            yield diagonal, start, end
+
+
+def iter_group_lines(groups: dict):
+    """Yield hypercubes from 'groups' as lines in sorted order."""
+    for hypercube in iter_group_hypercubes(groups):
+        yield '\t'.join(hypercube)
+
+
+def write_groups(groups: dict, output_file_name: str, header: bool = False, compression: str = None,
+                 front_coding: bool = False):
+    """Write hypercubes from 'groups' into 'output_file_name' in sorted order.
+       The file with header is the final output and gets the index of diagonal
+       groups, it is compressed with 'compression' (see compressed_hypercubes.py)."""
+    if header and compression is not None:
+        ch.write_header(output_file_name, compression)
+        with ch.BlockWriter(output_file_name, compression, front_coding,
+                            aux.index_file_name(output_file_name)) as fh:
+            fh.writelines(line + '\n' for line in iter_group_lines(groups))
+        return
+
+    with open(output_file_name, 'w') as fh:
+        if header:
+            header_line = 'diagonal first_genotype last_genotype\n'
+            fh.write(header_line)
+            aux.write_indexed_lines((line + '\n' for line in iter_group_lines(groups)), fh, len(header_line),
+                                    aux.index_file_name(output_file_name))
+        else:
+            for line in iter_group_lines(groups):
+                print(line, file=fh)
+
+
+def read_groups(hypercube_file_name: str) -> dict:
+    """Read hypercubes from 'hypercube_file_name' having header into the
+       dictionary {diagonal: (first genotypes, last genotypes)}."""
+    if bh.is_binary(hypercube_file_name):
+        with bh.BinaryHypercubes(hypercube_file_name) as hypercubes:
+            return dict((diagonal, (starts, ends)) for diagonal, starts, ends in hypercubes.groups())
+
+    groups: dict = dict()
+    with ch.open_text(hypercube_file_name) as fh:
+        # Skip header
+        fh.readline()
+        for line in ch.iter_lines(fh):
+            diagonal, start, end = line.rstrip('\n').split('\t')
+            if diagonal not in groups:
+                groups[diagonal] = (list(), list())
+            groups[diagonal][0].append(start)
+            groups[diagonal][1].append(end)
+    return groups
+
+
+def collect_hypercubes(results, working_dir: str, memory_limit: int) -> tuple:
+    """
+    Group hypercubes from 'results', iterable of lists of lines, by diagonal.
+
+    Once the estimated memory taken by the groups exceeds 'memory_limit'
+    bytes, all hypercubes are spilled to disk into the sorted files
+    0.txt, 1.txt, ... in 'working_dir' ready to be merged.
+
+    Returns
+    -------
+        groups : dict
+            The dictionary {diagonal: (first genotypes, last genotypes)},
+            None if hypercubes were spilled to disk.
+        spilled_file_names : list
+            Names of the files with the spilled hypercubes.
+    """
+    groups: dict = dict()
+    spilled_file_names: list = list()
+    size = 0
+    for lines in results:
+        for line in lines:
+            diagonal, start, end = line.split('\t')
+            group = groups.get(diagonal)
+            if group is None:
+                group = groups[diagonal] = (list(), list())
+                size += len(diagonal) + GROUP_OVERHEAD
+            group[0].append(start)
+            group[1].append(end)
+            size += len(start) + len(end) + HYPERCUBE_OVERHEAD
+
+        if memory_limit is not None and size > memory_limit:
+            spilled_file_names.append(working_dir + '/' + str(len(spilled_file_names)) + '.txt')
+            write_groups(groups, spilled_file_names[-1])
+            groups = dict()
+            size = 0
+
+    if len(spilled_file_names) == 0:
+        return groups, spilled_file_names
+    if len(groups) > 0:
+        spilled_file_names.append(working_dir + '/' + str(len(spilled_file_names)) + '.txt')
+        write_groups(groups, spilled_file_names[-1])
+    return None, spilled_file_names
+
+
+def process_groups(groups: list, diagonal_filter: tuple = None) -> list:
+    """Run 'process_diagonal' on every tuple (diagonal, first genotypes, last genotypes) of 'groups'."""
+    lines: list = list()
+    for group in groups:
+        lines.extend(process_diagonal(*group, diagonal_filter))
+    return lines
+
+
+def process_dimension_one_in_memory(cores: int, genotypes: list, working_dir: str,
+                                    all_pairs: bool, memory_limit: int, diagonal_filter: tuple = None) -> tuple:
+    """Generate all one-dimensional hypercubes passing 'diagonal_filter' from
+       the list of 'genotypes' (as returned by 'aux.read_genotypes') and return
+       the number of chunks together with the result of 'collect_hypercubes'."""
+    mutations, genotypes = aux.intern_genotypes(genotypes)
+    division, chunks = divide_dimension_one(cores, genotypes, mutations, all_pairs, diagonal_filter=diagonal_filter)
+    if all_pairs:
+        chunks = [chunk + (diagonal_filter,) for chunk in chunks]
+    if mx.active is not None:
+        mx.active.start_tasks(len(chunks))
+
+    if cores == 1:
+        worker = get_pairs if all_pairs else get_bucket_pairs
+        results = record_measurements(call_measured((worker, genotypes, mutations) + tuple(chunk))
+                                      for chunk in chunks)
+        groups, spilled_file_names = collect_hypercubes(results, working_dir, memory_limit)
+        return len(chunks), groups, spilled_file_names
+
+    worker = get_pairs_from_table if all_pairs else get_bucket_pairs_from_table
+    with genotype_table(genotypes, mutations) as table, task_pool(cores) as pool:
+        results = record_measurements(pool.imap_unordered(call_measured, [(worker, table, chunk) for chunk in chunks]))
+        groups, spilled_file_names = collect_hypercubes(results, working_dir, memory_limit)
+    return len(chunks), groups, spilled_file_names
+
+
+def process_groups_maximal(groups: list, diagonal_filter: tuple = None) -> tuple:
+    """Same as 'process_groups', returns the tuple (lines, maximal lines), see 'process_diagonal'."""
+    lines: list = list()
+    maximal: list = list()
+    for group in groups:
+        lines.extend(process_diagonal(*group, diagonal_filter, maximal))
+    return lines, maximal
+
+
+def split_maximal(results, maximal: list):
+    """Yield lines of the tuples (lines, maximal lines) from 'results'
+       appending maximal lines to the list 'maximal'."""
+    for lines, maximal_lines in results:
+        maximal.extend(maximal_lines)
+        yield lines
+
+
+def process_dimension_in_memory(cores: int, groups: dict, working_dir: str, memory_limit: int,
+                                diagonal_filter: tuple = None, maximal_file_name: str = None,
+                                compression: str = None, front_coding: bool = False) -> tuple:
+    """Generate next-dimensional hypercubes passing 'diagonal_filter' from
+       lower-dimensional ones kept in memory in 'groups' and return the number
+       of chunks together with the result of 'collect_hypercubes'. Maximal
+       hypercubes of 'groups' are written into 'maximal_file_name' if given,
+       compressed with 'compression' (see compressed_hypercubes.py)."""
+    chunks = [(diagonal, starts, ends) for diagonal, (starts, ends) in groups.items()
+              if len(starts) > 1 or maximal_file_name is not None]
+    tasks = schedule_chunks([len(starts) ** 2 for _, starts, _ in chunks], cores * CHUNKS_PER_CORE)
+    worker = process_groups if maximal_file_name is None else process_groups_maximal
+    args = [(worker, chunks[start:start + length], diagonal_filter) for start, length, _ in tasks]
+
+    maximal: list = list()
+    if mx.active is not None:
+        mx.active.start_tasks(len(args))
+    if cores == 1:
+        results = record_measurements(map(call_measured, args))
+        if maximal_file_name is not None:
+            results = split_maximal(results, maximal)
+        groups, spilled_file_names = collect_hypercubes(results, working_dir, memory_limit)
+    else:
+        with task_pool(cores) as pool:
+            results = record_measurements(pool.imap_unordered(call_measured, args))
+            if maximal_file_name is not None:
+                results = split_maximal(results, maximal)
+            groups, spilled_file_names = collect_hypercubes(results, working_dir, memory_limit)
+
+    if maximal_file_name is not None:
+        ch.write_hypercube_file((line + '\n' for line in sorted(maximal)), maximal_file_name, compression,
+                                front_coding)
+    return len(chunks), groups, spilled_file_names
+
+
+def count_diagonals(lines) -> dict:
+    """Return the dictionary {diagonal: number of hypercubes} of 'lines' with hypercubes."""
+    counts: dict = dict()
+    for line in lines:
+        diagonal = line[:line.find('\t')]
+        counts[diagonal] = counts.get(diagonal, 0) + 1
+    return counts
+
+
+def call_counted(task: tuple) -> dict:
+    """Call the task returning lines with hypercubes as 'call' does and return 'count_diagonals' of them."""
+    return count_diagonals(call(task))
+
+
+def add_counts(results) -> dict:
+    """Sum the dictionaries {diagonal: number of hypercubes} from the iterable 'results'."""
+    counts: dict = dict()
+    for result in results:
+        for diagonal, count in result.items():
+            counts[diagonal] = counts.get(diagonal, 0) + count
+    return counts
+
+
+def count_dimension(cores: int, dimension: int, input_file_name: str, groups: dict = None,
+                    all_pairs: bool = False, diagonal_filter: tuple = None) -> tuple:
+    """
+    Count hypercubes of 'dimension' by diagonals without writing them.
+
+    Workers generate hypercubes chunk by chunk and return only their counts,
+    so neither the files 0.txt, 1.txt, ... nor the merged file are written.
+
+    Parameters
+    ----------
+        input_file_name : str
+            The file with genotypes for the dimension one, otherwise the
+            (text or binary) file with hypercubes of lower dimension.
+        groups : dict
+            Hypercubes of lower dimension kept in memory, used instead of
+            'input_file_name' if given.
+
+    Returns
+    -------
+        chunks : int
+            The number of chunks of parallel hypercubes (or of genotypes).
+        counts : dict
+            The dictionary {diagonal: number of hypercubes}.
+    """
+    num_tasks = cores * CHUNKS_PER_CORE
+    if dimension == 1:
+        mutations, genotypes = aux.intern_genotypes(aux.read_genotypes(input_file_name))
+        division, chunks = divide_dimension_one(cores, genotypes, mutations, all_pairs, num_tasks, diagonal_filter)
+        with genotype_table(genotypes, mutations) as table, task_pool(cores) as pool:
+            if all_pairs:
+                tasks = [(get_pairs_from_table, table, chunk + (diagonal_filter,)) for chunk in chunks]
+            else:
+                tasks = [(get_bucket_pairs_from_table, table, chunk) for chunk in chunks]
+            return len(division), add_counts(pool.imap_unordered(call_counted, tasks))
+
+    if groups is not None:
+        chunks = [(diagonal, starts, ends) for diagonal, (starts, ends) in groups.items() if len(starts) > 1]
+        tasks = [(process_groups, chunks[start:start + length], diagonal_filter)
+                 for start, length, _ in schedule_chunks([len(starts) ** 2 for _, starts, _ in chunks], num_tasks)]
+        num_chunks = len(chunks)
+    elif bh.is_binary(input_file_name):
+        division, task_groups = divide_binary_file(input_file_name, num_tasks)
+        tasks = [(get_binary_group_hypercubes, input_file_name, group_indices, diagonal_filter)
+                 for group_indices in task_groups]
+        num_chunks = len(division)
+    else:
+        division, task_chunks = divide_hypercube_file(cores, input_file_name, num_tasks)
+        tasks = [(get_file_hypercubes, input_file_name, chunks, diagonal_filter) for chunks in task_chunks]
+        num_chunks = len(division)
+
+    with task_pool(cores) as pool:
+        return num_chunks, add_counts(pool.imap_unordered(call_counted, tasks))
+
+
+def count_hypercube_file(hypercube_file_name: str, cores: int = 1) -> dict:
+    """Return the dictionary {diagonal: number of hypercubes} of the (text or binary)
+       'hypercube_file_name' read from its index of diagonal groups."""
+    if bh.is_binary(hypercube_file_name):
+        with bh.BinaryHypercubes(hypercube_file_name) as hypercubes:
+            return add_counts({hypercubes.string(hypercubes.group_diagonals[index]): hypercubes.group_size(index)}
+                              for index in range(hypercubes.num_groups()))
+    if os.path.isfile(aux.index_file_name(hypercube_file_name)):
+        index = aux.read_index(aux.index_file_name(hypercube_file_name))
+    else:
+        index = index_hypercube_file(hypercube_file_name, cores)
+    return add_counts({diagonal: count} for diagonal, _, count in index)
+
+
+def statistics_file_names(working_dir: str, dimension: int) -> tuple:
+    """Return the names of the files with the histograms of hypercubes
+       of 'dimension' by diagonals and by positions."""
+    return (working_dir + '/diagonals_' + str(dimension) + '.txt',
+            working_dir + '/positions_' + str(dimension) + '.txt')
+
+
+def write_statistics(working_dir: str, dimension: int, counts: dict):
+    """
+    Write the histograms of hypercubes of 'dimension' given by 'counts',
+    the dictionary {diagonal: number of hypercubes}, into 'working_dir':
+
+        diagonals_N.txt    the number of hypercubes of every diagonal
+        positions_N.txt    the number of hypercubes changing every position
+    """
+    positions: dict = dict()
+    for diagonal, count in counts.items():
+        for mutation in diagonal.split(':'):
+            position = int(mutation[1:-1])
+            positions[position] = positions.get(position, 0) + count
+
+    diagonals_file_name, positions_file_name = statistics_file_names(working_dir, dimension)
+    aux.write_lines(['diagonal hypercubes'] + [diagonal + '\t' + str(counts[diagonal]) for diagonal in sorted(counts)],
+                    diagonals_file_name)
+    aux.write_lines(['position hypercubes'] + [str(position) + '\t' + str(positions[position])
+                                               for position in sorted(positions)], positions_file_name)
+
+
+def summarize_statistics(working_dir: str) -> list:
+    """Write the file 'statistics.txt' with the numbers of hypercubes and
+       diagonals of every dimension found in 'working_dir' and return its lines."""
+    dimensions = sorted(int(file_name[len('diagonals_'):-len('.txt')]) for file_name in os.listdir(working_dir)
+                        if file_name.startswith('diagonals_') and file_name.endswith('.txt'))
+    lines = ['dimension hypercubes diagonals']
+    for dimension in dimensions:
+        with open(statistics_file_names(working_dir, dimension)[0], 'r') as fh:
+            # Skip header
+            fh.readline()
+            counts = [int(line.rstrip('\n').split('\t')[1]) for line in fh]
+        lines.append(str(dimension) + '\t' + str(sum(counts)) + '\t' + str(len(counts)))
+    aux.write_lines(lines, working_dir + '/statistics.txt')
+    return lines
+
+
+def iter_hypercubes(genotypes, max_dim: int = None, cores: int = 1, all_pairs: bool = False,
+                    min_dim: int = None, positions: list = None, mutations: list = None):
+    """
+    Yield all hypercubes formed by 'genotypes' without writing any files.
+
+    Hypercubes are yielded dimension by dimension as tuples (diagonal,
+    first genotype, last genotype), sorted within a dimension as in the
+    files 'hypercubes_*.txt'. Only hypercubes of the current dimension
+    are kept in memory to generate the next one.
+
+    Parameters
+    ----------
+        genotypes : str or iterable
+            Name of the file with genotypes having header, or genotypes
+            given as colon-separated strings of mutations ('0C:2T', ''
+            or 'wt' for wild-type) or as tuples of mutations.
+        max_dim : int
+            The maximal dimension of hypercubes, all dimensions by default.
+        cores : int
+            The number of cores to be used in calculation.
+        all_pairs : bool
+            Find one-dimensional hypercubes by comparing all pairs of genotypes.
+        min_dim : int
+            The minimal dimension of yielded hypercubes; lower dimensions
+            are generated but not yielded.
+        positions : list
+            Positions the diagonals of hypercubes may change, all by default.
+        mutations : list
+            Mutations ('1A') the diagonals of hypercubes may consist of,
+            all by default (see 'aux.make_diagonal_filter').
+    """
+    if isinstance(genotypes, str):
+        genotypes = aux.read_genotypes(genotypes)
+    else:
+        genotypes = [aux.parse_genotype(genotype, ind) if isinstance(genotype, str) else tuple(genotype)
+                     for ind, genotype in enumerate(genotypes)]
+
+    diagonal_filter = aux.make_diagonal_filter(positions, mutations)
+    with worker_pool(cores) if cores > 1 else nullcontext():
+        _, groups, _ = process_dimension_one_in_memory(cores, genotypes, None, all_pairs, None, diagonal_filter)
+        dimension = 1
+        while len(groups) > 0:
+            if min_dim is None or dimension >= min_dim:
+                yield from iter_group_hypercubes(groups)
+            if dimension == max_dim:
+                return
+            _, groups, _ = process_dimension_in_memory(cores, groups, None, None, diagonal_filter)
+            dimension += 1
 
 
 def get_dimension(filename: str) -> int:
     """Return dimension of the hypercubes stored in the file 'filename'."""
     print('\'' + filename + '\'')
-    with open(filename, 'r') as fh:
+    if bh.is_binary(filename):
+        with bh.BinaryHypercubes(filename) as hypercubes:
+            return hypercubes.dimension
+
+    with ch.open_text(filename) as fh:
+        # Skip header
+        fh.readline()
         # Calculate dimension as number of fields in the diagonal
-        dimension = len(fh.readline()[0].split(':'))
+        dimension = len(fh.readline().split('\t')[0].split(':'))
     return dimension
 
 
-def hypercube_file_name(dimension: int) -> str:
+def copy_hypercube_file(input_file_name: str, output_file_name: str, binary: bool = False,
+                        compression: str = None, front_coding: bool = False):
+    """Copy the file with hypercubes 'input_file_name' (text, compressed or
+       binary) into 'output_file_name' converting it into the binary format
+       or into the text format with 'compression' if needed."""
+    if binary:
+        if bh.is_binary(input_file_name):
+            copyfile(input_file_name, output_file_name)
+        else:
+            bh.text_to_binary(input_file_name, output_file_name)
+    elif bh.is_binary(input_file_name):
+        with bh.BinaryHypercubes(input_file_name) as hypercubes:
+            ch.write_hypercube_file((line + '\n' for line in hypercubes.lines()), output_file_name, compression,
+                                    front_coding, aux.index_file_name(output_file_name))
+    elif compression is None and ch.compression_of(input_file_name) is None:
+        copyfile(input_file_name, output_file_name)
+    else:
+        ch.write_hypercube_file(ch.read_lines(input_file_name), output_file_name, compression, front_coding,
+                                aux.index_file_name(output_file_name))
+
+
+def hypercube_file_name(dimension: int, binary: bool = False, compression: str = None) -> str:
     """Return the name of the file where hypercubes
        of the given 'dimension' are stored."""
-    return 'hypercubes_' + str(dimension) + '.txt'
+    if binary:
+        return 'hypercubes_' + str(dimension) + '.bin'
+    return 'hypercubes_' + str(dimension) + '.txt' + ch.EXTENSIONS.get(compression, '')
+
+
+def maximal_hypercube_file_name(dimension: int, compression: str = None) -> str:
+    """Return the name of the file where maximal hypercubes
+       of the given 'dimension' are stored."""
+    return 'maximal_hypercubes_' + str(dimension) + '.txt' + ch.EXTENSIONS.get(compression, '')
+
+
+def remove_empty_files(file_names: list) -> list:
+    """Remove empty files of 'file_names' and return names of the non-empty ones."""
+    non_empty_file_names = list()
+    for file_name in file_names:
+        if not os.path.isfile(file_name):
+            continue
+        elif os.stat(file_name).st_size == 0:
+            os.remove(file_name)
+            continue
+        non_empty_file_names.append(file_name)
+    return non_empty_file_names
+
+
+def remove_hypercube_file(file_name: str):
+    """Remove the file with hypercubes 'file_name' together with its index, if they exist."""
+    for name in (file_name, aux.index_file_name(file_name)):
+        if os.path.isfile(name):
+            os.remove(name)
+
+
+# Tasks of every shard: nodes divide dimensions identically whatever their numbers of cores
+TASKS_PER_SHARD = 40
+
+# Seconds between checks of the shared folder for files written by other nodes
+SHARD_POLL = 1.0
+
+
+def parse_shard(shard: str) -> tuple:
+    """Return the tuple (shard, shards) given as "i/n" with 1 <= i <= n, raise ValueError otherwise."""
+    index, count = (int(part) for part in shard.split('/'))
+    if count < 1 or index < 1 or index > count:
+        raise ValueError('shard {0} is not between 1/n and n/n'.format(shard))
+    return index, count
+
+
+def select_shard(costs: list, shard: int, shards: int) -> list:
+    """
+    Return indices of the tasks with estimated 'costs' assigned to 'shard'
+    (from 1 to 'shards'). Tasks, the heaviest first, go to the least loaded
+    shard, so every node makes the same assignment from the same costs.
+    """
+    loads = [0] * shards
+    selected = list()
+    for task in sorted(range(len(costs)), key=lambda task: -costs[task]):
+        target = loads.index(min(loads))
+        loads[target] += costs[task]
+        if target == shard - 1:
+            selected.append(task)
+    return selected
+
+
+def shard_file_name(dimension: int, shard: int, shards: int) -> str:
+    """Return the name of the file where 'shard' of 'shards' stores its sorted
+       hypercubes of the given 'dimension'."""
+    return 'hypercubes_{0}.shard_{1}_of_{2}.txt'.format(dimension, shard, shards)
+
+
+def has_parallel_hypercubes(hypercube_file_name: str) -> bool:
+    """Return True if the index of 'hypercube_file_name' has a diagonal group of
+       more than one hypercube, that is, the next dimension has chunks to process."""
+    index_file_name = aux.index_file_name(hypercube_file_name)
+    return os.path.isfile(index_file_name) and any(count > 1 for _, _, count in aux.read_index(index_file_name))
+
+
+def wait_for_file(file_name: str):
+    """Wait until another node publishes 'file_name'."""
+    if not os.path.isfile(file_name):
+        print('Wait for {0}'.format(file_name))
+    while not os.path.isfile(file_name):
+        time.sleep(SHARD_POLL)
+
+
+def process_shard(cores: int, dimension: int, input_file_name: str, working_dir: str, output_file_name: str,
+                  shard: int, shards: int, max_open_files: int, all_pairs: bool = False,
+                  diagonal_filter: tuple = None) -> int:
+    """
+    Generate hypercubes of 'dimension' from the tasks of 'shard' (see
+    'select_shard') and write them sorted into 'output_file_name' under a
+    temporary name renamed at the end. The input is the genotype file for
+    dimension one and the file with hypercubes of the previous dimension
+    otherwise, divided into 'TASKS_PER_SHARD' tasks per shard.
+
+    Returns the number of chunks of all shards.
+    """
+    num_tasks = shards * TASKS_PER_SHARD
+    if dimension == 1:
+        mutations, genotypes = aux.intern_genotypes(aux.read_genotypes(input_file_name))
+        division, chunks = divide_dimension_one(cores, genotypes, mutations, all_pairs, num_tasks, diagonal_filter)
+        if all_pairs:
+            costs = [sum(len(genotypes) - row for row in range(start, start + length)) for start, length in chunks]
+        else:
+            costs = [sum(len(members) ** 2 for _, members in buckets) for buckets, in chunks]
+        chunks = [chunks[task] for task in select_shard(costs, shard, shards)]
+        sorted_file_names = process_chunks_one(cores, genotypes, mutations, chunks, working_dir, all_pairs,
+                                               diagonal_filter=diagonal_filter)
+    else:
+        division, task_chunks = divide_hypercube_file(cores, input_file_name, num_tasks)
+        costs = [sum(chunk_length ** 2 for _, chunk_length in chunks) for chunks in task_chunks]
+        task_chunks = [task_chunks[task] for task in select_shard(costs, shard, shards)]
+        sorted_file_names = process_chunks(cores, input_file_name, task_chunks, working_dir,
+                                           diagonal_filter=diagonal_filter)
+
+    open(output_file_name + '.tmp', 'w').close()
+    aux.merge_sorted_files(remove_empty_files(sorted_file_names), max_open_files, output_file_name + '.tmp',
+                           None, cores, pool=run_pool)
+    os.replace(output_file_name + '.tmp', output_file_name)
+    return len(division)
+
+
+def run_shard(args, shard: int, shards: int, max_open_files: int, diagonal_filter: tuple = None):
+    """
+    Run 'shard' of 'shards' nodes sharing the folder 'args.folder'.
+
+    For every dimension the node writes its sorted hypercubes into the file
+    'shard_file_name' and waits until 'merge_shards.py' merges the files of
+    all shards into the file with hypercubes of the dimension, from which
+    the next dimension is generated. Files appear in the folder only under
+    their final names, so the shared file system is the only coordination
+    needed. The restarted node skips shards already written or merged.
+    """
+    working_dir = args.folder + '/shard_{0}_of_{1}'.format(shard, shards)
+    os.makedirs(working_dir, exist_ok=True)
+    if args.hypercubes is not None:
+        input_file_name = args.hypercubes
+        dimension = get_dimension(input_file_name) + 1
+    else:
+        input_file_name = args.genotypes
+        dimension = 1
+
+    while args.max_dim is None or dimension <= args.max_dim:
+        print('Generate shard {0} of {1} of hypercubes for dimension {2}'.format(shard, shards, dimension))
+        output_file_name = args.folder + '/' + shard_file_name(dimension, shard, shards)
+        merged_file_name = args.folder + '/' + hypercube_file_name(dimension, False, args.compress)
+        chunks = None
+        if not os.path.isfile(output_file_name) and not os.path.isfile(merged_file_name):
+            chunks = process_shard(args.cores, dimension, input_file_name, working_dir, output_file_name, shard,
+                                   shards, max_open_files, args.all_pairs, diagonal_filter)
+            print('Number of chunks:', chunks)
+        if chunks == 0 or dimension == args.max_dim:
+            break
+
+        # The index is published before the merged file and only if there are hypercubes
+        input_file_name = merged_file_name
+        wait_for_file(input_file_name)
+        if not has_parallel_hypercubes(input_file_name):
+            break
+        dimension += 1
+        print()
+    rmtree(working_dir, ignore_errors=True)
+
+
+def new_genotypes(genotypes: list, added_genotypes: list) -> list:
+    """Return indices of the genotypes of 'added_genotypes' absent from 'genotypes', each genotype once."""
+    known = set(frozenset(genotype) for genotype in genotypes)
+    new = list()
+    for ind, genotype in enumerate(added_genotypes):
+        if frozenset(genotype) not in known:
+            known.add(frozenset(genotype))
+            new.append(ind)
+    return new
+
+
+def write_run_genotypes(genotype_file_name: str, added_file_name: str, added: list, output_file_name: str):
+    """Write the genotype file 'genotype_file_name' followed by the genotypes
+       'added' (indices of lines without header) of 'added_file_name' into 'output_file_name'."""
+    with open(genotype_file_name, 'r') as fh:
+        lines = fh.readlines()
+    with open(added_file_name, 'r') as fh:
+        added_lines = fh.readlines()[1:]
+    lines.extend(added_lines[ind] for ind in added)
+    with open(output_file_name, 'w') as fh:
+        fh.writelines(line if line.endswith('\n') else line + '\n' for line in lines)
+
+
+def last_dimension(folder: str, compression: str = None) -> int:
+    """Return the highest dimension up to which all files with hypercubes are in 'folder'."""
+    dimension = 0
+    while os.path.isfile(folder + '/' + hypercube_file_name(dimension + 1, False, compression)):
+        dimension += 1
+    return dimension
+
+
+def read_new_starts(delta_file_name: str) -> dict:
+    """Return first genotypes of the hypercubes of the sorted file 'delta_file_name'
+       without header as the dictionary {diagonal: set of first genotypes}."""
+    new_starts: dict = dict()
+    with open(delta_file_name, 'r') as fh:
+        for line in fh:
+            diagonal, start, _ = line.split('\t')
+            new_starts.setdefault(diagonal, set()).add(start)
+    return new_starts
+
+
+def process_updated_groups(cores: int, hypercube_file_name: str, delta_file_name: str, working_dir: str,
+                           diagonal_filter: tuple = None) -> list:
+    """
+    Generate next-dimensional hypercubes having a new hypercube of the sorted
+    file 'delta_file_name' as a face. Only the diagonal groups of
+    'hypercube_file_name' (old and new hypercubes together, indexed) gaining
+    new hypercubes are processed, the cost of the group being estimated as
+    the number of its lines times the number of its new hypercubes.
+
+    Returns the list of names of the written files.
+    """
+    new_starts = read_new_starts(delta_file_name)
+    chunks = list()
+    chunk_starts = list()
+    for diagonal, position, count in aux.read_index(aux.index_file_name(hypercube_file_name)):
+        if count > 1 and diagonal in new_starts:
+            chunks.append((position, count))
+            chunk_starts.append(new_starts[diagonal])
+    tasks = schedule_chunks([count * len(starts) for (_, count), starts in zip(chunks, chunk_starts)],
+                            cores * CHUNKS_PER_CORE)
+
+    args = list()
+    output_file_names = list()
+    for task, (start, length, _) in enumerate(tasks):
+        output_file_names.append(working_dir + '/' + str(task) + '.txt')
+        args.append((process_file_with_hypercubes, hypercube_file_name, chunks[start:start + length],
+                     output_file_names[-1], diagonal_filter, False, chunk_starts[start:start + length]))
+
+    with task_pool(cores) as pool:
+        run_tasks(pool, args, output_file_names)
+
+    return output_file_names
+
+
+def update_hypercubes(cores: int, genotype_file_name: str, added_file_name: str, folder: str, max_open_files: int,
+                      max_dim: int = None, compression: str = None, front_coding: bool = False,
+                      diagonal_filter: tuple = None) -> list:
+    """
+    Add hypercubes with the genotypes of 'added_file_name' to the files with
+    hypercubes in 'folder' found from the genotypes of 'genotype_file_name'.
+    Once updated, all genotypes of the run are kept in the folder (see
+    'run_genotype_file_name') and replace 'genotype_file_name', whose
+    genotypes must be among them, so the next batch is paired with the
+    previous ones and genotypes of a batch applied again are skipped.
+
+    A hypercube is new if one of its vertices is a new genotype. New
+    one-dimensional hypercubes are the pairs of the buckets of single mutants
+    (see 'aux.index_single_mutants') with a new genotype. A new hypercube of
+    the next dimension is formed by two parallel hypercubes one of which is
+    new, so only the diagonal groups gaining new hypercubes are processed
+    and only their pairs with a new hypercube are considered. New hypercubes
+    of every dimension are merged with the existing ones into the sorted
+    file with its index, from which the next dimension is generated.
+    Dimensions above the existing ones are added while there are new
+    hypercubes, up to 'max_dim', which must be the maximal dimension of the
+    run: hypercubes of a dimension above it formed by old genotypes only
+    are never found by the update.
+
+    Updated files are written under temporary names and renamed once all
+    dimensions are done, so the interrupted update leaves the old files.
+
+    Returns
+    -------
+        updates : list
+            The list of tuples (dimension, number of new hypercubes).
+    """
+    genotypes = aux.read_genotypes(genotype_file_name)
+    if os.path.isfile(run_genotype_file_name(folder)):
+        run_genotypes = aux.read_genotypes(run_genotype_file_name(folder))
+        if len(new_genotypes(run_genotypes, genotypes)) > 0:
+            raise NameError('ERROR: Genotypes of the file {0} are not genotypes of the run in the folder {1}, '
+                            'see the file {2}'.format(genotype_file_name, folder, run_genotype_file_name(folder)))
+        genotype_file_name = run_genotype_file_name(folder)
+        genotypes = run_genotypes
+    added_genotypes = aux.read_genotypes(added_file_name)
+    added = new_genotypes(genotypes, added_genotypes)
+    print('New genotypes:', len(added))
+    mutations, encoded = aux.intern_genotypes(genotypes + [added_genotypes[ind] for ind in added])
+    buckets = aux.index_single_mutants(encoded, *aux.split_mutations(mutations))
+    if diagonal_filter is not None:
+        buckets = aux.filter_buckets(buckets, diagonal_filter)
+    buckets = [(position, members) for position, members in buckets
+               if any(ind >= len(genotypes) for _, ind in members)]
+
+    working_dir = folder + '/update'
+    os.makedirs(working_dir, exist_ok=True)
+    write_run_genotypes(genotype_file_name, added_file_name, added, working_dir + '/genotypes.txt')
+    delta_file_name = working_dir + '/new_1.txt'
+    aux.write_sorted_runs(iter_bucket_pairs(encoded, mutations, buckets, len(genotypes)), delta_file_name,
+                          worker_memory_limit)
+
+    updates = list()
+    dimension = 1
+    while os.path.getsize(delta_file_name) > 0 and (max_dim is None or dimension <= max_dim):
+        print('Update hypercubes of dimension {0}'.format(dimension))
+        file_name = folder + '/' + hypercube_file_name(dimension, False, compression)
+        old_lines = ch.read_lines(file_name) if os.path.isfile(file_name) else list()
+        with open(delta_file_name, 'r') as delta_fh:
+            ch.write_hypercube_file(aux.mergeiter(old_lines, delta_fh), file_name + '.update', compression,
+                                    front_coding, aux.index_file_name(file_name + '.update'))
+        with open(delta_file_name, 'r') as delta_fh:
+            updates.append((dimension, sum(1 for _ in delta_fh)))
+        print('New hypercubes:', updates[-1][1])
+        if max_dim is not None and dimension == max_dim:
+            break
+
+        sorted_file_names = remove_empty_files(process_updated_groups(cores, file_name + '.update', delta_file_name,
+                                                                      working_dir, diagonal_filter))
+        dimension += 1
+        delta_file_name = working_dir + '/new_{0}.txt'.format(dimension)
+        open(delta_file_name, 'w').close()
+        aux.merge_sorted_files(sorted_file_names, max_open_files, delta_file_name, None, cores, pool=run_pool)
+
+    # Publish updated files
+    for dimension, _ in updates:
+        file_name = folder + '/' + hypercube_file_name(dimension, False, compression)
+        os.replace(aux.index_file_name(file_name + '.update'), aux.index_file_name(file_name))
+        os.replace(file_name + '.update', file_name)
+    os.replace(working_dir + '/genotypes.txt', run_genotype_file_name(folder))
+    rmtree(working_dir, ignore_errors=True)
+    return updates
 
 
 if __name__ == '__main__':      # Multiprocessing does not work without this line
@@ -276,26 +1672,210 @@ if __name__ == '__main__':      # Multiprocessing does not work without this lin
                         default='hypercubes')
     parser.add_argument('-c', '--cores', help='the number of cores to be used in calculation, one by default',
                         type=int, default=1)
+    parser.add_argument('--all-pairs', help='find one-dimensional hypercubes by comparing all pairs of genotypes '
+                                            '(slow, useful for cross-checking)', action='store_true')
+    parser.add_argument('--in-memory', help='keep hypercubes in memory between dimensions instead of re-reading '
+                                            'them from the files', action='store_true')
+    parser.add_argument('--memory-limit', help='memory budget in megabytes for hypercubes kept in memory, once it is '
+                                               'exceeded hypercubes are spilled to disk (implies --in-memory)',
+                        type=int)
+    parser.add_argument('--worker-memory', help='memory budget in megabytes for hypercubes of a chunk kept by every '
+                                                'worker, once it is exceeded they are written to disk in sorted runs '
+                                                'merged at the end of the chunk', type=int)
+    parser.add_argument('-f', '--format', help='format of the files with hypercubes, "text" by default; '
+                                               'see binary_hypercubes.py for the binary format',
+                        choices=['text', 'binary'], default='text')
+    parser.add_argument('--compress', help='compress the text files with hypercubes in independent blocks, so '
+                                           'diagonal groups are still read directly (see compressed_hypercubes.py)',
+                        choices=['gzip', 'lzma'])
+    parser.add_argument('--front-coding', help='with --compress, omit the diagonal repeating the diagonal of the '
+                                               'previous line', action='store_true')
+    parser.add_argument('--max-dim', help='the maximal dimension of hypercubes to find, all dimensions by default',
+                        type=int)
+    parser.add_argument('--min-dim', help='the minimal dimension of hypercubes to keep, files of lower dimensions '
+                                          'are removed once they are not needed', type=int)
+    parser.add_argument('--positions', help='comma-separated positions (example: "0,2,5"), only hypercubes '
+                                            'whose diagonal changes these positions only are found')
+    parser.add_argument('--mutations', help='comma-separated mutations (example: "0A,0C,2T"), only hypercubes '
+                                            'whose diagonal consists of these mutations only are found')
+    parser.add_argument('--stats', help='only count hypercubes by dimensions, diagonals and positions; files with '
+                                        'hypercubes are removed once the next dimension is found and the last '
+                                        'dimension (--max-dim) is never written', action='store_true')
+    parser.add_argument('--maximal', help='write maximal hypercubes, not contained in any higher-dimensional '
+                                          'hypercube, into files "maximal_hypercubes_*.txt"; files with all '
+                                          'hypercubes are removed once the next dimension is found',
+                        action='store_true')
+    parser.add_argument('--keep-all', help='with --maximal, keep the files with all hypercubes too',
+                        action='store_true')
+    parser.add_argument('--epistasis', help='write hypercubes with their epistasis and error computed from the '
+                                            '"fitness" and "error" columns of the genotype file into files '
+                                            '"epistasis_*.txt" (see epistasis.py)', action='store_true')
+    parser.add_argument('--resume', help='continue the interrupted run in the existing folder reusing its '
+                                         'finished chunks', action='store_true')
+    parser.add_argument('--update', help='the filename with new genotypes: add hypercubes with them to the '
+                                         'existing folder (-d) of the run for the genotypes given with -g')
+    parser.add_argument('--shard', help='run the shard "i/n" of n nodes sharing the folder (-d): every node writes '
+                                        'its part of every dimension, parts are merged by "merge_shards.py"')
+    parser.add_argument('--metrics', help='write metrics of the run (wall time of stages, durations of tasks, pairs '
+                                          'compared and emitted, the slowest diagonal groups, bytes and memory) '
+                                          'into the JSON file after every dimension')
+    parser.add_argument('--start-method', help='the start method of worker processes, the default of the platform '
+                                               'by default; workers are started once for the whole run',
+                        choices=mp.get_all_start_methods())
     parser.add_argument('-v', '--verbose', help='print detailed information', action='store_true')
     args = parser.parse_args()
+    if args.start_method is not None:
+        mp.set_start_method(args.start_method)
     print('HypercubeME, version 1.0 ================================================')
     print('Arguments passed:', args, '\n')
 
+    if args.max_dim is not None and args.max_dim < 1:
+        print('ERROR: The maximal dimension must be positive')
+        exit(1)
+    if args.max_dim is not None and args.min_dim is not None and args.min_dim > args.max_dim:
+        print('ERROR: The minimal dimension must not exceed the maximal dimension')
+        exit(1)
+    if args.compress is not None and args.format == 'binary':
+        print('ERROR: Compression is supported for the text format only')
+        exit(1)
+    if args.front_coding and args.compress is None:
+        print('ERROR: Front coding is applied to compressed files only, use it with --compress')
+        exit(1)
+    if args.worker_memory is not None:
+        if args.worker_memory < 1:
+            print('ERROR: The memory budget of workers must be positive')
+            exit(1)
+        if args.in_memory or args.memory_limit is not None:
+            print('ERROR: Workers return hypercubes kept in memory to the main process, use --memory-limit '
+                  'instead of --worker-memory with --in-memory')
+            exit(1)
+        worker_memory_limit = args.worker_memory * 1024 * 1024
+    if args.epistasis and args.genotypes is None:
+        print('ERROR: Epistasis is computed from the genotype file given with -g, use epistasis.py for '
+              'hypercubes given with -p')
+        exit(1)
+    try:
+        diagonal_filter = aux.make_diagonal_filter(
+            None if args.positions is None else args.positions.split(','),
+            None if args.mutations is None else args.mutations.split(','))
+    except ValueError:
+        print('ERROR: Positions and mutations must look like "2" and "2A", got "{0}" and "{1}"'.format(
+            args.positions, args.mutations))
+        exit(1)
+
     # Create output folder
     if args.folder.strip() == '':
         print('ERROR: Folder "{0}" contains only whitespaces, give me valid name'.format(args.folder))
         exit(1)
-    if os.path.exists(args.folder):
+
+    if args.update is not None:
+        if (args.genotypes is None or args.format == 'binary' or args.in_memory or args.memory_limit is not None or
+                args.stats or args.maximal or args.epistasis or args.resume or args.min_dim is not None or
+                args.shard is not None or args.all_pairs):
+            print('ERROR: Updates need the genotype file of the run (-g) and support the text format only, '
+                  'without --in-memory, --stats, --maximal, --epistasis, --resume, --min-dim, --shard and '
+                  '--all-pairs')
+            exit(1)
+        if not os.path.isfile(args.folder + '/' + hypercube_file_name(1, False, args.compress)):
+            print('ERROR: Folder "{0}" has no file {1}, give the folder of the finished run and its --compress'.format(
+                args.folder, hypercube_file_name(1, False, args.compress)))
+            exit(1)
+        # Updates keep the dimensions of the run: above them hypercubes of old genotypes would be missing
+        run_max_dim = read_manifest(manifest_file_name(args.folder))['max_dim']
+        if run_max_dim is None:
+            max_dim = args.max_dim if args.max_dim is not None else last_dimension(args.folder, args.compress)
+        elif args.max_dim is not None and args.max_dim != run_max_dim:
+            print('ERROR: The run in the folder "{0}" was made {1}, give the update the same --max-dim or '
+                  'none'.format(args.folder, 'with --max-dim {0}'.format(run_max_dim) if run_max_dim > 0 else
+                                'for all dimensions'))
+            exit(1)
+        elif run_max_dim > 0:
+            max_dim = max(run_max_dim, last_dimension(args.folder, args.compress))
+        else:
+            max_dim = None
+        try:
+            with worker_pool(args.cores):
+                updates = update_hypercubes(args.cores, args.genotypes, args.update, args.folder, max_open_files,
+                                            max_dim, args.compress, args.front_coding, diagonal_filter)
+        except FileNotFoundError as err:
+            print('ERROR: File "{0}" not found. Please, specify the existing file'.format(err.filename))
+            exit(1)
+        except NameError as err:
+            print(str(err))
+            exit(1)
+        record(manifest_file_name(args.folder), 'update', os.path.basename(args.update), sum(
+            count for _, count in updates))
+        stale = [file_name for file_name in sorted(os.listdir(args.folder))
+                 if file_name.startswith(('maximal_', 'epistasis_', 'diagonals_', 'positions_', 'statistics'))]
+        if len(stale) > 0:
+            print('Files {0} are not updated'.format(', '.join(stale)))
+        print()
+        print('Update is finished, {0} new hypercubes'.format(sum(count for _, count in updates)))
+        print('Process time:', time.time() - start_time)
+        exit(0)
+
+    if args.shard is not None:
+        try:
+            shard, shards = parse_shard(args.shard)
+        except ValueError:
+            print('ERROR: The shard must look like "1/4", from 1 to the number of shards, got "{0}"'.format(
+                args.shard))
+            exit(1)
+        if (args.format == 'binary' or args.in_memory or args.memory_limit is not None or args.stats or
+                args.maximal or args.epistasis or args.resume or args.min_dim is not None):
+            print('ERROR: Shards support the text format only, without --in-memory, --stats, --maximal, '
+                  '--epistasis, --resume and --min-dim')
+            exit(1)
+        # Nodes share the folder, whoever starts first creates it
+        os.makedirs(args.folder, exist_ok=True)
+        try:
+            with worker_pool(args.cores):
+                run_shard(args, shard, shards, max_open_files, diagonal_filter)
+        except FileNotFoundError as err:
+            print('ERROR: File "{0}" not found. Please, specify the existing file'.format(err.filename))
+            exit(1)
+        except NameError as err:
+            print(str(err))
+            exit(1)
+        print()
+        print('Shard {0} of {1} is finished, merge shards with "merge_shards.py"'.format(shard, shards))
+        print('Process time:', time.time() - start_time)
+        exit(0)
+    manifest: str = manifest_file_name(args.folder)
+    if args.resume and os.path.isfile(manifest):
+        print('Resume the run in the folder "{0}"'.format(args.folder))
+        record(manifest, 'run', args.format, 0 if args.max_dim is None else args.max_dim)
+    elif os.path.exists(args.folder):
         print('ERROR: Folder/file "{0}" exists, run again with another folder name'.format(args.folder))
         exit(1)
-    try:
-        os.mkdir(args.folder)
-    except:
-        print('ERROR: Unable to create folder {0}'.format(args.folder))
-        exit(1)
-
+    else:
+        try:
+            os.mkdir(args.folder)
+        except:
+            print('ERROR: Unable to create folder {0}'.format(args.folder))
+            exit(1)
+        record(manifest, 'run', args.format, 0 if args.max_dim is None else args.max_dim)
+    state: dict = read_manifest(manifest)
+    if state['finished']:
+        print('The run in the folder "{0}" is already finished'.format(args.folder))
+        exit(0)
+
+    memory_limit = None
+    if args.memory_limit is not None:
+        args.in_memory = True
+        memory_limit = args.memory_limit * 1024 * 1024
+
+    binary: bool = args.format == 'binary'
     dimension: int = 1
-    if args.hypercubes is not None:
+    groups = None       # hypercubes of the previous dimension kept in memory
+    if len(state['merged']) > 0:
+        # Continue after the last complete file with hypercubes
+        dimension = max(state['merged'])
+        last_file_name = args.folder + '/' + hypercube_file_name(dimension, binary, args.compress)
+        if args.in_memory and (memory_limit is None or os.path.getsize(last_file_name) <= memory_limit):
+            groups = read_groups(last_file_name)
+        dimension += 1
+    elif args.hypercubes is not None:
         # Start with hypercubes
         try:
             dimension = get_dimension(args.hypercubes)
@@ -303,61 +1883,215 @@ if __name__ == '__main__':      # Multiprocessing does not work without this lin
             print('ERROR: File "{0}" not found. Please, specify the existing file'.format(args.hypercubes))
             rmtree(args.folder, ignore_errors = True)
             exit(1)
-        copyfile(args.hypercubes, args.folder + '/' + hypercube_file_name(dimension))
+        copy_name = args.folder + '/' + hypercube_file_name(dimension, binary, args.compress)
+        copy_hypercube_file(args.hypercubes, copy_name, binary, args.compress, args.front_coding)
+        if args.stats and (args.min_dim is None or dimension >= args.min_dim):
+            write_statistics(args.folder, dimension, count_hypercube_file(copy_name, args.cores))
+        record(manifest, 'merged', dimension)
+        if args.in_memory and (memory_limit is None or os.path.getsize(args.hypercubes) <= memory_limit):
+            groups = read_groups(args.hypercubes)
         dimension += 1
 
-    # Run iterative process of producing N-dimensional hypercubes from (N-1)-dimensional ones
-    division: list = list()
-    while True:
-        print('Generate hypercubes for dimension {0}'.format(dimension))
-
-        # Find hypercubes and write them in sorted order into files 0.txt, 1.txt, ...
-        input_file_name: str = ''
-        if dimension == 1:
-            input_file_name = args.genotypes
-            try:
-                division = process_dimension_one(args.cores, input_file_name, args.folder)
-            except FileNotFoundError:
-                print('ERROR: File "{0}" not found. Please, specify the existing file'.format(input_file_name))
-                rmtree(args.folder, ignore_errors = True)
-                exit(1)
-            except NameError as err:
-                print(str(err))
-                rmtree(args.folder, ignore_errors = True)
-                exit(1)
-        else:
-            input_file_name = args.folder + '/' + hypercube_file_name(dimension - 1)
-            division = process_dimension(args.cores, input_file_name, args.folder)
-
-        chunks: int = len(division)
-        print('Number of chunks:', chunks)
-        if chunks == 0:
-            break
+    # Measurements of tasks are collected in the metrics of the run, the progress is shown on the terminal
+    run_metrics = mx.RunMetrics(vars(args), sys.stdout.isatty())
+    mx.activate(run_metrics)
+
+    # Workers are started once and serve every dimension of the run
+    with ExitStack() as run_stack:
+        if args.cores > 1:
+            run_stack.enter_context(worker_pool(args.cores))
+
+        # Run iterative process of producing N-dimensional hypercubes from (N-1)-dimensional ones
+        division: list = list()
+        while args.max_dim is None or dimension <= args.max_dim:
+            print('Generate hypercubes for dimension {0}'.format(dimension))
+            run_metrics.start_dimension(dimension)
+            final_file_name: str = args.folder + '/' + hypercube_file_name(dimension, binary, args.compress)
+            # The file is written under temporary name to never leave it incomplete
+            output_file_name: str = final_file_name + '.tmp'
+
+            # Tasks finished before the interruption are not run again
+            if dimension not in state['plans']:
+                state['plans'][dimension] = args.cores * CHUNKS_PER_CORE
+                record(manifest, 'plan', dimension, state['plans'][dimension])
+            done = set(file_name for file_name, size in state['done'].get(dimension, dict()).items()
+                       if size == 0 or (os.path.isfile(args.folder + '/' + file_name) and
+                                        os.path.getsize(args.folder + '/' + file_name) == size))
+            checkpoint: dict = {'manifest': manifest, 'dimension': dimension,
+                                'tasks': state['plans'][dimension], 'done': done}
+
+            # Find hypercubes and either keep them in memory or write them
+            # in sorted order into files 0.txt, 1.txt, ...
+            in_memory: bool = args.in_memory and (dimension == 1 or groups is not None)
+            # The last dimension of statistics is only counted, its hypercubes are never written
+            count_only: bool = args.stats and dimension == args.max_dim
+            counts: dict = None
+            sorted_file_names: list = None
+            input_file_name: str = ''
+            # Maximal hypercubes of the previous dimension are found together with the hypercubes of this one
+            maximal_file_name: str = args.folder + '/' + maximal_hypercube_file_name(dimension - 1, args.compress)
+            maximal: bool = args.maximal and dimension > 1 and not os.path.isfile(maximal_file_name)
+            if dimension == 1:
+                input_file_name = args.genotypes
+                try:
+                    if count_only:
+                        chunks, counts = count_dimension(args.cores, dimension, input_file_name,
+                                                         all_pairs=args.all_pairs, diagonal_filter=diagonal_filter)
+                    elif in_memory:
+                        chunks, groups, sorted_file_names = process_dimension_one_in_memory(
+                            args.cores, aux.read_genotypes(input_file_name), args.folder, args.all_pairs, memory_limit,
+                            diagonal_filter)
+                    else:
+                        division, sorted_file_names = process_dimension_one(args.cores, input_file_name, args.folder,
+                                                                            args.all_pairs, checkpoint, diagonal_filter)
+                        chunks = len(division)
+                except FileNotFoundError:
+                    print('ERROR: File "{0}" not found. Please, specify the existing file'.format(input_file_name))
+                    rmtree(args.folder, ignore_errors = True)
+                    exit(1)
+                except NameError as err:
+                    print(str(err))
+                    rmtree(args.folder, ignore_errors = True)
+                    exit(1)
+            elif count_only:
+                input_file_name = args.folder + '/' + hypercube_file_name(dimension - 1, binary, args.compress)
+                chunks, counts = count_dimension(args.cores, dimension, input_file_name, groups if in_memory else None,
+                                                 diagonal_filter=diagonal_filter)
+            elif in_memory:
+                chunks, groups, sorted_file_names = process_dimension_in_memory(
+                    args.cores, groups, args.folder, memory_limit, diagonal_filter,
+                    maximal_file_name if maximal else None, args.compress, args.front_coding)
+            else:
+                input_file_name = args.folder + '/' + hypercube_file_name(dimension - 1, binary, args.compress)
+                if binary:
+                    division, sorted_file_names = process_dimension_binary(args.cores, input_file_name, args.folder,
+                                                                           checkpoint, diagonal_filter, maximal)
+                else:
+                    division, sorted_file_names = process_dimension(args.cores, input_file_name, args.folder,
+                                                                    checkpoint, diagonal_filter, maximal)
+                chunks = len(division)
+                run_metrics.lap('pairing')
+
+                if maximal:
+                    # Merge maximal hypercubes before the files of chunks are merged and their tasks forgotten
+                    ch.write_header(maximal_file_name + '.tmp', args.compress)
+                    aux.merge_sorted_files(remove_empty_files([maximal_chunk_file_name(sorted_file_name)
+                                                               for sorted_file_name in sorted_file_names]),
+                                           max_open_files, maximal_file_name + '.tmp', None, args.cores,
+                                           args.compress, args.front_coding, run_pool)
+                    os.replace(maximal_file_name + '.tmp', maximal_file_name)
+            run_metrics.lap('maximal' if maximal and not in_memory else 'pairing')
+
+            print('Number of chunks:', chunks)
+            if chunks == 0:
+                break
+
+            if counts is not None:
+                if len(counts) > 0:
+                    write_statistics(args.folder, dimension, counts)
+                break
+
+            if args.verbose and not in_memory:
+                print_division(division)
+
+            if in_memory and groups is not None and args.stats:
+                # Only statistics are needed: hypercubes stay in memory and are not written
+                found = len(groups) > 0
+            elif in_memory and groups is not None:
+                # All hypercubes fit into memory: write them as final output
+                if binary:
+                    bh.write_binary_hypercubes(iter_group_lines(groups), output_file_name, dimension)
+                else:
+                    write_groups(groups, output_file_name, True, args.compress, args.front_coding)
+                found = len(groups) > 0
+                run_metrics.add_bytes(merged=os.path.getsize(output_file_name))
+            else:
+                if in_memory:
+                    print('Memory limit is exceeded, hypercubes are spilled to disk')
+                else:
+                    # Keep file names of non-empty files 0.txt, 1.txt, ... only
+                    sorted_file_names = remove_empty_files(sorted_file_names)
+                run_metrics.add_bytes(written=sum(os.path.getsize(file_name) for file_name in sorted_file_names))
 
-        if args.verbose:
-            print_division(division)
-
-        # Collect file names of all non-empty files 0.txt, 1.txt, ... into the list
-        sorted_file_names: list = list()
-        for chunk in range(chunks):
-            sorted_file_name = args.folder + '/' + str(chunk) + '.txt'
-            if not os.path.isfile(sorted_file_name):
-                continue
-            elif os.stat(sorted_file_name).st_size == 0:
-                os.remove(sorted_file_name)
-                continue
-            sorted_file_names.append(sorted_file_name)
-
-        with open(args.folder + '/' + hypercube_file_name(dimension), 'w') as fh:
-            print('diagonal first_genotype last_genotype', file=fh)
-        found = aux.merge_sorted_files(sorted_file_names, max_open_files, args.folder + '/' +
-                                       hypercube_file_name(dimension))
-
-        if found == False:
-            break
+                if binary:
+                    found = bh.merge_sorted_files(sorted_file_names, max_open_files, output_file_name, dimension,
+                                                  args.cores, run_pool)
+                else:
+                    ch.write_header(output_file_name, args.compress)
+                    found = aux.merge_sorted_files(sorted_file_names, max_open_files, output_file_name,
+                                                   aux.index_file_name(output_file_name), args.cores,
+                                                   args.compress, args.front_coding, run_pool)
+                run_metrics.add_bytes(merged=os.path.getsize(output_file_name))
+            run_metrics.lap('merge')
+
+            if args.stats and found and (args.min_dim is None or dimension >= args.min_dim):
+                if in_memory and groups is not None:
+                    counts = dict((diagonal, len(starts)) for diagonal, (starts, ends) in groups.items())
+                else:
+                    counts = count_hypercube_file(output_file_name, args.cores)
+                write_statistics(args.folder, dimension, counts)
+                run_metrics.lap('statistics')
+
+            if maximal and not found:
+                # The dimension was generated only to find maximal hypercubes of the previous one
+                remove_hypercube_file(output_file_name)
+
+            # Publish the complete file with hypercubes
+            if os.path.isfile(output_file_name):
+                if os.path.isfile(aux.index_file_name(output_file_name)):
+                    os.replace(aux.index_file_name(output_file_name), aux.index_file_name(final_file_name))
+                os.replace(output_file_name, final_file_name)
+                if args.epistasis and found and (args.min_dim is None or dimension >= args.min_dim):
+                    try:
+                        ep.write_epistasis(final_file_name, args.genotypes,
+                                           args.folder + '/' + ep.epistasis_file_name(dimension), args.cores,
+                                           run_pool)
+                    except (NameError, ValueError) as err:
+                        print('ERROR: {0}'.format(str(err).replace('ERROR: ', '')))
+                        exit(1)
+                    run_metrics.lap('epistasis')
+                record(manifest, 'merged', dimension)
+
+            # Hypercubes below the minimal dimension are kept only to generate the next dimension
+            if args.stats or (args.maximal and not args.keep_all) or (args.min_dim is not None and
+                                                                       dimension - 1 < args.min_dim):
+                remove_hypercube_file(args.folder + '/' + hypercube_file_name(dimension - 1, binary, args.compress))
+
+            for line in run_metrics.summary():
+                print(line)
+            if args.metrics is not None:
+                run_metrics.write(args.metrics)
+
+            if found == False:
+                break
+
+            dimension += 1
+            print()
 
-        dimension += 1
+    if args.maximal and args.max_dim is not None and dimension > args.max_dim:
+        # Hypercubes of the maximal dimension are maximal within the cap
+        last_file_name = args.folder + '/' + hypercube_file_name(args.max_dim, binary, args.compress)
+        maximal_file_name = args.folder + '/' + maximal_hypercube_file_name(args.max_dim, args.compress)
+        if os.path.isfile(last_file_name) and not os.path.isfile(maximal_file_name):
+            if binary:
+                bh.binary_to_text(last_file_name, maximal_file_name + '.tmp')
+            else:
+                copyfile(last_file_name, maximal_file_name + '.tmp')
+            os.replace(maximal_file_name + '.tmp', maximal_file_name)
+
+    if args.stats or (args.maximal and not args.keep_all):
+        for lower_dimension in range(1, dimension + 1):
+            remove_hypercube_file(args.folder + '/' + hypercube_file_name(lower_dimension, binary, args.compress))
+    if args.stats:
         print()
+        for line in summarize_statistics(args.folder):
+            print(line.replace('\t', ' '))
+    elif args.min_dim is not None:
+        for lower_dimension in range(1, args.min_dim):
+            remove_hypercube_file(args.folder + '/' + hypercube_file_name(lower_dimension, binary, args.compress))
+    record(manifest, 'finished')
+    if args.metrics is not None:
+        run_metrics.write(args.metrics)
 
     end_time = time.time()
     print()
@@ -1,6 +1,25 @@
 import os
+import sys
 import math
-import operator
+import shutil
+import heapq
+import multiprocessing as mp
+from contextlib import contextmanager
+from array import array
+from multiprocessing import shared_memory
+import compressed_hypercubes as ch
+
+# Size of the buffers of files read and written while merging
+BUFFER_SIZE = 1 << 20
+
+# Estimated memory taken by a line kept in a list besides its characters: the string object and the pointer
+LINE_OVERHEAD = sys.getsizeof('') + 8
+
+# Maximum number of sorted runs merged at once by 'write_sorted_runs', see 'HypercubeME.py'
+MAX_OPEN_FILES = 1021
+
+# Files with hypercubes larger than this size in bytes are merged on several cores
+PARALLEL_MERGE_SIZE = 1 << 26
 
 def check_input(line: str, rownumber: int):
     """Check input rows for valid format"""
@@ -17,6 +36,15 @@ def check_input(line: str, rownumber: int):
         else:
             raise NameError('ERROR: invalid input format at line: {0}'.format(rownumber+2))
             
+def parse_genotype(first: str, rownumber: int) -> tuple:
+    """Return the genotype given by colon-separated mutations 'first' as a tuple,
+       wild-type (empty string or 'wt') being ('0Z',)."""
+    if first == '' or first == 'wt':
+        return ('0Z',)
+    check_input(first, rownumber)
+    return tuple(first.split(':'))
+
+
 def read_genotypes(filename: str) -> list:
     """Read the genotypes from the 'filename' having header."""
     genotypes = list()
@@ -28,14 +56,239 @@ def read_genotypes(filename: str) -> list:
         for ind, line in enumerate(filehandle):
             first = line.split('\t')[0]
             first = first.replace('\n', '')
-            if first == '' or first == 'wt':
-                genotypes.append(('0Z',))
-            else:
-                check_input(first, ind)
-                genotypes.append(tuple(first.split(':')))
+            genotypes.append(parse_genotype(first, ind))
     return genotypes
 
 
+def read_fitness(filename: str) -> tuple:
+    """
+    Read the genotypes from the 'filename' having header together
+    with the values of the 'fitness' and 'error' columns.
+
+    Returns
+    -------
+        genotypes : list
+            The list of genotypes as returned by 'read_genotypes'.
+        fitness : list
+            The list of fitness values of genotypes.
+        errors : list
+            The list of errors of fitness values, zeros if the file has no 'error' column.
+    """
+    genotypes = list()
+    fitness = list()
+    errors = list()
+
+    with open(filename, 'r') as filehandle:
+        header = filehandle.readline().rstrip('\n').split('\t')
+        if 'fitness' not in header:
+            raise NameError('ERROR: no "fitness" column in the file {0}'.format(filename))
+        fitness_column = header.index('fitness')
+        error_column = header.index('error') if 'error' in header else None
+
+        for ind, line in enumerate(filehandle):
+            columns = line.rstrip('\n').split('\t')
+            genotypes.append(parse_genotype(columns[0], ind))
+            try:
+                fitness.append(float(columns[fitness_column]))
+                errors.append(0.0 if error_column is None else float(columns[error_column]))
+            except (ValueError, IndexError):
+                raise NameError('ERROR: invalid fitness or error at line: {0}'.format(ind + 2))
+    return genotypes, fitness, errors
+
+
+def intern_genotypes(genotypes: list) -> tuple:
+    """Encode 'genotypes' as tuples of integer ids of their mutations.
+
+    Every distinct mutation (example: '0C') is stored once in the list
+    'mutations' and genotypes refer to it by its index, so hot loops hash and
+    compare small integers instead of strings. The order of mutations within
+    a genotype is kept to write it back exactly as it was read. Wild-type
+    ('0Z') is encoded as the empty tuple.
+
+    Returns
+    -------
+        mutations : list
+            The list of mutations, index in the list is the id of mutation.
+        encoded : list
+            The list of genotypes as tuples of mutation ids.
+    """
+    mutations = list()
+    ids = dict()
+    encoded = list()
+    for genotype in genotypes:
+        if len(genotype) == 1 and genotype[0] == '0Z':
+            encoded.append(())
+            continue
+        genotype_ids = list()
+        for mutation in genotype:
+            mutation_id = ids.get(mutation)
+            if mutation_id is None:
+                mutation_id = ids[mutation] = len(mutations)
+                mutations.append(mutation)
+            genotype_ids.append(mutation_id)
+        encoded.append(tuple(genotype_ids))
+    return mutations, encoded
+
+
+def share_genotypes(genotypes: list) -> shared_memory.SharedMemory:
+    """Pack encoded 'genotypes' into a block of shared memory.
+
+    The block is a flat array of 32-bit integers: the number of genotypes N,
+    N + 1 offsets and the concatenated mutation ids of all genotypes. It is
+    created once by the parent process and opened read-only by the workers
+    with 'GenotypeTable', so the genotypes are neither pickled nor copied
+    per task. The caller must 'close' and 'unlink' the returned block.
+    """
+    offsets = array('i', [0])
+    ids = array('i')
+    for genotype in genotypes:
+        ids.extend(genotype)
+        offsets.append(len(ids))
+    data = array('i', [len(genotypes)]).tobytes() + offsets.tobytes() + ids.tobytes()
+
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    return block
+
+
+class GenotypeTable:
+    """Read-only sequence of encoded genotypes stored by 'share_genotypes'
+       in the shared memory block 'name'."""
+
+    def __init__(self, name: str):
+        # Workers share the resource tracker of the parent process,
+        # which unlinks the block when the dimension is processed
+        self.block = shared_memory.SharedMemory(name=name)
+        ints = self.block.buf.cast('i')
+        num_genotypes = ints[0]
+        self.offsets = ints[1:num_genotypes + 2]
+        self.ids = ints[num_genotypes + 2:]
+
+    def close(self):
+        """Release the views of the block and close it in this process."""
+        self.offsets.release()
+        self.ids.release()
+        self.block.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> tuple:
+        return tuple(self.ids[self.offsets[index]:self.offsets[index + 1]])
+
+
+def split_mutations(mutations: list) -> tuple:
+    """Return lists of positions (as int) and variants of 'mutations'."""
+    positions = [int(mutation[:-1]) for mutation in mutations]
+    variants = [mutation[-1] for mutation in mutations]
+    return positions, variants
+
+
+def decode_genotype(genotype: tuple, mutations: list) -> str:
+    """Return the genotype encoded by 'intern_genotypes' as a string."""
+    if len(genotype) == 0:
+        return '0Z'
+    return ':'.join([mutations[mutation] for mutation in genotype])
+
+
+def index_single_mutants(genotypes: list, positions: list, variants: list) -> list:
+    """Group encoded 'genotypes' into buckets of genotypes differing at exactly one position.
+
+    Every genotype is hashed under the keys obtained by masking out each of
+    its mutated positions. Genotypes sharing a key, together with the genotype
+    equal to the key itself (wild-type at the masked position), pairwise differ
+    at the masked position only. So all pairs at distance 1 are found in
+    O(N*L) time plus the size of the output instead of O(N^2) comparisons.
+
+    Returns
+    -------
+        buckets : list
+            The list of tuples (position, members), where 'members' is the list
+            of tuples (variant, index of genotype) ordered so that for every
+            i < j the pair (members[i], members[j]) is in 'forward' direction,
+            wild-type variant being denoted as 'Z'.
+    """
+    index = dict()
+    buckets = dict()
+    for ind, genotype in enumerate(genotypes):
+        mutations = frozenset(genotype)
+        index[mutations] = ind
+        for mutation in genotype:
+            key = (positions[mutation], mutations.difference((mutation,)))
+            # Mutated variant goes before wild-type 'Z' in case of equal letters
+            buckets.setdefault(key, list()).append((variants[mutation], 0, ind))
+
+    result = list()
+    for (position, rest), members in buckets.items():
+        if rest in index:
+            members.append(('Z', 1, index[rest]))
+        if len(members) > 1:
+            members.sort()
+            result.append((str(position), [(letter, ind) for letter, _, ind in members]))
+    return result
+
+
+def make_diagonal_filter(positions: list = None, mutations: list = None) -> tuple:
+    """
+    Return the filter of diagonals of hypercubes, None if nothing is filtered.
+
+    Parameters
+    ----------
+        positions : list
+            Positions the diagonal may change, all positions if None.
+        mutations : list
+            Mutations ('1A', '12C') the diagonal may consist of, all
+            mutations if None. The diagonal mutation 'A1C' consists of
+            the mutations '1A' and '1C', the mutation 'A1Z' of '1A' only.
+
+    Returns
+    -------
+        diagonal_filter : tuple
+            The tuple (positions, mutations) of frozensets of strings or None.
+    """
+    if positions is None and mutations is None:
+        return None
+    if positions is not None:
+        positions = frozenset(str(int(position)) for position in positions)
+    if mutations is not None:
+        mutations = frozenset(str(int(mutation[:-1])) + mutation[-1] for mutation in mutations)
+    return positions, mutations
+
+
+def mutation_allowed(delta: str, diagonal_filter: tuple) -> bool:
+    """Return True if the mutation 'delta' of the diagonal (example: 'A1Z') passes 'diagonal_filter'."""
+    positions, mutations = diagonal_filter
+    position = delta[1:-1]
+    if positions is not None and position not in positions:
+        return False
+    if mutations is not None:
+        for letter in (delta[0], delta[-1]):
+            if letter != 'Z' and position + letter not in mutations:
+                return False
+    return True
+
+
+def diagonal_allowed(diagonal: str, diagonal_filter: tuple) -> bool:
+    """Return True if all mutations of the 'diagonal' pass 'diagonal_filter'."""
+    return all(mutation_allowed(delta, diagonal_filter) for delta in diagonal.split(':'))
+
+
+def filter_buckets(buckets: list, diagonal_filter: tuple) -> list:
+    """Remove from 'buckets' of 'index_single_mutants' the positions and variants
+       not passing 'diagonal_filter', so every pair of the remaining members
+       differs by an allowed mutation. Buckets of less than two members are dropped."""
+    positions, mutations = diagonal_filter
+    result = list()
+    for position, members in buckets:
+        if positions is not None and position not in positions:
+            continue
+        if mutations is not None:
+            members = [(letter, ind) for letter, ind in members if letter == 'Z' or position + letter in mutations]
+        if len(members) > 1:
+            result.append((position, members))
+    return result
+
+
 def get_delta(genotype1: str, genotype2: str) -> str:
     """Return difference between 'genotype1' and 'genotype2' as
        alphabetically ordered list of mutations."""
@@ -49,45 +302,59 @@ def get_delta(genotype1: str, genotype2: str) -> str:
     if len(s2) == 1 and '0Z' in s2:
         s2 = set()
 
-    dpos_letters = dict((u[:-1], u[-1]) for u in s1.difference(s2))
-    Dpos_letters = dict((u[:-1], u[-1]) for u in s2.difference(s1))
-    positions = sorted(int(u) for u in set(list(dpos_letters.keys()) +
-                                           list(Dpos_letters.keys())))
+    dpos_letters = dict((int(u[:-1]), u[-1]) for u in s1.difference(s2))
+    Dpos_letters = dict((int(u[:-1]), u[-1]) for u in s2.difference(s1))
+    return delta_of_variants(dpos_letters, Dpos_letters)
+
+
+def get_encoded_delta(genotype1: tuple, genotype2: tuple, positions: list, variants: list) -> tuple:
+    """Same as 'get_delta' for genotypes encoded by 'intern_genotypes'."""
+    s1 = set(genotype1)
+    s2 = set(genotype2)
+    dpos_letters = dict((positions[u], variants[u]) for u in s1.difference(s2))
+    Dpos_letters = dict((positions[u], variants[u]) for u in s2.difference(s1))
+    return delta_of_variants(dpos_letters, Dpos_letters)
+
+
+def delta_of_variants(dpos_letters: dict, Dpos_letters: dict) -> tuple:
+    """Return direction and alphabetically ordered list of mutations given
+       variants of the first ('dpos_letters') and the second ('Dpos_letters')
+       genotype at positions where they differ."""
+    positions = sorted(set(list(dpos_letters.keys()) + list(Dpos_letters.keys())))
     reverse = False
 
     # Processing first position, which defines 'reverse' or 'forward'
-    pos = str(positions[0])
+    pos = positions[0]
     if pos in dpos_letters and pos in Dpos_letters:
         if dpos_letters[pos] < Dpos_letters[pos]:
-            change = dpos_letters[pos] + pos + Dpos_letters[pos]
+            change = dpos_letters[pos] + str(pos) + Dpos_letters[pos]
         else:
-            change = Dpos_letters[pos] + pos + dpos_letters[pos]
+            change = Dpos_letters[pos] + str(pos) + dpos_letters[pos]
             reverse = True
     elif pos in dpos_letters:
-        change = dpos_letters[pos] + pos + 'Z'
+        change = dpos_letters[pos] + str(pos) + 'Z'
     else:
-        change = Dpos_letters[pos] + pos + 'Z'
+        change = Dpos_letters[pos] + str(pos) + 'Z'
         reverse = True
     delta = [change]
 
     # Now adding all other mutations
     for pos in positions[1:]:
-        pos = str(pos)
         if pos in dpos_letters and pos in Dpos_letters:
             if not (reverse):
-                change = dpos_letters[pos] + pos + Dpos_letters[pos]
+                change = dpos_letters[pos] + str(pos) + Dpos_letters[pos]
             else:
-                change = Dpos_letters[pos] + pos + dpos_letters[pos]
+                change = Dpos_letters[pos] + str(pos) + dpos_letters[pos]
         elif pos in dpos_letters:
             if not (reverse):
-                change = dpos_letters[pos] + pos + 'Z'
+                change = dpos_letters[pos] + str(pos) + 'Z'
             else:
-                change = 'Z' + pos + dpos_letters[pos]
+                change = 'Z' + str(pos) + dpos_letters[pos]
         else:
             if reverse:
-                change = Dpos_letters[pos] + pos + 'Z'
+                change = Dpos_letters[pos] + str(pos) + 'Z'
             else:
-                change = 'Z' + pos + Dpos_letters[pos]
+                change = 'Z' + str(pos) + Dpos_letters[pos]
 
         delta.append(change)
 
@@ -101,24 +368,10 @@ def mergeiter(*iterables, **kwargs):
     """Given a set of sorted iterables, yield the next value in merged order
 
     Takes an optional `key` callable to compare values by.
-    Taken from https://stackoverflow.com/questions/14465154/sorting-text-file-by-using-python?noredirect=1&lq=1
+    The smallest values of the iterables are kept in a heap, so every
+    value costs O(log k) comparisons for k iterables.
     """
-    iterables = [iter(it) for it in iterables]
-    iterables = {i: [next(it), i, it] for i, it in enumerate(iterables)}
-    if 'key' not in kwargs:
-        key = operator.itemgetter(0)
-    else:
-        key = lambda item, key=kwargs['key']: key(item[0])
-
-    while True:
-        value, i, it = min(iterables.values(), key=key)
-        yield value
-        try:
-            iterables[i][0] = next(it)
-        except StopIteration:
-            del iterables[i]
-            if not iterables:
-                return
+    return heapq.merge(*iterables, key=kwargs.get('key'))
 
 
 def sort_file(input_file_name: str, output_file_name: str):
@@ -133,48 +386,348 @@ def sort_file(input_file_name: str, output_file_name: str):
             fh.write(line)
 
 
-def merge_sorted_files(sorted_file_names: list, max_open_files: int, output_file_name: str) -> bool:
-    """Merge files from 'sorted_file_names' and writes the
-       content into 'output_file_name'."""
-    if len(sorted_file_names) > max_open_files:
+def split_into_ranges(file_name: str, parts: int) -> list:
+    """Return 'parts' + 1 bounds of byte ranges of equal size splitting
+       the lines of 'file_name' following its header."""
+    with open(file_name, 'rb') as fh:
+        # Skip header
+        fh.readline()
+        first = fh.tell()
+    size = os.path.getsize(file_name) - first
+    return [first + round(i * size / parts) for i in range(parts + 1)]
+
+
+def read_lines_in_range(file_name: str, start: int, end: int):
+    """Yield lines (as bytes) of 'file_name' starting in the byte range from 'start' to 'end'."""
+    with open(file_name, 'rb', buffering=BUFFER_SIZE) as fh:
+        position = start
+        if start > 0:
+            # Move to the beginning of the first line starting in the range
+            fh.seek(start - 1)
+            position += len(fh.readline()) - 1
+        while position < end:
+            line = fh.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def append_files(input_file_names: list, output_file_name: str):
+    """Append files 'input_file_names' to 'output_file_name' in the given order and remove them."""
+    with open(output_file_name, 'ab') as out_fh:
+        for input_file_name in input_file_names:
+            with open(input_file_name, 'rb') as fh:
+                shutil.copyfileobj(fh, out_fh, BUFFER_SIZE)
+            os.remove(input_file_name)
+
+
+def write_lines(lines, output_file_name: str):
+    """Write 'lines' into 'output_file_name'. The file is written under
+       a temporary name and renamed, so it never exists partially."""
+    with open(output_file_name + '.tmp', 'w') as fh:
+        for line in lines:
+            print(line, file=fh)
+    os.replace(output_file_name + '.tmp', output_file_name)
+
+
+def write_sorted_lines(lines: list, output_file_name: str):
+    """Write 'lines' in sorted order into 'output_file_name' as 'write_lines' does."""
+    write_lines(sorted(lines), output_file_name)
+
+
+def write_sorted_runs(lines, output_file_name: str, memory_limit: int = None) -> int:
+    """
+    Write 'lines' in sorted order into 'output_file_name' as 'write_sorted_lines'
+    does, keeping about 'memory_limit' bytes of lines in memory at most.
+
+    Once the estimated memory taken by the lines collected from the iterable
+    'lines' exceeds 'memory_limit', they are sorted and spilled into the run
+    file 'output_file_name.runN'; the runs are merged by 'merge_sorted_files'
+    at the end. Without 'memory_limit' all lines are sorted in memory.
+
+    Returns the number of spilled runs.
+    """
+    if memory_limit is None:
+        write_sorted_lines(list(lines), output_file_name)
+        return 0
+
+    run_file_names: list = list()
+    batch: list = list()
+    size = 0
+    for line in lines:
+        batch.append(line)
+        size += len(line) + LINE_OVERHEAD
+        if size > memory_limit:
+            run_file_names.append(output_file_name + '.run' + str(len(run_file_names)))
+            write_sorted_lines(batch, run_file_names[-1])
+            batch = list()
+            size = 0
+    if len(run_file_names) == 0:
+        write_sorted_lines(batch, output_file_name)
+        return 0
+
+    if len(batch) > 0:
+        run_file_names.append(output_file_name + '.run' + str(len(run_file_names)))
+        write_sorted_lines(batch, run_file_names[-1])
+    open(output_file_name + '.tmp', 'w').close()
+    merge_sorted_files(run_file_names, MAX_OPEN_FILES, output_file_name + '.tmp')
+    os.replace(output_file_name + '.tmp', output_file_name)
+    return len(run_file_names)
+
+
+def index_file_name(hypercube_file_name: str) -> str:
+    """Return the name of the index file of diagonal groups of 'hypercube_file_name'."""
+    return hypercube_file_name + '.idx'
+
+
+def read_index(index_file_name: str) -> list:
+    """Read the index of diagonal groups written by 'write_indexed_lines'
+       and return list of tuples (diagonal, byte offset, number of lines)."""
+    index = list()
+    with open(index_file_name, 'r') as fh:
+        # Skip header
+        fh.readline()
+        for line in fh:
+            diagonal, offset, count = line.rstrip('\n').split('\t')
+            index.append((diagonal, int(offset), int(count)))
+    return index
+
+
+def write_indexed_lines(lines, fh, offset: int, index_file_name: str):
+    """
+    Write sorted 'lines' with hypercubes into 'fh' positioned at byte
+    'offset' and write the index of diagonal groups, that is, tuples
+    (diagonal, byte offset, number of lines), into 'index_file_name'.
+
+    Lines are expected to be ASCII, so their length is their size in bytes.
+    """
+    with open(index_file_name, 'w') as index_fh:
+        print('diagonal\toffset\tlines', file=index_fh)
+        diagonal = None
+        group_offset = offset
+        count = 0
+        for line in lines:
+            line_diagonal = line[:line.find('\t')]
+            if line_diagonal != diagonal:
+                if count > 0:
+                    print(diagonal, group_offset, count, sep='\t', file=index_fh)
+                diagonal = line_diagonal
+                group_offset = offset
+                count = 0
+            fh.write(line)
+            offset += len(line)
+            count += 1
+        if count > 0:
+            print(diagonal, group_offset, count, sep='\t', file=index_fh)
+
+
+def merge_files(input_file_names: list, output_file_name: str, index_file_name: str = None,
+                compression: str = None, front_coding: bool = False):
+    """Merge sorted files 'input_file_names', append the content to
+       'output_file_name' and remove the input files. If 'index_file_name'
+       is given, the index of diagonal groups is written there. With
+       'compression', the content is appended in compressed blocks
+       (see compressed_hypercubes.py), front-coded with 'front_coding'."""
+    filehandles = [open(input_file_name, 'r', buffering=BUFFER_SIZE) for input_file_name in input_file_names]
+    if compression is not None:
+        with ch.BlockWriter(output_file_name, compression, front_coding, index_file_name) as fh:
+            fh.writelines(mergeiter(*filehandles))
+    else:
+        with open(output_file_name, 'a', buffering=BUFFER_SIZE) as fh:
+            if index_file_name is None:
+                fh.writelines(mergeiter(*filehandles))
+            else:
+                write_indexed_lines(mergeiter(*filehandles), fh, os.path.getsize(output_file_name), index_file_name)
+
+    for fh in filehandles:
+        fh.close()
+    for input_file_name in input_file_names:
+        os.remove(input_file_name)
+
+
+@contextmanager
+def optional_pool(pool, processes: int):
+    """Yield 'pool' if given, otherwise a new pool of 'processes' workers terminated at the end of the block."""
+    if pool is not None:
+        yield pool
+        return
+    with mp.Pool(processes=processes) as new_pool:
+        yield new_pool
+
+
+def premerge_sorted_files(sorted_file_names: list, max_open_files: int, cores: int = 1, pool=None) -> list:
+    """Merge parts of 'sorted_file_names' on 'cores' cores (of the existing
+       'pool' if given) until at most 'max_open_files' files are left and
+       return their names."""
+    while len(sorted_file_names) > max_open_files:
         num_parts = math.ceil(len(sorted_file_names) / max_open_files)
         num_files_in_part = math.ceil(len(sorted_file_names) / num_parts)
-        found = False
-        sorted_file_names_new: list = list()
+        args = list()
         for i in range(num_parts):
-            start_index = num_files_in_part * i
-            end_index = num_files_in_part * (i + 1)
-            output_file_name_new = sorted_file_names[i] + "." + str(i)
-            f = merge_sorted_files(sorted_file_names[start_index:end_index],
-                                   max_open_files, output_file_name_new)
-            if not found:
-                found = f
-            sorted_file_names_new.append(output_file_name_new)
-        if not found:
-            return False
+            part = sorted_file_names[num_files_in_part * i:num_files_in_part * (i + 1)]
+            args.append((part, part[0] + '.' + str(i)))
+            open(args[-1][1], 'w').close()
+
+        if cores > 1:
+            with optional_pool(pool, min(cores, num_parts)) as merge_pool:
+                merge_pool.starmap(merge_files, args)
         else:
-            return merge_sorted_files(sorted_file_names_new, max_open_files,
-                                      output_file_name)
-    else:
-        # Open *.sorted files into filehandle list to enable merging
-        filehandles: list = list()
-        for sorted_file_name in sorted_file_names:
-            fh = open(sorted_file_name, 'r')
-            filehandles.append(fh)
+            for part, output_file_name in args:
+                merge_files(part, output_file_name)
+        sorted_file_names = [output_file_name for part, output_file_name in args]
+    return sorted_file_names
+
+
+def find_line(fh, key: bytes, size: int, start: int = 0) -> int:
+    """Return the byte offset of the first line not less than 'key'
+       in the sorted file 'fh' of 'size' bytes opened in binary mode.
+       Lines before the byte 'start' (for example, the header) are skipped."""
+    def line_at(position: int) -> tuple:
+        # The first line starting at 'position' or later
+        if position > 0:
+            fh.seek(position - 1)
+            position += len(fh.readline()) - 1
+        else:
+            fh.seek(0)
+        return position, fh.readline()
 
-        # Return False if no hypercubes are produced
-        if len(filehandles) == 0:
-            return False
+    low, high = start, size
+    while low < high:
+        middle = (low + high) // 2
+        position, line = line_at(middle)
+        if position >= size or line >= key:
+            high = middle
+        else:
+            low = middle + 1
+    return line_at(low)[0] if low < size else size
 
-        # Merge sorted hypercubes into file output_file_name
-        with open(output_file_name, 'a') as fh:
-            for line in mergeiter(*filehandles):
-                print(line, end='', file=fh)
 
-        for fh in filehandles:
-            fh.close()
+def split_sorted_files(sorted_file_names: list, parts: int) -> list:
+    """
+    Split the sorted files with hypercubes into 'parts' ranges of diagonals.
 
-        for sorted_file_name in sorted_file_names:
-            os.remove(sorted_file_name)
+    Splitting diagonals are chosen from the lines sampled evenly from the
+    files, so the parts have comparable size, and the whole diagonal group
+    always belongs to one part.
 
+    Returns
+    -------
+        ranges : list
+            For every part the list of tuples (file name, start, end)
+            with byte ranges of the files belonging to the part.
+    """
+    sizes = [os.path.getsize(sorted_file_name) for sorted_file_name in sorted_file_names]
+    total_samples = 32 * parts
+    samples: list = list()
+    for sorted_file_name, size in zip(sorted_file_names, sizes):
+        num_samples = max(1, round(total_samples * size / max(sum(sizes), 1)))
+        with open(sorted_file_name, 'rb') as fh:
+            for i in range(num_samples):
+                fh.seek(size * i // num_samples)
+                if i > 0:
+                    fh.readline()
+                line = fh.readline()
+                if line:
+                    samples.append(line[:line.find(b'\t')])
+    samples.sort()
+    splitters = sorted(set(samples[len(samples) * i // parts] for i in range(1, parts)))
+
+    ranges: list = [list() for _ in range(len(splitters) + 1)]
+    for sorted_file_name, size in zip(sorted_file_names, sizes):
+        with open(sorted_file_name, 'rb') as fh:
+            bounds = [0] + [find_line(fh, splitter, size) for splitter in splitters] + [size]
+        for part in range(len(ranges)):
+            if bounds[part] < bounds[part + 1]:
+                ranges[part].append((sorted_file_name, bounds[part], bounds[part + 1]))
+    return ranges
+
+
+def read_range(file_name: str, start: int, end: int):
+    """Yield lines of 'file_name' from byte 'start' to byte 'end'."""
+    with open(file_name, 'r', buffering=BUFFER_SIZE) as fh:
+        fh.seek(start)
+        position = start
+        while position < end:
+            line = fh.readline()
+            if not line:
+                return
+            position += len(line)
+            yield line
+
+
+def merge_ranges(ranges: list, output_file_name: str, index_file_name: str = None,
+                 compression: str = None, front_coding: bool = False):
+    """Merge byte 'ranges' (tuples (file name, start, end)) of sorted files
+       into the new file 'output_file_name', writing the index of diagonal
+       groups into 'index_file_name' if given. See 'merge_files' for
+       'compression' and 'front_coding'."""
+    lines = mergeiter(*[read_range(*file_range) for file_range in ranges])
+    if compression is not None:
+        with ch.BlockWriter(output_file_name, compression, front_coding, index_file_name) as fh:
+            fh.writelines(lines)
+        return
+    with open(output_file_name, 'w', buffering=BUFFER_SIZE) as fh:
+        if index_file_name is None:
+            fh.writelines(lines)
+        else:
+            write_indexed_lines(lines, fh, 0, index_file_name)
+
+
+def merge_sorted_files(sorted_file_names: list, max_open_files: int, output_file_name: str,
+                       index_file_name: str = None, cores: int = 1, compression: str = None,
+                       front_coding: bool = False, pool=None) -> bool:
+    """Merge files from 'sorted_file_names' and writes the
+       content into 'output_file_name'. If 'index_file_name' is given,
+       the index of diagonal groups is written there while merging.
+       With 'compression', the content is written in compressed blocks,
+       front-coded with 'front_coding' (see compressed_hypercubes.py).
+
+    Files are merged through a heap with large buffers. Parts of more than
+    'max_open_files' files are merged independently on 'cores' cores. Large
+    files are split into ranges of diagonals merged on 'cores' cores and
+    the merged ranges are concatenated. Parts and ranges are merged by the
+    workers of 'pool' if given, otherwise by a new pool."""
+    # Return False if no hypercubes are produced
+    if len(sorted_file_names) == 0:
+        return False
+
+    sorted_file_names = premerge_sorted_files(sorted_file_names, max_open_files, cores, pool)
+    total_size = sum(os.path.getsize(sorted_file_name) for sorted_file_name in sorted_file_names)
+    if cores == 1 or total_size < PARALLEL_MERGE_SIZE:
+        merge_files(sorted_file_names, output_file_name, index_file_name, compression, front_coding)
         return True
+
+    ranges = split_sorted_files(sorted_file_names, cores)
+    args = list()
+    for part in range(len(ranges)):
+        part_file_name = output_file_name + '.' + str(part)
+        args.append((ranges[part], part_file_name, None if index_file_name is None else part_file_name + '.idx',
+                     compression, front_coding))
+    with optional_pool(pool, min(cores, len(args))) as merge_pool:
+        merge_pool.starmap(merge_ranges, args)
+
+    # Concatenate the merged parts shifting offsets in their indices,
+    # compressed blocks of the parts stay independent
+    shift = 0 if compression is None else ch.VIRTUAL_SHIFT
+    offset = os.path.getsize(output_file_name)
+    index_fh = None
+    if index_file_name is not None:
+        index_fh = open(index_file_name, 'w')
+        print('diagonal\toffset\tlines', file=index_fh)
+    with open(output_file_name, 'ab') as fh:
+        for _, part_file_name, part_index_file_name, _, _ in args:
+            if part_index_file_name is not None:
+                for diagonal, position, count in read_index(part_index_file_name):
+                    print(diagonal, position + (offset << shift), count, sep='\t', file=index_fh)
+                os.remove(part_index_file_name)
+            with open(part_file_name, 'rb') as part_fh:
+                shutil.copyfileobj(part_fh, fh, BUFFER_SIZE)
+            offset += os.path.getsize(part_file_name)
+            os.remove(part_file_name)
+    if index_fh is not None:
+        index_fh.close()
+
+    for sorted_file_name in sorted_file_names:
+        os.remove(sorted_file_name)
+    return True
@@ -0,0 +1,362 @@
+"""
+Benchmark of HypercubeME on synthetic genotype landscapes.
+
+Landscapes are given by specifications 'kind:parameters':
+
+    complete:L:A      all (A + 1)^L genotypes of L sites with A variants besides wild-type
+    sparse:L:A:N      N random genotypes of the complete landscape 'complete:L:A'
+    dms:L:A:N         library of deep mutational scanning: wild-type, all L * A single
+                      mutants and multiple mutants up to N genotypes, whose positions
+                      are drawn with skewed coverage (the weight of the position of
+                      rank r is 1 / r^DMS_SKEW) and whose order k >= 2 is drawn with
+                      the weight 1 / 2^k
+
+Every landscape is processed dimension by dimension as 'HypercubeME.py' does
+with every given number of cores, each run in its own process, and stages are
+timed separately:
+
+    dimension_one   one-dimensional hypercubes found from genotypes
+    division        division of the file of the previous dimension into tasks
+    pairing         pairing of parallel hypercubes into the next dimension
+    merge           merge of the sorted files of the tasks
+    expand          expansion of hypercubes by 'expand_hypercubes.py'
+
+together with the peak memory (resident set size) of the main process and
+of the largest worker. Results are written as JSON, two files of results
+(for example, of two versions) are compared with '--compare'.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing as mp
+from itertools import product
+import auxiliary as aux
+import compressed_hypercubes as ch
+import expand_hypercubes as eh
+import HypercubeME as hm
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+VARIANTS = 'GAVLIMFWPSTCYNQDEKRH'
+
+# Exponent of the skewed coverage of positions of 'dms' landscapes
+DMS_SKEW = 1.0
+
+# Maximum number of open files, see 'HypercubeME.py'
+MAX_OPEN_FILES = 1021
+
+SUITES = {'small': ['complete:6:2', 'sparse:10:3:2000', 'dms:30:19:3000'],
+          'medium': ['complete:8:2', 'sparse:14:3:20000', 'dms:100:19:30000'],
+          'large': ['complete:10:2', 'sparse:20:3:100000', 'dms:300:19:100000']}
+
+
+def parse_landscape(spec: str) -> tuple:
+    """Return the kind and the integer parameters of the landscape specification 'spec'."""
+    kind, *parameters = spec.split(':')
+    sizes = {'complete': 2, 'sparse': 3, 'dms': 3}
+    if kind not in sizes or len(parameters) != sizes[kind] or not all(p.isdigit() for p in parameters):
+        raise ValueError('Invalid landscape "{0}", expected complete:L:A, sparse:L:A:N or dms:L:A:N'.format(spec))
+    parameters = [int(parameter) for parameter in parameters]
+    if not 1 <= parameters[1] <= len(VARIANTS):
+        raise ValueError('The number of variants of the landscape "{0}" must be from 1 to {1}'.format(
+            spec, len(VARIANTS)))
+    return kind, parameters
+
+
+def complete_landscape(sites: int, variants: int) -> list:
+    """Return all genotypes of 'sites' sites with 'variants' variants besides wild-type."""
+    return [tuple(str(site) + variant for site, variant in enumerate(genotype) if variant is not None)
+            for genotype in product([None] + list(VARIANTS[:variants]), repeat=sites)]
+
+
+def sparse_landscape(sites: int, variants: int, size: int, rng: random.Random) -> list:
+    """Return 'size' distinct genotypes drawn uniformly from the complete landscape."""
+    if size > (variants + 1) ** sites:
+        raise ValueError('The complete landscape has less than {0} genotypes'.format(size))
+    choices = [None] + list(VARIANTS[:variants])
+    genotypes = set()
+    while len(genotypes) < size:
+        genotypes.add(tuple(str(site) + variant for site, variant in
+                            enumerate(rng.choice(choices) for _ in range(sites)) if variant is not None))
+    return sorted(genotypes)
+
+
+def dms_landscape(sites: int, variants: int, size: int, rng: random.Random) -> list:
+    """Return the library of deep mutational scanning of 'size' genotypes, see the module description."""
+    genotypes = set([()] + [(str(site) + variant,) for site in range(sites) for variant in VARIANTS[:variants]])
+    if size > (variants + 1) ** sites:
+        raise ValueError('The complete landscape has less than {0} genotypes'.format(size))
+    if size < len(genotypes):
+        raise ValueError('The library needs at least {0} genotypes for wild-type and single mutants'.format(
+            len(genotypes)))
+    ranks = list(range(1, sites + 1))
+    rng.shuffle(ranks)
+    weights = [1 / rank ** DMS_SKEW for rank in ranks]
+    orders = list(range(2, sites + 1))
+    order_weights = [1 / 2 ** order for order in orders]
+    while len(genotypes) < size:
+        order = rng.choices(orders, order_weights)[0]
+        positions = set()
+        while len(positions) < order:
+            positions.add(rng.choices(range(sites), weights)[0])
+        genotypes.add(tuple(str(site) + rng.choice(VARIANTS[:variants]) for site in sorted(positions)))
+    return sorted(genotypes)
+
+
+def generate_landscape(spec: str, seed: int = 0) -> list:
+    """Return genotypes (tuples of mutations) of the landscape specification 'spec'."""
+    kind, parameters = parse_landscape(spec)
+    rng = random.Random(seed)
+    if kind == 'complete':
+        return complete_landscape(*parameters)
+    elif kind == 'sparse':
+        return sparse_landscape(*parameters, rng)
+    return dms_landscape(*parameters, rng)
+
+
+def write_landscape(genotypes: list, output_file_name: str, seed: int = 0):
+    """Write 'genotypes' with random fitness into the genotype file 'output_file_name'."""
+    rng = random.Random(seed)
+    with open(output_file_name, 'w') as fh:
+        print('mut_list\tfitness\terror', file=fh)
+        for genotype in genotypes:
+            print(':'.join(genotype), rng.random(), rng.random() / 10, sep='\t', file=fh)
+
+
+def peak_memory() -> dict:
+    """Return the peak resident set size in megabytes of this process and
+       of its largest finished child process, None without 'resource'."""
+    if resource is None:
+        return {'main': None, 'workers': None}
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return {'main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20,
+            'workers': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2 ** 20}
+
+
+def run_landscape(genotype_file_name: str, cores: int, max_dim: int = None, expand: bool = True) -> dict:
+    """
+    Find hypercubes of the genotype file 'genotype_file_name' up to 'max_dim'
+    on 'cores' cores as 'HypercubeME.py' does in a temporary folder, timing
+    every stage.
+
+    Returns
+    -------
+        result : dict
+            The dictionary with the keys 'stages' (list of dictionaries with
+            the keys 'stage', 'dimension' and 'seconds'), 'hypercubes'
+            ({dimension: number of hypercubes}), 'seconds' and 'peak_memory_mb'.
+    """
+    stages: list = list()
+    hypercubes: dict = dict()
+
+    def timed(stage: str, dimension: int, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        stages.append({'stage': stage, 'dimension': dimension, 'seconds': time.perf_counter() - start})
+        return result
+
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory() as working_dir:
+        input_file_name = None
+        dimension = 1
+        while max_dim is None or dimension <= max_dim:
+            if dimension == 1:
+                _, sorted_file_names = timed('dimension_one', dimension, hm.process_dimension_one, cores,
+                                             genotype_file_name, working_dir)
+            else:
+                _, task_chunks = timed('division', dimension, hm.divide_hypercube_file, cores, input_file_name,
+                                       cores * hm.CHUNKS_PER_CORE)
+                sorted_file_names = timed('pairing', dimension, hm.process_chunks, cores, input_file_name,
+                                          task_chunks, working_dir)
+
+            output_file_name = working_dir + '/' + hm.hypercube_file_name(dimension)
+            ch.write_header(output_file_name)
+            found = timed('merge', dimension, aux.merge_sorted_files, hm.remove_empty_files(sorted_file_names),
+                          MAX_OPEN_FILES, output_file_name, aux.index_file_name(output_file_name), cores)
+            if not found:
+                break
+            hypercubes[dimension] = sum(count for _, _, count in aux.read_index(aux.index_file_name(output_file_name)))
+
+            if expand:
+                expanded_file_name = working_dir + '/expanded.txt'
+                timed('expand', dimension, eh.expand_hypercubes, output_file_name, expanded_file_name, cores)
+                os.remove(expanded_file_name)
+            if input_file_name is not None:
+                hm.remove_hypercube_file(input_file_name)
+            input_file_name = output_file_name
+            dimension += 1
+
+    return {'stages': stages, 'hypercubes': hypercubes, 'seconds': time.perf_counter() - start_time,
+            'peak_memory_mb': peak_memory()}
+
+
+def run_in_process(queue, *args):
+    """Put the result of 'run_landscape' called with 'args' into 'queue'."""
+    queue.put(run_landscape(*args))
+
+
+def run_isolated(*args) -> dict:
+    """Call 'run_landscape' with 'args' in a new process, so its peak memory is not shared with other runs."""
+    context = mp.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_in_process, args=(queue,) + args)
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def version() -> str:
+    """Return the git commit of the code being benchmarked, None outside of the git repository."""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(landscapes: list, cores_list: list, max_dim: int = None, expand: bool = True, seed: int = 0,
+                  label: str = None) -> dict:
+    """Run every landscape of 'landscapes' (specifications) with every number of
+       cores of 'cores_list' and return the results ready to be written as JSON."""
+    results = {'label': label if label is not None else version(),
+               'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+               'max_dim': max_dim, 'seed': seed, 'runs': list()}
+    with tempfile.TemporaryDirectory() as folder:
+        for spec in landscapes:
+            genotypes = generate_landscape(spec, seed)
+            genotype_file_name = folder + '/genotypes.txt'
+            write_landscape(genotypes, genotype_file_name, seed)
+            for cores in cores_list:
+                run = run_isolated(genotype_file_name, cores, max_dim, expand)
+                run.update({'landscape': spec, 'genotypes': len(genotypes), 'cores': cores})
+                results['runs'].append(run)
+                print('{0} ({1} genotypes), {2} cores: {3:.2f} s, {4} hypercubes, peak memory {5} MB'.format(
+                    spec, len(genotypes), cores, run['seconds'], sum(run['hypercubes'].values()),
+                    format_memory(run['peak_memory_mb'])))
+    return results
+
+
+def format_memory(peak_memory_mb: dict) -> str:
+    """Return peak memory of the main process and of workers as a string."""
+    return '/'.join('-' if value is None else '{0:.0f}'.format(value)
+                    for value in (peak_memory_mb['main'], peak_memory_mb['workers']))
+
+
+def stage_times(run: dict) -> dict:
+    """Return the dictionary {stage: seconds} of the run summed over dimensions, with the total."""
+    times = dict()
+    for stage in run['stages']:
+        times[stage['stage']] = times.get(stage['stage'], 0) + stage['seconds']
+    times['total'] = run['seconds']
+    return times
+
+
+def compare_results(old: dict, new: dict) -> list:
+    """Return lines of the table comparing stage times and peak memory
+       of the runs of two results matched by landscape and cores."""
+    lines = ['landscape cores stage old new new/old']
+    old_runs = dict(((run['landscape'], run['cores']), run) for run in old['runs'])
+    for run in new['runs']:
+        old_run = old_runs.get((run['landscape'], run['cores']))
+        if old_run is None:
+            continue
+        old_values = stage_times(old_run)
+        new_values = stage_times(run)
+        for kind in ('main', 'workers'):
+            old_values['memory_' + kind] = old_run['peak_memory_mb'][kind]
+            new_values['memory_' + kind] = run['peak_memory_mb'][kind]
+        for stage, value in new_values.items():
+            old_value = old_values.get(stage)
+            if value is None or old_value is None:
+                continue
+            ratio = '-' if old_value == 0 else '{0:.2f}'.format(value / old_value)
+            lines.append('{0}\t{1}\t{2}\t{3:.3f}\t{4:.3f}\t{5}'.format(run['landscape'], run['cores'], stage,
+                                                                       old_value, value, ratio))
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark HypercubeME on synthetic genotype landscapes, see '
+                                                 'the description in benchmark.py')
+    parser.add_argument('-l', '--landscapes', help='comma-separated landscape specifications (example: '
+                                                   '"complete:8:2,dms:100:19:30000"), the "small" suite by default')
+    parser.add_argument('-s', '--suite', help='the predefined set of landscapes', choices=sorted(SUITES))
+    parser.add_argument('-c', '--cores', help='comma-separated numbers of cores, "1,2,4" by default', default='1,2,4')
+    parser.add_argument('--max-dim', help='the maximal dimension of hypercubes to find, all dimensions by default',
+                        type=int)
+    parser.add_argument('--no-expand', help='do not time the expansion of hypercubes', action='store_true')
+    parser.add_argument('--seed', help='the seed of the random landscapes, 0 by default', type=int, default=0)
+    parser.add_argument('--label', help='the label of the results, the git commit by default')
+    parser.add_argument('-o', '--output_file', help='the filename to write results in JSON, "benchmark.json" '
+                                                    'by default', default='benchmark.json')
+    parser.add_argument('-g', '--generate', help='only write the genotype file of the single landscape given '
+                                                 'with -l into this file')
+    parser.add_argument('--compare', help='compare two files of results instead of running the benchmark',
+                        nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        results = list()
+        for file_name in args.compare:
+            if not os.path.isfile(file_name):
+                print('ERROR: file {0} doesn\'t exist'.format(file_name))
+                exit(1)
+            with open(file_name, 'r') as fh:
+                results.append(json.load(fh))
+        for line in compare_results(*results):
+            print(line.replace('\t', ' '))
+        exit(0)
+
+    if args.landscapes is not None:
+        landscapes = args.landscapes.split(',')
+    else:
+        landscapes = SUITES[args.suite or 'small']
+    try:
+        cores_list = [int(cores) for cores in args.cores.split(',')]
+        for spec in landscapes:
+            parse_landscape(spec)
+    except ValueError as err:
+        print('ERROR: {0}'.format(err))
+        exit(1)
+
+    if args.generate is not None:
+        if len(landscapes) != 1:
+            print('ERROR: Give the single landscape with -l to generate')
+            exit(1)
+        if os.path.isfile(args.generate):
+            print('ERROR: file {0} already exists, please rename/remove existing file'.format(args.generate))
+            exit(1)
+        try:
+            genotypes = generate_landscape(landscapes[0], args.seed)
+        except ValueError as err:
+            print('ERROR: {0}'.format(err))
+            exit(1)
+        write_landscape(genotypes, args.generate, args.seed)
+        print('{0} genotypes saved as {1}'.format(len(genotypes), args.generate))
+        exit(0)
+
+    if os.path.isfile(args.output_file):
+        print('ERROR: file {0} already exists, please rename/remove existing file or specify output file name '
+              'with argument -o'.format(args.output_file))
+        exit(1)
+
+    print('Benchmark ================')
+    try:
+        results = run_benchmark(landscapes, cores_list, args.max_dim, not args.no_expand, args.seed, args.label)
+    except ValueError as err:
+        print('ERROR: {0}'.format(err))
+        exit(1)
+    with open(args.output_file, 'w') as fh:
+        json.dump(results, fh, indent=1)
+    print('Results saved as {0}'.format(args.output_file))
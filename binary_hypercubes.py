@@ -0,0 +1,236 @@
+"""
+Binary, memory-mappable format of the files with hypercubes.
+
+Diagonals and genotypes are interned into a table of strings and hypercubes
+are stored as fixed-width columns of string ids, so the file is opened with
+'mmap' and read without parsing. All sections are aligned to 8 bytes, numbers
+are stored in native (little-endian on usual platforms) byte order:
+
+    header        magic, dimension, numbers of strings, groups and hypercubes
+    strings       (strings + 1) uint64 offsets followed by UTF-8 strings
+    groups        uint32 diagonal ids, (groups + 1) uint64 first rows
+    hypercubes    uint32 ids of first genotypes, uint32 ids of last genotypes
+
+Hypercubes are sorted as in the text format, so the hypercubes of every
+diagonal group (parallel hypercubes) occupy contiguous rows.
+"""
+import os
+import mmap
+import time
+import struct
+import argparse
+from array import array
+import auxiliary as aux
+import compressed_hypercubes as ch
+
+MAGIC = b'HCMEBIN1'
+
+# magic, dimension, reserved, number of strings, number of groups, number of hypercubes
+HEADER = struct.Struct('<8sIIQQQ')
+
+
+def padding(size: int) -> int:
+    """Return the number of bytes aligning 'size' to 8 bytes."""
+    return -size % 8
+
+
+def is_binary(file_name: str) -> bool:
+    """Return True if 'file_name' is written in the binary format."""
+    with open(file_name, 'rb') as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def write_binary_hypercubes(lines, output_file_name: str, dimension: int = 0) -> int:
+    """
+    Write hypercubes from the iterable of sorted text 'lines' (without header)
+    into 'output_file_name' in the binary format.
+
+    Returns
+    -------
+        num_hypercubes : int
+            The number of written hypercubes.
+    """
+    ids: dict = dict()
+    strings: list = list()
+    group_diagonals = array('I')
+    group_starts = array('Q')
+    starts = array('I')
+    ends = array('I')
+
+    def intern(string: str) -> int:
+        string_id = ids.get(string)
+        if string_id is None:
+            string_id = ids[string] = len(strings)
+            strings.append(string.encode('utf-8'))
+        return string_id
+
+    previous_diagonal = None
+    for line in lines:
+        diagonal, start, end = line.rstrip('\n').split('\t')
+        if diagonal != previous_diagonal:
+            group_diagonals.append(intern(diagonal))
+            group_starts.append(len(starts))
+            previous_diagonal = diagonal
+        starts.append(intern(start))
+        ends.append(intern(end))
+    group_starts.append(len(starts))
+    if previous_diagonal is not None:
+        dimension = len(previous_diagonal.split(':'))
+
+    string_offsets = array('Q', [0])
+    for string in strings:
+        string_offsets.append(string_offsets[-1] + len(string))
+
+    with open(output_file_name, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, dimension, 0, len(strings), len(group_diagonals), len(starts)))
+        fh.write(string_offsets.tobytes())
+        fh.write(b''.join(strings))
+        fh.write(bytes(padding(string_offsets[-1])))
+        for column in (group_diagonals, group_starts, starts, ends):
+            data = column.tobytes()
+            fh.write(data)
+            fh.write(bytes(padding(len(data))))
+
+    return len(starts)
+
+
+class BinaryHypercubes:
+    """Hypercubes stored in the binary format, opened with 'mmap'."""
+
+    def __init__(self, file_name: str):
+        self.fh = open(file_name, 'rb')
+        self.map = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.dimension, _, num_strings, num_groups, num_hypercubes = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('File "{0}" is not in the binary format of hypercubes'.format(file_name))
+
+        self.views: list = list()
+        offset = HEADER.size
+        self.string_offsets, offset = self.column(offset, 'Q', num_strings + 1)
+        self.blob, offset = self.column(offset, 'B', self.string_offsets[-1])
+        self.group_diagonals, offset = self.column(offset, 'I', num_groups)
+        self.group_starts, offset = self.column(offset, 'Q', num_groups + 1)
+        self.starts, offset = self.column(offset, 'I', num_hypercubes)
+        self.ends, offset = self.column(offset, 'I', num_hypercubes)
+
+    def column(self, offset: int, item_format: str, length: int) -> tuple:
+        """Return the view of 'length' items starting at 'offset' and the offset of the next section."""
+        size = struct.calcsize(item_format) * length
+        view = memoryview(self.map)[offset:offset + size].cast(item_format)
+        self.views.append(view)
+        return view, offset + size + padding(size)
+
+    def string(self, string_id: int) -> str:
+        """Return the string with the id 'string_id'."""
+        return bytes(self.blob[self.string_offsets[string_id]:self.string_offsets[string_id + 1]]).decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def num_groups(self) -> int:
+        """Return the number of diagonal groups."""
+        return len(self.group_diagonals)
+
+    def group_size(self, index: int) -> int:
+        """Return the number of hypercubes in the diagonal group 'index'."""
+        return self.group_starts[index + 1] - self.group_starts[index]
+
+    def group(self, index: int) -> tuple:
+        """Return the diagonal group 'index' as a tuple (diagonal, first genotypes, last genotypes)."""
+        first_row, last_row = self.group_starts[index], self.group_starts[index + 1]
+        return (self.string(self.group_diagonals[index]),
+                [self.string(string_id) for string_id in self.starts[first_row:last_row]],
+                [self.string(string_id) for string_id in self.ends[first_row:last_row]])
+
+    def groups(self):
+        """Yield all diagonal groups as in 'group'."""
+        for index in range(self.num_groups()):
+            yield self.group(index)
+
+    def lines(self):
+        """Yield hypercubes as lines of the text format (without header and new line)."""
+        for diagonal, starts, ends in self.groups():
+            for start, end in zip(starts, ends):
+                yield diagonal + '\t' + start + '\t' + end
+
+    def close(self):
+        for view in getattr(self, 'views', list()):
+            view.release()
+        self.map.close()
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def text_to_binary(input_file_name: str, output_file_name: str) -> int:
+    """Convert the (compressed or not) text file with hypercubes into the binary format."""
+    return write_binary_hypercubes(ch.read_lines(input_file_name), output_file_name)
+
+
+def binary_to_text(input_file_name: str, output_file_name: str) -> int:
+    """Convert the binary file with hypercubes into the text format."""
+    with BinaryHypercubes(input_file_name) as hypercubes, open(output_file_name, 'w') as fh:
+        print('diagonal first_genotype last_genotype', file=fh)
+        for line in hypercubes.lines():
+            print(line, file=fh)
+        return len(hypercubes)
+
+
+def merge_sorted_files(sorted_file_names: list, max_open_files: int, output_file_name: str,
+                       dimension: int = 0, cores: int = 1, pool=None) -> bool:
+    """Merge text files from 'sorted_file_names' and write the
+       content into 'output_file_name' in the binary format. Parts of
+       more than 'max_open_files' files are merged by the workers of
+       'pool' if given (see 'aux.premerge_sorted_files')."""
+    # Merge the parts of too many files into the intermediate text files first
+    sorted_file_names = aux.premerge_sorted_files(sorted_file_names, max_open_files, cores, pool)
+
+    filehandles = [open(sorted_file_name, 'r', buffering=aux.BUFFER_SIZE) for sorted_file_name in sorted_file_names]
+    num_hypercubes = write_binary_hypercubes(aux.mergeiter(*filehandles), output_file_name, dimension)
+    for fh in filehandles:
+        fh.close()
+    for sorted_file_name in sorted_file_names:
+        os.remove(sorted_file_name)
+
+    return num_hypercubes > 0
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+
+    parser = argparse.ArgumentParser(description='Convert the file with hypercubes (output of "HypercubeME.py") '
+                                                 'between the text and the binary formats; the direction is '
+                                                 'defined by the format of the input file')
+    parser.add_argument('-p', '--hypercubes', help='the filename with the list of hypercubes', required=True)
+    parser.add_argument('-o', '--output_file', help='the filename to write converted hypercubes, '
+                                                    '"*.bin" or "*.txt" by default')
+    args = parser.parse_args()
+
+    print('Convert hypercubes ================')
+    if not os.path.isfile(args.hypercubes):
+        print('ERROR: file {0} doesn\'t exist'.format(args.hypercubes))
+        exit(1)
+
+    binary = is_binary(args.hypercubes)
+    if args.output_file is None:
+        args.output_file = os.path.splitext(os.path.basename(args.hypercubes))[0] + ('.txt' if binary else '.bin')
+
+    if os.path.isfile(args.output_file):
+        print('ERROR: file {0} already exists, please rename/remove existing file or specify output file name '
+              'with argument -o'.format(args.output_file))
+        exit(1)
+
+    print('Start processing file: {0}'.format(args.hypercubes))
+    if binary:
+        num_hypercubes = binary_to_text(args.hypercubes, args.output_file)
+    else:
+        num_hypercubes = text_to_binary(args.hypercubes, args.output_file)
+
+    print('Converting complete, {0} hypercubes'.format(num_hypercubes))
+    print('Elapsed time: {0}'.format(time.time() - start_time))
+    print('Output file saved as {0}'.format(args.output_file))
@@ -0,0 +1,376 @@
+"""
+Compressed text format of the files with hypercubes.
+
+Lines of the text format are written in blocks of about BLOCK_SIZE characters
+compressed independently with gzip or lzma (xz), so the file is a usual
+multi-member gzip (multi-stream xz) file read by 'zcat' or 'xzcat', while
+every block can be decompressed on its own. Blocks always end with a complete
+line. Lines are addressed with virtual offsets
+
+    (byte offset of the block in the file << VIRTUAL_SHIFT) | offset in the block
+
+which replace byte offsets in the index of diagonal groups written next to the
+file, so every diagonal group is read without decompressing the whole file.
+
+In the front-coded mode the diagonal of a line is omitted (the line starts
+with the tab) if it is the diagonal of the previous line. The first line of
+every diagonal group keeps its diagonal, so groups are read from their virtual
+offsets as usual; 'iter_lines' restores omitted diagonals.
+"""
+import os
+import gzip
+import lzma
+import zlib
+import time
+import argparse
+
+# Uncompressed characters in a block
+BLOCK_SIZE = 256 * 1024
+
+VIRTUAL_SHIFT = 32
+
+# Bytes read from the file at once
+READ_SIZE = 64 * 1024
+
+EXTENSIONS = {'gzip': '.gz', 'lzma': '.xz'}
+
+MAGICS = {'gzip': b'\x1f\x8b', 'lzma': b'\xfd7zXZ\x00'}
+
+HEADER = 'diagonal first_genotype last_genotype\n'
+
+
+def compression_of(file_name: str) -> str:
+    """Return the compression ('gzip' or 'lzma') of 'file_name' recognized
+       by its first bytes, None for the uncompressed file."""
+    with open(file_name, 'rb') as fh:
+        start = fh.read(max(len(magic) for magic in MAGICS.values()))
+    for compression, magic in MAGICS.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def compression_of_name(file_name: str) -> str:
+    """Return the compression implied by the extension of 'file_name', None if there is no such extension."""
+    for compression, extension in EXTENSIONS.items():
+        if file_name.endswith(extension):
+            return compression
+    return None
+
+
+def strip_extension(file_name: str) -> str:
+    """Return 'file_name' without the extension of compression."""
+    compression = compression_of_name(file_name)
+    return file_name if compression is None else file_name[:-len(EXTENSIONS[compression])]
+
+
+def compress_block(data: bytes, compression: str) -> bytes:
+    """Return 'data' compressed into the independent gzip member or xz stream."""
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    return lzma.compress(data)
+
+
+def decompressor(compression: str):
+    """Return the decompressor of one gzip member or xz stream."""
+    if compression == 'gzip':
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+
+
+def open_text(file_name: str):
+    """Open the (compressed or not) text file 'file_name' for sequential reading."""
+    compression = compression_of(file_name)
+    if compression == 'gzip':
+        return gzip.open(file_name, 'rt')
+    elif compression == 'lzma':
+        return lzma.open(file_name, 'rt')
+    return open(file_name, 'r')
+
+
+def iter_lines(lines):
+    """Yield 'lines' with hypercubes restoring diagonals omitted by front coding."""
+    diagonal = ''
+    for line in lines:
+        if line.startswith('\t'):
+            line = diagonal + line
+        else:
+            diagonal = line[:line.find('\t')]
+        yield line
+
+
+class BlockWriter:
+    """
+    Text file of lines with hypercubes appended in compressed blocks.
+
+    Without 'compression' blocks are written as they are, so the plain
+    text file is written. With 'index_file_name', the index of diagonal
+    groups (see 'auxiliary.read_index') with virtual offsets is written
+    there when the file is closed.
+    """
+
+    def __init__(self, file_name: str, compression: str = None, front_coding: bool = False,
+                 index_file_name: str = None):
+        if front_coding and compression is None:
+            raise ValueError('Front coding is applied to compressed files only')
+        self.fh = open(file_name, 'ab')
+        self.offset = self.fh.tell()
+        self.compression = compression
+        self.front_coding = front_coding
+        self.index_file_name = index_file_name
+        self.index: list = list()
+        self.block: list = list()
+        self.size = 0
+        self.diagonal = None
+
+    def tell(self) -> int:
+        """Return the virtual offset of the next line."""
+        if self.compression is None:
+            return self.offset + self.size
+        return (self.offset << VIRTUAL_SHIFT) | self.size
+
+    def write(self, line: str):
+        """Write the complete 'line' ending with the new line."""
+        if self.front_coding or self.index_file_name is not None:
+            tab = line.find('\t')
+            diagonal = line[:tab]
+            if diagonal == self.diagonal:
+                if self.index_file_name is not None:
+                    self.index[-1][2] += 1
+                if self.front_coding:
+                    line = line[tab:]
+            else:
+                if self.index_file_name is not None:
+                    self.index.append([diagonal, self.tell(), 1])
+                self.diagonal = diagonal
+        self.block.append(line)
+        self.size += len(line)
+        if self.size >= BLOCK_SIZE:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """Write the current block."""
+        if self.size == 0:
+            return
+        data = ''.join(self.block).encode('utf-8')
+        if self.compression is not None:
+            data = compress_block(data, self.compression)
+        self.fh.write(data)
+        self.offset += len(data)
+        self.block.clear()
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.fh.close()
+        if self.index_file_name is not None:
+            with open(self.index_file_name, 'w') as index_fh:
+                print('diagonal\toffset\tlines', file=index_fh)
+                for diagonal, offset, count in self.index:
+                    print(diagonal, offset, count, sep='\t', file=index_fh)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BlockReader:
+    """Compressed file written by 'BlockWriter' read line by line from virtual offsets."""
+
+    def __init__(self, file_name: str):
+        self.compression = compression_of(file_name)
+        self.fh = open(file_name, 'rb')
+        self.file_size = os.path.getsize(file_name)
+        self.block_offset = None
+        self.next_offset = 0
+        self.data = ''
+        self.position = 0
+        self.load(0)
+
+    def load(self, offset: int):
+        """Decompress the block starting at byte 'offset' of the file."""
+        self.fh.seek(offset)
+        block_decompressor = decompressor(self.compression)
+        parts = list()
+        consumed = 0
+        while not block_decompressor.eof:
+            data = self.fh.read(READ_SIZE)
+            if not data:
+                break
+            consumed += len(data)
+            parts.append(block_decompressor.decompress(data))
+        self.block_offset = offset
+        self.next_offset = offset + consumed - len(block_decompressor.unused_data)
+        self.data = b''.join(parts).decode('utf-8')
+        self.position = 0
+
+    def seek(self, offset: int):
+        """Move to the line at the virtual 'offset'."""
+        block_offset = offset >> VIRTUAL_SHIFT
+        if block_offset != self.block_offset:
+            self.load(block_offset)
+        self.position = offset & ((1 << VIRTUAL_SHIFT) - 1)
+
+    def tell(self) -> int:
+        """Return the virtual offset of the next line."""
+        return (self.block_offset << VIRTUAL_SHIFT) | self.position
+
+    def readline(self) -> str:
+        """Return the next line, the empty string at the end of the file."""
+        line = ''
+        while True:
+            end = self.data.find('\n', self.position)
+            if end >= 0:
+                line += self.data[self.position:end + 1]
+                self.position = end + 1
+                return line
+            line += self.data[self.position:]
+            self.position = len(self.data)
+            if self.next_offset >= self.file_size:
+                return line
+            self.load(self.next_offset)
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_hypercubes(file_name: str):
+    """Open the file with hypercubes for reading lines from offsets of its index
+       ('BlockReader' for the compressed file, the usual text file otherwise)."""
+    if compression_of(file_name) is None:
+        return open(file_name, 'r')
+    return BlockReader(file_name)
+
+
+def read_lines(file_name: str, offset: int = None, count: int = None):
+    """Yield 'count' lines (with restored diagonals) of the file with hypercubes
+       starting at the offset of its index 'offset'. Without 'offset', all lines following
+       the header are read sequentially, so any gzip or xz file can be read."""
+    if offset is None:
+        with open_text(file_name) as fh:
+            # Skip header
+            fh.readline()
+            yield from iter_lines(fh)
+        return
+
+    with open_hypercubes(file_name) as fh:
+        fh.seek(offset)
+        yield from iter_lines(fh.readline() for _ in range(count))
+
+
+def split_index(index: list, parts: int) -> list:
+    """Split the index of diagonal groups (see 'auxiliary.read_index') into
+       at most 'parts' ranges of comparable numbers of lines and return them
+       as tuples (virtual offset, number of lines)."""
+    total = sum(count for _, _, count in index)
+    ranges: list = list()
+    for diagonal, offset, count in index:
+        if len(ranges) == 0 or (ranges[-1][1] >= total / parts and len(ranges) < parts):
+            ranges.append([offset, 0])
+        ranges[-1][1] += count
+    return [tuple(file_range) for file_range in ranges]
+
+
+def index_groups(file_name: str) -> list:
+    """Return the index of diagonal groups (see 'auxiliary.read_index') of
+       the compressed 'file_name' scanning the file sequentially."""
+    index: list = list()
+    with BlockReader(file_name) as fh:
+        # Skip header
+        fh.readline()
+        while True:
+            offset = fh.tell()
+            line = fh.readline()
+            if not line:
+                break
+            diagonal = line[:line.find('\t')]
+            if len(index) > 0 and (diagonal == '' or index[-1][0] == diagonal):
+                index[-1][2] += 1
+            else:
+                index.append([diagonal, offset, 1])
+    return [tuple(entry) for entry in index]
+
+
+def write_header(file_name: str, compression: str = None):
+    """Write the header of the file with hypercubes into the new file 'file_name'."""
+    # Truncate the file left by the interrupted run
+    open(file_name, 'w').close()
+    with BlockWriter(file_name, compression) as fh:
+        fh.write(HEADER)
+
+
+def write_hypercube_file(lines, output_file_name: str, compression: str = None, front_coding: bool = False,
+                         index_file_name: str = None) -> int:
+    """
+    Write sorted 'lines' (ending with the new line) with hypercubes and
+    the header into 'output_file_name', writing the index of diagonal
+    groups into 'index_file_name' if given. The file is written under
+    a temporary name and renamed, so it never exists partially.
+
+    Returns
+    -------
+        num_hypercubes : int
+            The number of written hypercubes.
+    """
+    write_header(output_file_name + '.tmp', compression)
+    num_hypercubes = 0
+    with BlockWriter(output_file_name + '.tmp', compression, front_coding, index_file_name) as fh:
+        for line in lines:
+            fh.write(line)
+            num_hypercubes += 1
+    os.replace(output_file_name + '.tmp', output_file_name)
+    return num_hypercubes
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+
+    parser = argparse.ArgumentParser(description='Compress (or decompress) the text file with hypercubes (output of '
+                                                 '"HypercubeME.py") into independently compressed blocks and write '
+                                                 'the index of diagonal groups next to the output file')
+    parser.add_argument('-p', '--hypercubes', help='the filename with the list of hypercubes', required=True)
+    parser.add_argument('-o', '--output_file', help='the filename to write converted hypercubes, "*.txt.gz", '
+                                                    '"*.txt.xz" or "*.txt" (without compression) by default')
+    parser.add_argument('--compress', help='the compression of the output file, "gzip" by default',
+                        choices=['gzip', 'lzma', 'none'], default='gzip')
+    parser.add_argument('--front-coding', help='omit the diagonal repeating the diagonal of the previous line',
+                        action='store_true')
+    args = parser.parse_args()
+
+    print('Convert hypercubes ================')
+    if not os.path.isfile(args.hypercubes):
+        print('ERROR: file {0} doesn\'t exist'.format(args.hypercubes))
+        exit(1)
+
+    compression = None if args.compress == 'none' else args.compress
+    if args.front_coding and compression is None:
+        print('ERROR: Front coding is applied to compressed files only')
+        exit(1)
+    if args.output_file is None:
+        args.output_file = (os.path.splitext(strip_extension(os.path.basename(args.hypercubes)))[0] + '.txt' +
+                            EXTENSIONS.get(compression, ''))
+
+    if os.path.isfile(args.output_file):
+        print('ERROR: file {0} already exists, please rename/remove existing file or specify output file name '
+              'with argument -o'.format(args.output_file))
+        exit(1)
+
+    print('Start processing file: {0}'.format(args.hypercubes))
+    num_hypercubes = write_hypercube_file(read_lines(args.hypercubes), args.output_file, compression,
+                                          args.front_coding, args.output_file + '.idx')
+
+    print('Converting complete, {0} hypercubes'.format(num_hypercubes))
+    print('Elapsed time: {0}'.format(time.time() - start_time))
+    print('Output file saved as {0}'.format(args.output_file))
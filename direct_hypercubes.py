@@ -0,0 +1,237 @@
+"""
+Hypercubes of a single dimension found directly from the genotypes.
+
+HypercubeME.py builds every dimension from the previous one, so hypercubes
+of dimension d need the files of all dimensions below d. Here genotypes are
+kept in a hash set instead, and hypercubes of dimension d are searched from
+every genotype taken as their first vertex. The edges of the genotype (pairs
+at distance 1 where it is the first genotype, see 'aux.index_single_mutants')
+are combined level by level in the Apriori way: the set of k edges at
+distinct positions is a hypercube if all its subsets of k - 1 edges are
+hypercubes, so every vertex but the last one exists, and the last vertex,
+obtained by applying all k mutations, is in the hash set. Only the current
+level of a single genotype is kept in memory and nothing but the target
+dimension is written.
+
+Hypercubes are written in the format of HypercubeME.py into the file
+'hypercubes_d.txt' with the index of diagonal groups, so the file is
+the same as the one of the full run.
+"""
+import os
+import math
+import time
+import argparse
+from itertools import groupby
+import auxiliary as aux
+import compressed_hypercubes as ch
+import HypercubeME as hm
+
+# Maximum number of open files, see 'HypercubeME.py'
+MAX_OPEN_FILES = 1021
+
+# Hash set of genotypes of the genotype table attached to the worker and the name
+# of the table, built by 'genotype_index'
+worker_keys = None
+worker_index = None
+worker_index_table = None
+
+
+def index_edges(genotypes: list, mutations: list, diagonal_filter: tuple = None) -> list:
+    """
+    Return the list of edges of every genotype encoded by 'aux.intern_genotypes',
+    that is, of pairs at distance 1 where the genotype is the first one,
+    as tuples (mutation of the diagonal, position, index of the last genotype,
+    ids of mutations removed from and added to the genotype by the edge).
+    Edges of mutations disallowed by 'diagonal_filter' are dropped.
+    """
+    positions, variants = aux.split_mutations(mutations)
+    ids = dict(((position, variant), mutation) for mutation, (position, variant)
+               in enumerate(zip(positions, variants)))
+    buckets = aux.index_single_mutants(genotypes, positions, variants)
+    if diagonal_filter is not None:
+        buckets = aux.filter_buckets(buckets, diagonal_filter)
+
+    edges: list = [list() for _ in range(len(genotypes))]
+    for position, members in buckets:
+        for i in range(len(members) - 1):
+            first_letter, first = members[i]
+            removed = () if first_letter == 'Z' else (ids[(int(position), first_letter)],)
+            for j in range(i + 1, len(members)):
+                last_letter, last = members[j]
+                added = () if last_letter == 'Z' else (ids[(int(position), last_letter)],)
+                edges[first].append((first_letter + position + last_letter, position, last, removed, added))
+    return edges
+
+
+def iter_vertex_hypercubes(edges: list, dimension: int, keys: list, index: dict):
+    """
+    Yield hypercubes of 'dimension' whose first vertex has 'edges' (see
+    'index_edges') as tuples (indices of the edges, index of the last vertex).
+
+    Hypercubes of the level k are tuples of increasing indices of edges,
+    candidates of the level k + 1 join two of them sharing the first k - 1
+    edges. The candidate is kept if its faces through the first vertex are
+    hypercubes of the level k and its last vertex, the last vertex of the
+    first joined hypercube moved along the last edge, is found in 'index'
+    ({set of mutation ids: genotype index}, 'keys' being its keys by index).
+    """
+    level = dict(((i,), edge[2]) for i, edge in enumerate(edges))
+    for _ in range(dimension - 1):
+        next_level = dict()
+        for prefix, combos in groupby(level, key=lambda combo: combo[:-1]):
+            lasts = [combo[-1] for combo in combos]
+            for i in range(len(lasts) - 1):
+                vertex = level[prefix + (lasts[i],)]
+                for j in range(i + 1, len(lasts)):
+                    _, position, _, removed, added = edges[lasts[j]]
+                    if edges[lasts[i]][1] == position:
+                        continue
+                    candidate = prefix + (lasts[i], lasts[j])
+                    if not all(candidate[:k] + candidate[k + 1:] in level for k in range(len(prefix))):
+                        continue
+                    last = index.get(keys[vertex].difference(removed).union(added))
+                    if last is not None:
+                        next_level[candidate] = last
+        level = next_level
+    yield from level.items()
+
+
+def iter_hypercube_lines(vertices: list, dimension: int, genotypes, mutations: list, keys: list, index: dict):
+    """Yield lines (diagonal, first genotype, last genotype) of hypercubes of
+       'dimension' whose first vertex is given by tuples (genotype index, edges)
+       of 'vertices'. See 'iter_vertex_hypercubes' for 'keys' and 'index'."""
+    for first, edges in vertices:
+        first_genotype = aux.decode_genotype(genotypes[first], mutations)
+        for combo, last in iter_vertex_hypercubes(edges, dimension, keys, index):
+            yield (':'.join(sorted(edges[edge][0] for edge in combo)) + '\t' + first_genotype + '\t' +
+                   aux.decode_genotype(genotypes[last], mutations))
+
+
+def genotype_index() -> tuple:
+    """Return the hash set of genotypes of the genotype table attached to
+       the worker as the tuple (keys, index), see 'iter_vertex_hypercubes'."""
+    global worker_keys, worker_index, worker_index_table
+    if worker_index_table != hm.worker_table_name:
+        worker_keys = [frozenset(genotype) for genotype in hm.worker_genotypes]
+        worker_index = dict((key, ind) for ind, key in enumerate(worker_keys))
+        worker_index_table = hm.worker_table_name
+    return worker_keys, worker_index
+
+
+def write_hypercubes_from_table(table: tuple, vertices: list, dimension: int, output_file_name: str,
+                                memory_limit: int = None):
+    """Write hypercubes of 'iter_hypercube_lines' for the genotype 'table' attached to
+       the worker (see 'hm.genotype_table') into 'output_file_name', see
+       'aux.write_sorted_runs' for 'memory_limit'."""
+    hm.attach_genotype_table(table)
+    lines = iter_hypercube_lines(vertices, dimension, hm.worker_genotypes, hm.worker_mutations, *genotype_index())
+    aux.write_sorted_runs(lines, output_file_name, memory_limit)
+
+
+def find_hypercubes(genotype_file_name: str, dimension: int, output_file_name: str, cores: int = 1,
+                    diagonal_filter: tuple = None, compression: str = None, front_coding: bool = False,
+                    memory_limit: int = None) -> int:
+    """
+    Write hypercubes of 'dimension' of genotypes of 'genotype_file_name'
+    into 'output_file_name' and its index of diagonal groups.
+
+    Genotypes with at least 'dimension' edges are divided into tasks of
+    comparable cost, the number of subsets of 'dimension' of their edges,
+    run on 'cores' cores. Sorted files of tasks are merged as in HypercubeME.py.
+    See 'aux.make_diagonal_filter' for 'diagonal_filter', compressed_hypercubes.py
+    for 'compression' and 'front_coding' and 'aux.write_sorted_runs' for 'memory_limit'.
+
+    Returns
+    -------
+        num_hypercubes : int
+            The number of written hypercubes.
+    """
+    mutations, genotypes = aux.intern_genotypes(aux.read_genotypes(genotype_file_name))
+    edges = index_edges(genotypes, mutations, diagonal_filter)
+    firsts = [ind for ind in range(len(genotypes)) if len(set(edge[1] for edge in edges[ind])) >= dimension]
+    tasks = hm.schedule_chunks([math.comb(len(edges[ind]), dimension) for ind in firsts],
+                               cores * hm.CHUNKS_PER_CORE)
+
+    with hm.genotype_table(genotypes, mutations) as table, hm.task_pool(cores) as pool:
+        args = list()
+        output_file_names = list()
+        for start, length, _ in tasks:
+            output_file_names.append(output_file_name + '.' + str(len(output_file_names)))
+            vertices = [(ind, edges[ind]) for ind in firsts[start:start + length]]
+            args.append((write_hypercubes_from_table, table, vertices, dimension, output_file_names[-1], memory_limit))
+        hm.run_tasks(pool, args, output_file_names)
+
+    index_file_name = aux.index_file_name(output_file_name)
+    ch.write_header(output_file_name + '.tmp', compression)
+    found = aux.merge_sorted_files(hm.remove_empty_files(output_file_names), MAX_OPEN_FILES,
+                                   output_file_name + '.tmp', index_file_name + '.tmp', cores, compression,
+                                   front_coding)
+    if not found:
+        os.replace(output_file_name + '.tmp', output_file_name)
+        return 0
+    os.replace(index_file_name + '.tmp', index_file_name)
+    os.replace(output_file_name + '.tmp', output_file_name)
+    return sum(count for _, _, count in aux.read_index(index_file_name))
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+
+    parser = argparse.ArgumentParser(description='Find hypercubes of a single dimension directly from the genotypes, '
+                                                 'without hypercubes of lower dimensions')
+    parser.add_argument('-g', '--genotypes', help='the filename with the list of measured genotypes', required=True)
+    parser.add_argument('--dim', help='the dimension of hypercubes to find', type=int, required=True)
+    parser.add_argument('-d', '--folder', help='the folder to write the file "hypercubes_<dim>.txt" into, '
+                                               '"hypercubes" by default', default='hypercubes')
+    parser.add_argument('-c', '--cores', help='the number of cores to be used in calculation, one by default',
+                        type=int, default=1)
+    parser.add_argument('--positions', help='comma-separated positions, see "HypercubeME.py --positions"')
+    parser.add_argument('--mutations', help='comma-separated mutations, see "HypercubeME.py --mutations"')
+    parser.add_argument('--compress', help='compress the file as "HypercubeME.py --compress" does',
+                        choices=sorted(ch.EXTENSIONS))
+    parser.add_argument('--front-coding', help='with --compress, omit the diagonal repeating the diagonal of the '
+                                               'previous line', action='store_true')
+    parser.add_argument('--worker-memory', help='memory budget in megabytes for hypercubes of a task kept by every '
+                                                'worker, see "HypercubeME.py --worker-memory"', type=int)
+    args = parser.parse_args()
+
+    print('Find hypercubes of one dimension ================')
+    if args.dim < 1:
+        print('ERROR: The dimension must be positive')
+        exit(1)
+    if args.front_coding and args.compress is None:
+        print('ERROR: Front coding is applied to compressed files only, use it with --compress')
+        exit(1)
+    if args.worker_memory is not None and args.worker_memory < 1:
+        print('ERROR: The memory budget of workers must be positive')
+        exit(1)
+    if not os.path.isfile(args.genotypes):
+        print('ERROR: file {0} doesn\'t exist'.format(args.genotypes))
+        exit(1)
+    try:
+        diagonal_filter = aux.make_diagonal_filter(
+            None if args.positions is None else args.positions.split(','),
+            None if args.mutations is None else args.mutations.split(','))
+    except ValueError:
+        print('ERROR: Positions and mutations must look like "2" and "2A", got "{0}" and "{1}"'.format(
+            args.positions, args.mutations))
+        exit(1)
+
+    output_file_name = args.folder + '/' + hm.hypercube_file_name(args.dim, False, args.compress)
+    if os.path.exists(output_file_name):
+        print('ERROR: file {0} already exists, please rename/remove existing file or specify another folder '
+              'with argument -d'.format(output_file_name))
+        exit(1)
+    os.makedirs(args.folder, exist_ok=True)
+
+    try:
+        num_hypercubes = find_hypercubes(args.genotypes, args.dim, output_file_name, args.cores, diagonal_filter,
+                                         args.compress, args.front_coding,
+                                         None if args.worker_memory is None else args.worker_memory * 1024 * 1024)
+    except NameError as err:
+        print(str(err))
+        exit(1)
+
+    print('Computing complete, {0} hypercubes of dimension {1}'.format(num_hypercubes, args.dim))
+    print('Elapsed time: {0}'.format(time.time() - start_time))
+    print('Output file saved as {0}'.format(output_file_name))
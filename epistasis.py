@@ -0,0 +1,293 @@
+"""
+Epistasis of hypercubes computed from the fitness of genotypes.
+
+Epistasis of the hypercube of dimension d is the signed sum of fitness over
+its 2^d vertices: the vertex obtained by applying k of d mutations of the
+diagonal to the first genotype is taken with the sign (-1)^(d - k). The error
+of epistasis is propagated from the errors of vertices as the square root of
+the sum of their squares.
+
+Fitness and errors are kept in arrays indexed by the genotype id (the row of
+the genotype file). Vertices of a batch of hypercubes are turned into a matrix
+of ids, which is reduced with the sign vector of the dimension precomputed by
+'vertex_signs'. NumPy is used for the reduction if it is installed.
+"""
+import os
+import time
+import argparse
+from itertools import product
+import auxiliary as aux
+import binary_hypercubes as bh
+import compressed_hypercubes as ch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Number of hypercubes reduced at once
+BATCH_SIZE = 4096
+
+HEADER = 'diagonal first_genotype last_genotype epistasis error'
+
+
+def vertex_masks(dimension: int) -> list:
+    """Return the list of vertices of the hypercube of 'dimension' as tuples
+       of 0 (first variant) and 1 (last variant) for every mutation of the diagonal."""
+    return list(product((0, 1), repeat=dimension))
+
+
+def vertex_signs(dimension: int) -> list:
+    """Return the signs of the vertices of 'vertex_masks(dimension)' in the sum of epistasis."""
+    return [(-1) ** (dimension - sum(mask)) for mask in vertex_masks(dimension)]
+
+
+def genotype_key(genotype) -> frozenset:
+    """Return the key of the genotype (tuple of mutations) in the index of genotype ids."""
+    return frozenset(mutation for mutation in genotype if mutation != '0Z')
+
+
+def index_genotypes(genotypes: list) -> dict:
+    """Return the dictionary {genotype key: genotype id} for the list of 'genotypes'."""
+    return dict((genotype_key(genotype), ind) for ind, genotype in enumerate(genotypes))
+
+
+def hypercube_vertices(diagonal: str, first_genotype: str, masks: list, ids: dict) -> list:
+    """Return ids of the vertices of the hypercube given by 'diagonal' and
+       'first_genotype' in the order of 'masks' (see 'vertex_masks')."""
+    edits = list()
+    positions = set()
+    for mutation in diagonal.split(':'):
+        position = mutation[1:-1]
+        positions.add(position)
+        edits.append((None if mutation[0] == 'Z' else position + mutation[0],
+                      None if mutation[-1] == 'Z' else position + mutation[-1]))
+    rest = [mutation for mutation in first_genotype.split(':') if mutation != '0Z' and mutation[:-1] not in positions]
+
+    vertices = list()
+    for mask in masks:
+        key = frozenset(rest + [edit[bit] for edit, bit in zip(edits, mask) if edit[bit] is not None])
+        if key not in ids:
+            raise ValueError('The genotype {0} of the hypercube {1} {2} is not measured'.format(
+                ':'.join(sorted(key)) or '0Z', diagonal, first_genotype))
+        vertices.append(ids[key])
+    return vertices
+
+
+def reduce_batch(vertices: list, signs: list, fitness, errors) -> tuple:
+    """Return lists of epistasis and errors of the batch of hypercubes given by
+       the lists of ids of their 'vertices', see the module description."""
+    if np is not None:
+        matrix = np.array(vertices, dtype=np.int64)
+        epistasis = fitness[matrix] @ np.array(signs, dtype=np.float64)
+        propagated = np.sqrt((errors[matrix] ** 2).sum(axis=1))
+        return epistasis.tolist(), propagated.tolist()
+
+    epistasis = [sum(sign * fitness[ind] for sign, ind in zip(signs, row)) for row in vertices]
+    propagated = [sum(errors[ind] ** 2 for ind in row) ** 0.5 for row in vertices]
+    return epistasis, propagated
+
+
+# Fitness of genotypes, set in the worker by 'attach_fitness'
+worker_ids = None
+worker_fitness = None
+worker_errors = None
+
+
+def attach_fitness(ids: dict, fitness: list, errors: list):
+    """Keep the index of genotypes and arrays of their fitness and errors in the worker."""
+    global worker_ids, worker_fitness, worker_errors
+    worker_ids = ids
+    if np is not None:
+        worker_fitness = np.array(fitness, dtype=np.float64)
+        worker_errors = np.array(errors, dtype=np.float64)
+    else:
+        worker_fitness = fitness
+        worker_errors = errors
+
+
+def detach_fitness():
+    """Release the index of genotypes and their fitness kept in the worker."""
+    global worker_ids, worker_fitness, worker_errors
+    worker_ids = worker_fitness = worker_errors = None
+
+
+def epistasis_lines(hypercubes) -> list:
+    """Return lines of hypercubes from the iterable of tuples (diagonal, first
+       genotype, last genotype) with their epistasis and error added."""
+    lines = list()
+    batch = list()
+    vertices = list()
+    masks = signs = None
+    for diagonal, first, last in hypercubes:
+        dimension = diagonal.count(':') + 1
+        if masks is None or len(masks[0]) != dimension:
+            lines.extend(flush_batch(batch, vertices, signs))
+            masks, signs = vertex_masks(dimension), vertex_signs(dimension)
+        batch.append(diagonal + '\t' + first + '\t' + last)
+        vertices.append(hypercube_vertices(diagonal, first, masks, worker_ids))
+        if len(batch) == BATCH_SIZE:
+            lines.extend(flush_batch(batch, vertices, signs))
+    lines.extend(flush_batch(batch, vertices, signs))
+    return lines
+
+
+def flush_batch(batch: list, vertices: list, signs: list) -> list:
+    """Return lines of the 'batch' of hypercubes with epistasis and clear the batch."""
+    if len(batch) == 0:
+        return list()
+    epistasis, propagated = reduce_batch(vertices, signs, worker_fitness, worker_errors)
+    lines = [line + '\t' + str(value) + '\t' + str(error) for line, value, error in zip(batch, epistasis, propagated)]
+    batch.clear()
+    vertices.clear()
+    return lines
+
+
+def iter_text_range(hypercube_file_name: str, start: int, end: int):
+    """Yield hypercubes as tuples (diagonal, first genotype, last genotype)
+       from the lines of the text file starting in the byte range from 'start' to 'end'."""
+    for line in aux.read_lines_in_range(hypercube_file_name, start, end):
+        yield tuple(line.decode().strip().split('\t')[:3])
+
+
+def iter_compressed_range(hypercube_file_name: str, start: int, end: int):
+    """Yield hypercubes as 'iter_text_range' does from 'end' lines of the compressed
+       file starting at the virtual offset 'start' (the whole file if 'start' is None)."""
+    for line in ch.read_lines(hypercube_file_name, start, end):
+        yield tuple(line.strip().split('\t')[:3])
+
+
+def iter_binary_range(hypercube_file_name: str, start: int, end: int):
+    """Yield hypercubes as 'iter_text_range' does from the diagonal groups
+       from 'start' to 'end' of the binary file."""
+    with bh.BinaryHypercubes(hypercube_file_name) as hypercubes:
+        for group_index in range(start, end):
+            diagonal, starts, ends = hypercubes.group(group_index)
+            for first, last in zip(starts, ends):
+                yield diagonal, first, last
+
+
+def write_epistasis_range(hypercube_file_name: str, start: int, end: int, output_file_name: str) -> int:
+    """Write hypercubes of the range from 'start' to 'end' of 'hypercube_file_name'
+       (bytes for the text file, diagonal groups for the binary one, virtual
+       offset and number of lines for the compressed one) with their
+       epistasis into 'output_file_name' and return their number."""
+    if bh.is_binary(hypercube_file_name):
+        hypercubes = iter_binary_range(hypercube_file_name, start, end)
+    elif ch.compression_of(hypercube_file_name) is not None:
+        hypercubes = iter_compressed_range(hypercube_file_name, start, end)
+    else:
+        hypercubes = iter_text_range(hypercube_file_name, start, end)
+    lines = epistasis_lines(hypercubes)
+    aux.write_lines(lines, output_file_name)
+    return len(lines)
+
+
+def write_fitness_range(fitness_table: tuple, hypercube_file_name: str, start: int, end: int,
+                        output_file_name: str) -> int:
+    """Run 'write_epistasis_range' with 'fitness_table', the tuple (index of genotypes,
+       fitness, errors), attached in the worker for the time of the task."""
+    attach_fitness(*fitness_table)
+    try:
+        return write_epistasis_range(hypercube_file_name, start, end, output_file_name)
+    finally:
+        detach_fitness()
+
+
+def write_epistasis(hypercube_file_name: str, genotype_file_name: str, output_file_name: str, cores: int = 1,
+                    pool=None) -> int:
+    """
+    Write hypercubes of 'hypercube_file_name' (text or binary) with their
+    epistasis and error computed from the fitness of genotypes of
+    'genotype_file_name' into 'output_file_name'.
+
+    The file with hypercubes is split into 'cores' ranges processed in
+    parallel, parts are concatenated in the order of the ranges, so
+    hypercubes are written in the order of the input file. The compressed
+    file is split by its index of diagonal groups, without the index it
+    is read sequentially. Ranges are processed by the workers of 'pool' if
+    given, otherwise by a new pool; every range carries the fitness of
+    genotypes, so the workers need no initializer.
+
+    Returns
+    -------
+        num_hypercubes : int
+            The number of written hypercubes.
+    """
+    genotypes, fitness, errors = aux.read_fitness(genotype_file_name)
+    ids = index_genotypes(genotypes)
+
+    if bh.is_binary(hypercube_file_name):
+        with bh.BinaryHypercubes(hypercube_file_name) as hypercubes:
+            bounds = [round(i * hypercubes.num_groups() / cores) for i in range(cores + 1)]
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+    elif ch.compression_of(hypercube_file_name) is not None:
+        if os.path.isfile(aux.index_file_name(hypercube_file_name)):
+            ranges = ch.split_index(aux.read_index(aux.index_file_name(hypercube_file_name)), cores)
+        else:
+            ranges = [(None, None)]
+    else:
+        bounds = aux.split_into_ranges(hypercube_file_name, cores)
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+    part_file_names = [output_file_name + '.' + str(i) for i in range(len(ranges))]
+    args = [((ids, fitness, errors), hypercube_file_name, start, end, part_file_name)
+            for (start, end), part_file_name in zip(ranges, part_file_names)]
+
+    if len(args) > 1:
+        with aux.optional_pool(pool, cores) as epistasis_pool:
+            counts = epistasis_pool.starmap(write_fitness_range, args, chunksize=1)
+    else:
+        counts = [write_fitness_range(*task_args) for task_args in args]
+
+    with open(output_file_name + '.tmp', 'w') as fh:
+        print(HEADER, file=fh)
+    aux.append_files(part_file_names, output_file_name + '.tmp')
+    os.replace(output_file_name + '.tmp', output_file_name)
+    return sum(counts)
+
+
+def epistasis_file_name(dimension: int) -> str:
+    """Return the name of the file where hypercubes of the given 'dimension' with epistasis are stored."""
+    return 'epistasis_' + str(dimension) + '.txt'
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+
+    parser = argparse.ArgumentParser(description='Compute epistasis of hypercubes (output of "HypercubeME.py") '
+                                                 'from the fitness of genotypes')
+    parser.add_argument('-g', '--genotypes', help='the filename with the list of measured genotypes having '
+                                                  '"fitness" and, optionally, "error" columns', required=True)
+    parser.add_argument('-p', '--hypercubes', help='the filename with the list of hypercubes', required=True)
+    parser.add_argument('-o', '--output_file', help='the filename to write hypercubes with epistasis, '
+                                                    '"*_epistasis.txt" by default')
+    parser.add_argument('-c', '--cores', help='the number of cores to be used in calculation, one by default',
+                        type=int, default=1)
+    args = parser.parse_args()
+
+    print('Compute epistasis ================')
+    for file_name in (args.genotypes, args.hypercubes):
+        if not os.path.isfile(file_name):
+            print('ERROR: file {0} doesn\'t exist'.format(file_name))
+            exit(1)
+
+    if args.output_file is None:
+        args.output_file = '{0}_epistasis.txt'.format(os.path.splitext(os.path.basename(args.hypercubes))[0])
+
+    if os.path.isfile(args.output_file):
+        print('ERROR: file {0} already exists, please rename/remove existing file or specify output file name '
+              'with argument -o'.format(args.output_file))
+        exit(1)
+
+    if np is None:
+        print('NumPy is not installed, epistasis is computed in pure Python')
+    print('Start processing file: {0}'.format(args.hypercubes))
+    try:
+        num_hypercubes = write_epistasis(args.hypercubes, args.genotypes, args.output_file, args.cores)
+    except (NameError, ValueError) as err:
+        print('ERROR: {0}'.format(str(err).replace('ERROR: ', '')))
+        exit(1)
+
+    print('Computing complete, {0} hypercubes'.format(num_hypercubes))
+    print('Elapsed time: {0}'.format(time.time() - start_time))
+    print('Output file saved as {0}'.format(args.output_file))
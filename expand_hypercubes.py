@@ -1,7 +1,10 @@
 from itertools import compress, product
 import argparse
+import multiprocessing as mp
 import os
 import time
+import auxiliary as aux
+import compressed_hypercubes as ch
 
 def get_combinations(items):
     """Get all variations of diagonal"""
@@ -9,37 +12,133 @@ def get_combinations(items):
 
 def diagonal_to_dict(diagonal):
     """Make dictionary from diagonal string"""
-    diagonal_list = {}
-    for mutation in diagonal:
-        pos = mutation[:-1][1:]
-        result = mutation[-1]
-        diagonal_list[pos] = result
-        
-    return diagonal_list    
+    return dict((mutation[1:-1], mutation[-1]) for mutation in diagonal)
+
+def diagonal_edits(diagonal: dict, genotype: str) -> tuple:
+    """
+    Split 'genotype' into slots, mutations (None for wild-type) in the order
+    of positions, and turn each mutation of the 'diagonal' (see
+    'diagonal_to_dict') into an edit (slot, mutation or None) of one slot.
+    Positions of the diagonal that are wild-type in 'genotype' get new slots.
+    Returns the tuple (slots, edits), edits being in the order of 'diagonal'.
+    """
+    # Slots of the genotype: mutations (None for wild-type) in the order of the genotype
+    slots = list() if genotype == '0Z' else genotype.split(':')
+    positions = [int(mutation[:-1]) for mutation in slots]
+    edits = list()
+    for position, variant in diagonal.items():
+        position = int(position)
+        if position not in positions:
+            # Position is wild-type in the genotype
+            slots.append(None)
+            positions.append(position)
+        edits.append((positions.index(position), None if variant == 'Z' else str(position) + variant))
+    if None in slots:
+        # Mutations added to the genotype are placed in the order of positions
+        order = sorted(range(len(slots)), key=lambda slot: positions[slot])
+        slots = [slots[slot] for slot in order]
+        edits = [(order.index(slot), value) for slot, value in edits]
+    return slots, edits
+
+def apply_edits(slots: list, edits: list, mask) -> str:
+    """Return the genotype made of 'slots' by applying the 'edits' (see 'diagonal_edits') with indices in 'mask'."""
+    vertex = list(slots)
+    for ind in mask:
+        slot, value = edits[ind]
+        vertex[slot] = value
+    vertex = [mutation for mutation in vertex if mutation is not None]
+    return '0Z' if len(vertex) == 0 else ':'.join(vertex)
 
 def apply_mutations(diagonal, variations, genotype):
     """Apply mutations to given genotype"""
-    mutations_list = []
-    for l in genotype.split(':'):
-        if l[:-1] in variations:
-            if  diagonal.get(l[:-1]) != 'Z':
-                mutations_list.append(str(l[:-1]) + diagonal.get(l[:-1]))
-            else:
-                continue
-        else:
-            mutations_list.append(l)
-
-    genotype_line = '0Z' if len(mutations_list) == 0 else ':'.join(mutations_list)
-
-    return genotype_line
-    
-
-if __name__ == '__main__':   
+    slots, edits = diagonal_edits(diagonal, genotype)
+    positions = list(diagonal)
+    return apply_edits(slots, edits, [positions.index(position) for position in variations])
+
+def vertex_masks(dimension: int) -> list:
+    """Return indices of the mutations of the diagonal applied to the first
+       genotype for every vertex of the hypercube of 'dimension' but the first one,
+       in the order of the output (see 'get_combinations')."""
+    return list(get_combinations(range(dimension)))[1:]
+
+def expand_line(line: str, masks: dict) -> str:
+    """
+    Return the expanded representation of the hypercube given by 'line'
+    (diagonal, first genotype, last genotype) as the diagonal followed
+    by the comma-separated list of all its genotypes.
+
+    The first genotype is split only once: each mutation of the diagonal
+    becomes an edit of one slot of the genotype (see 'diagonal_edits'),
+    and every vertex is made by applying the edits of its mask. 'masks'
+    caches 'vertex_masks' for every dimension.
+    """
+    cols = line.replace('\n', '').split('\t')
+    diagonal = cols[0]
+    first_genotype = cols[1]
+    slots, edits = diagonal_edits(diagonal_to_dict(diagonal.split(':')), first_genotype)
+
+    dimension = len(edits)
+    if dimension not in masks:
+        masks[dimension] = vertex_masks(dimension)
+
+    genotypes = [first_genotype]
+    genotypes.extend(apply_edits(slots, edits, mask) for mask in masks[dimension])
+    return diagonal + '\t' + ', '.join(genotypes)
+
+def expand_range(input_file_name: str, start: int, end: int, output_file_name: str, compression: str = None):
+    """Expand hypercubes of the lines of 'input_file_name' starting in the
+       byte range from 'start' to 'end' and append them to 'output_file_name'
+       compressed with 'compression'. For the compressed input the range is
+       given by the virtual offset and the number of lines (see 'ch.read_lines')."""
+    if ch.compression_of(input_file_name) is not None:
+        lines = ch.read_lines(input_file_name, start, end)
+    else:
+        lines = (line.decode() for line in aux.read_lines_in_range(input_file_name, start, end))
+    masks = dict()
+    with ch.BlockWriter(output_file_name, compression) as out_fh:
+        for line in lines:
+            out_fh.write(expand_line(line, masks) + '\n')
+
+def expand_hypercubes(input_file_name: str, output_file_name: str, cores: int = 1):
+    """Expand hypercubes of 'input_file_name' into 'output_file_name' streaming
+       the lines. The input is split into 'cores' ranges expanded in parallel
+       into parts, which are appended to the output in the order of ranges.
+       The compressed input is split by its index of diagonal groups, without
+       the index it is read sequentially. The output is compressed if its
+       name ends with '.gz' or '.xz'."""
+    compression = ch.compression_of_name(output_file_name)
+    with ch.BlockWriter(output_file_name, compression) as out_fh:
+        out_fh.write('diagonal \t variations\n')
+
+    if ch.compression_of(input_file_name) is None:
+        bounds = aux.split_into_ranges(input_file_name, cores)
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+    elif os.path.isfile(aux.index_file_name(input_file_name)):
+        ranges = ch.split_index(aux.read_index(aux.index_file_name(input_file_name)), cores)
+    else:
+        ranges = [(None, None)]
+    if len(ranges) == 1:
+        expand_range(input_file_name, *ranges[0], output_file_name, compression)
+        return
+
+    part_file_names = [output_file_name + '.' + str(i) for i in range(len(ranges))]
+    for part_file_name in part_file_names:
+        open(part_file_name, 'w').close()
+    with mp.Pool(processes=cores) as pool:
+        pool.starmap(expand_range, [(input_file_name, start, end, part_file_name, compression)
+                                    for (start, end), part_file_name in zip(ranges, part_file_names)])
+    aux.append_files(part_file_names, output_file_name)
+
+
+if __name__ == '__main__':
     start_time = time.time()
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--hypercubes', help='the filename with the list of identified hypercubes (output of "HypercubeME.py")', required=True)
-    parser.add_argument('-o', '--output_file', help='the filename to write extended hypercubes, "*_expanded.txt" by default')
+    parser.add_argument('-o', '--output_file', help='the filename to write extended hypercubes, "*_expanded.txt" by default, '
+                                                    'compressed if the name ends with ".gz" or ".xz"')
+    parser.add_argument('-c', '--cores', help='the number of cores to be used in calculation, one by default',
+                        type=int, default=1)
     args = parser.parse_args()
 
     print('Expand hypercubes ================')
@@ -48,43 +147,22 @@ if __name__ == '__main__':
         exit()
 
     if args.output_file is None:
-        args.output_file = '{0}_expanded.txt'.format(os.path.splitext(os.path.basename(args.hypercubes))[0])
+        # The compressed input gets the compressed output
+        input_name = os.path.basename(args.hypercubes)
+        args.output_file = '{0}_expanded.txt{1}'.format(os.path.splitext(ch.strip_extension(input_name))[0],
+                                                        input_name[len(ch.strip_extension(input_name)):])
 
     if  os.path.isfile(args.output_file):
         print('ERROR: file {0} already exists, please rename/remove existing file or specify output file name with argument -of'.format(args.output_file))
         exit()
-        
+
     print('Start processing file: {0}'.format(args.hypercubes))
 
     try:
-        with open(args.hypercubes, 'r') as f:
-            f.readline()
-            rows = []
-            rows.append('diagonal \t variations')
-            for line in f:
-                line = line.replace('\n','')
-                cols = line.split('\t')
-                
-                diagonal = cols[0]
-                diagonal_dict = diagonal_to_dict(diagonal.split(':'))
-                first_genotype = cols[1]
-                
-                genotypes = []
-                genotypes.append(first_genotype)
-                diagonal_variations = list(get_combinations(diagonal_dict))[1:]
-                
-                for variations in diagonal_variations:
-                    m_genotype = apply_mutations(diagonal_dict, variations, first_genotype)
-                    genotypes.append(m_genotype)
-                
-                rows.append(diagonal + '\t' + ', '.join(genotypes))
-    except:
+        expand_hypercubes(args.hypercubes, args.output_file, args.cores)
+    except Exception:
         print('ERROR: fail while reading file: please, be sure that the format of the input file is correct')
         exit()
-        
-    with open(args.output_file, 'w') as out_fh:
-        for row in rows:
-            print(row, file=out_fh)
 
     print('Expanding complete')
     print('Elapsed time: {0}'.format(time.time()-start_time))
@@ -0,0 +1,103 @@
+"""
+Merge of shards of hypercubes written by nodes sharing a folder.
+
+Nodes run 'HypercubeME.py --shard i/n' with the same arguments on a folder
+of a shared file system. Diagonal groups of every dimension are divided
+into the same tasks on every node and assigned to shards by their costs
+(see 'HypercubeME.select_shard'), so for every dimension N the node i
+writes its sorted hypercubes into the file
+
+    hypercubes_N.shard_i_of_n.txt
+
+This command waits for the files of all n shards, merges them into the
+file with hypercubes of dimension N (and its index) and removes them.
+Nodes wait for the merged file to generate the next dimension. Every file
+is written under a temporary name and renamed when complete, and the index
+is published before the file with hypercubes and only if there are
+hypercubes; nodes and this command stop once no diagonal group of the
+index has more than one hypercube. Interrupted nodes and merges are
+restarted with the same arguments, complete files are reused.
+"""
+import os
+import time
+import argparse
+import auxiliary as aux
+import compressed_hypercubes as ch
+import HypercubeME as hm
+
+# Maximum number of open files, see 'HypercubeME.py'
+MAX_OPEN_FILES = 1021
+
+
+def merge_shards(folder: str, dimension: int, shards: int, cores: int = 1, compression: str = None,
+                 front_coding: bool = False) -> bool:
+    """
+    Wait for the files of all 'shards' of 'dimension' in 'folder' and merge
+    them on 'cores' cores into the file with hypercubes, compressed with
+    'compression' and front-coded with 'front_coding' if given
+    (see compressed_hypercubes.py).
+
+    Returns True if there are hypercubes of 'dimension'.
+    """
+    output_file_name = folder + '/' + hm.hypercube_file_name(dimension, False, compression)
+    index_file_name = aux.index_file_name(output_file_name)
+    if os.path.isfile(output_file_name):
+        # Merged before the interruption
+        return os.path.isfile(index_file_name)
+
+    shard_file_names = [folder + '/' + hm.shard_file_name(dimension, shard, shards) for shard in range(1, shards + 1)]
+    for shard_file_name in shard_file_names:
+        hm.wait_for_file(shard_file_name)
+
+    ch.write_header(output_file_name + '.tmp', compression)
+    found = aux.merge_sorted_files(hm.remove_empty_files(shard_file_names), MAX_OPEN_FILES,
+                                   output_file_name + '.tmp', index_file_name + '.tmp', cores, compression,
+                                   front_coding)
+    if found:
+        os.replace(index_file_name + '.tmp', index_file_name)
+    os.replace(output_file_name + '.tmp', output_file_name)
+    return found
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+
+    parser = argparse.ArgumentParser(description='Merge shards of hypercubes written by "HypercubeME.py --shard i/n"')
+    parser.add_argument('-d', '--folder', help='the folder shared by nodes, "hypercubes" by default',
+                        default='hypercubes')
+    parser.add_argument('-n', '--shards', help='the number of shards', type=int, required=True)
+    parser.add_argument('-c', '--cores', help='the number of cores to be used in merging, one by default',
+                        type=int, default=1)
+    parser.add_argument('--compress', help='compress the merged files as "HypercubeME.py --compress" does',
+                        choices=sorted(ch.EXTENSIONS))
+    parser.add_argument('--front-coding', help='with --compress, omit the diagonal repeating the diagonal of the '
+                                               'previous line', action='store_true')
+    parser.add_argument('--first-dim', help='the first dimension generated by nodes, one by default or the '
+                                            'dimension following the one of hypercubes given to nodes with -p',
+                        type=int, default=1)
+    parser.add_argument('--max-dim', help='the maximal dimension given to nodes, all dimensions by default',
+                        type=int)
+    args = parser.parse_args()
+
+    print('Merge shards ================')
+    if args.shards < 1:
+        print('ERROR: The number of shards must be positive')
+        exit(1)
+    if args.front_coding and args.compress is None:
+        print('ERROR: Front coding is applied to compressed files only, use it with --compress')
+        exit(1)
+    os.makedirs(args.folder, exist_ok=True)
+
+    dimension = args.first_dim
+    while args.max_dim is None or dimension <= args.max_dim:
+        print('Merge {0} shards of hypercubes for dimension {1}'.format(args.shards, dimension))
+        if not merge_shards(args.folder, dimension, args.shards, args.cores, args.compress, args.front_coding):
+            break
+        # Nodes stop too if no hypercubes can be paired
+        if not hm.has_parallel_hypercubes(args.folder + '/' + hm.hypercube_file_name(dimension, False,
+                                                                                     args.compress)):
+            break
+        dimension += 1
+
+    print('Merging complete')
+    print('Elapsed time: {0}'.format(time.time() - start_time))
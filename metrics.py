@@ -0,0 +1,202 @@
+"""
+Metrics of the run of HypercubeME.
+
+Workers measure every task run by 'HypercubeME.call_measured': its wall
+time, pairs of genotypes (or hypercubes) compared and emitted, the slowest
+and the largest diagonal groups and the peak resident set size of the
+worker. Measurements are returned with the results of tasks and collected
+in the main process by the active 'RunMetrics' (see 'activate') together
+with wall times of stages, bytes written by tasks and bytes merged into
+the files with hypercubes of every dimension.
+"""
+import os
+import sys
+import json
+import time
+import heapq
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Number of the slowest and of the largest diagonal groups kept
+TOP_GROUPS = 10
+
+# Measurements of the task being run in this process, None outside of tasks
+task = None
+
+# Metrics of the run collected in the main process, None if not collected
+active = None
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of this process in megabytes, None without 'resource'."""
+    if resource is None:
+        return None
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20
+
+
+def start_task():
+    """Start measurements of the task run in this process."""
+    global task
+    task = {'start': time.perf_counter(), 'compared': 0, 'emitted': 0, 'slowest_groups': list(),
+            'largest_groups': list()}
+
+
+def finish_task() -> dict:
+    """Finish and return measurements of the task run in this process."""
+    global task
+    measurements = task
+    measurements['seconds'] = time.perf_counter() - measurements.pop('start')
+    measurements['rss_mb'] = peak_rss_mb()
+    task = None
+    return measurements
+
+
+def keep_top(heap: list, item: tuple):
+    """Keep 'item' in the min-heap 'heap' of at most TOP_GROUPS items."""
+    if len(heap) < TOP_GROUPS:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def add_pairs(compared: int, emitted: int):
+    """Count pairs 'compared' and 'emitted' as hypercubes by the task."""
+    task['compared'] += compared
+    task['emitted'] += emitted
+
+
+def add_group(diagonal: str, size: int, compared: int, emitted: int, seconds: float):
+    """Count pairs of the diagonal group of 'size' hypercubes processed in 'seconds' by the task."""
+    add_pairs(compared, emitted)
+    keep_top(task['slowest_groups'], (seconds, size, diagonal))
+    keep_top(task['largest_groups'], (size, seconds, diagonal))
+
+
+def activate(run_metrics):
+    """Make 'run_metrics' collect measurements of tasks run in the main process."""
+    global active
+    active = run_metrics
+
+
+class RunMetrics:
+    """
+    Metrics of the run collected dimension by dimension.
+
+    With 'progress', the progress line of finished tasks is updated
+    while the tasks of the dimension run.
+    """
+
+    def __init__(self, arguments: dict = None, progress: bool = False):
+        self.start = time.perf_counter()
+        self.arguments = arguments
+        self.progress = progress
+        self.dimensions: dict = dict()
+        self.current = None
+        self.lap_start = self.start
+        self.total_tasks = 0
+
+    def dimension(self, dimension: int = None) -> dict:
+        """Return metrics of 'dimension', of the current one by default."""
+        if dimension is None:
+            dimension = self.current
+        if dimension not in self.dimensions:
+            self.dimensions[dimension] = {'dimension': dimension, 'stages': dict(), 'task_seconds': list(),
+                                          'compared': 0, 'emitted': 0, 'bytes_written': 0, 'bytes_merged': 0,
+                                          'worker_rss_mb': None, 'slowest_groups': list(), 'largest_groups': list()}
+        return self.dimensions[dimension]
+
+    def start_dimension(self, dimension: int):
+        """Make 'dimension' the current one and start timing its stages."""
+        self.current = dimension
+        self.lap_start = time.perf_counter()
+
+    def lap(self, stage: str):
+        """Add the wall time since the previous lap to the 'stage' of the current dimension."""
+        now = time.perf_counter()
+        stages = self.dimension()['stages']
+        stages[stage] = stages.get(stage, 0) + now - self.lap_start
+        self.lap_start = now
+
+    def start_tasks(self, total: int):
+        """Start the progress of 'total' tasks of the current dimension."""
+        self.total_tasks = total
+        self.show_progress()
+
+    def add_task(self, measurements: dict):
+        """Add 'measurements' of the finished task to the current dimension."""
+        metrics = self.dimension()
+        metrics['task_seconds'].append(measurements['seconds'])
+        metrics['compared'] += measurements['compared']
+        metrics['emitted'] += measurements['emitted']
+        if measurements['rss_mb'] is not None:
+            metrics['worker_rss_mb'] = max(metrics['worker_rss_mb'] or 0, measurements['rss_mb'])
+        for key in ('slowest_groups', 'largest_groups'):
+            for item in measurements[key]:
+                keep_top(metrics[key], tuple(item))
+        self.show_progress()
+
+    def add_bytes(self, written: int = 0, merged: int = 0):
+        """Add bytes 'written' by tasks and 'merged' into the file of the current dimension."""
+        metrics = self.dimension()
+        metrics['bytes_written'] += written
+        metrics['bytes_merged'] += merged
+
+    def show_progress(self):
+        if not self.progress or self.total_tasks == 0:
+            return
+        metrics = self.dimension()
+        print('\r  {0}/{1} tasks, {2} hypercubes, {3:.1f} s'.format(
+            len(metrics['task_seconds']), self.total_tasks, metrics['emitted'], time.perf_counter() - self.start),
+            end='', flush=True)
+        if len(metrics['task_seconds']) >= self.total_tasks:
+            print()
+            self.total_tasks = 0
+
+    def summary(self, dimension: int = None) -> list:
+        """Return lines describing stages, tasks and the slowest diagonal groups of 'dimension'."""
+        metrics = self.dimension(dimension)
+        lines = ['Stages: ' + ', '.join('{0} {1:.2f} s'.format(name, seconds)
+                                        for name, seconds in metrics['stages'].items())]
+        task_seconds = metrics['task_seconds']
+        if len(task_seconds) > 0:
+            mean = sum(task_seconds) / len(task_seconds)
+            lines.append('Tasks: {0}, slowest {1:.2f} s, mean {2:.2f} s, imbalance {3:.1f}; pairs compared {4}, '
+                         'emitted {5}'.format(len(task_seconds), max(task_seconds), mean,
+                                              max(task_seconds) / mean if mean > 0 else 1.0,
+                                              metrics['compared'], metrics['emitted']))
+        if len(metrics['slowest_groups']) > 0:
+            seconds, size, diagonal = max(metrics['slowest_groups'])
+            lines.append('Slowest diagonal group: {0} of {1} hypercubes, {2:.3f} s'.format(diagonal, size, seconds))
+        return lines
+
+    def to_dict(self) -> dict:
+        """Return all metrics ready to be written as JSON."""
+        dimensions = list()
+        for dimension in sorted(self.dimensions):
+            metrics = dict(self.dimensions[dimension])
+            task_seconds = metrics['task_seconds']
+            metrics['seconds'] = sum(metrics['stages'].values())
+            metrics['tasks'] = len(task_seconds)
+            if len(task_seconds) > 0:
+                mean = sum(task_seconds) / len(task_seconds)
+                metrics['imbalance'] = max(task_seconds) / mean if mean > 0 else 1.0
+            metrics['slowest_groups'] = [{'diagonal': diagonal, 'size': size, 'seconds': seconds}
+                                         for seconds, size, diagonal in sorted(metrics['slowest_groups'],
+                                                                               reverse=True)]
+            metrics['largest_groups'] = [{'diagonal': diagonal, 'size': size, 'seconds': seconds}
+                                         for size, seconds, diagonal in sorted(metrics['largest_groups'],
+                                                                               reverse=True)]
+            dimensions.append(metrics)
+        return {'arguments': self.arguments, 'seconds': time.perf_counter() - self.start,
+                'rss_mb': peak_rss_mb(), 'dimensions': dimensions}
+
+    def write(self, output_file_name: str):
+        """Write metrics as JSON into 'output_file_name' under a temporary name renamed at the end."""
+        with open(output_file_name + '.tmp', 'w') as fh:
+            json.dump(self.to_dict(), fh, indent=1)
+        os.replace(output_file_name + '.tmp', output_file_name)
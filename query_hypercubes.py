@@ -0,0 +1,311 @@
+"""
+Queries over the folder with hypercubes (output of "HypercubeME.py").
+
+Hypercubes with the given diagonal are found in the file of its dimension
+by the index of diagonal groups written next to the file (see
+'aux.read_index'), or, for the uncompressed file without index, by binary
+search over byte offsets of the sorted file.
+
+Hypercubes containing the given genotype are found in the vertex index
+built by 'build_vertex_index' next to the file with hypercubes: the sorted
+file 'hypercubes_N.txt.vtx' has the line
+
+    genotype <tab> diagonal <tab> first genotype <tab> last genotype
+
+for every vertex of every hypercube (vertices are found by
+'expand_hypercubes.apply_mutations'), the genotype being written with
+mutations ordered by positions. It is searched by binary search over byte
+offsets too. Without the vertex index, or if the file with hypercubes is
+newer than its vertex index, the file with hypercubes is scanned.
+
+The whole folder is exported into the SQLite database with the tables
+
+    hypercubes (id, dimension, diagonal, first, last)   indexed by diagonal
+    vertices (genotype, hypercube)                      indexed by genotype
+
+by 'export_sqlite'.
+"""
+import os
+import re
+import time
+import argparse
+import multiprocessing as mp
+import auxiliary as aux
+import compressed_hypercubes as ch
+import expand_hypercubes as ex
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# Vertices sorted in memory at once while the vertex index is built
+BATCH_SIZE = 1000000
+
+# Maximum number of open files, see 'HypercubeME.py'
+MAX_OPEN_FILES = 1021
+
+
+def hypercube_files(folder: str, maximal: bool = False) -> dict:
+    """Return names of the text files with hypercubes (maximal ones with
+       'maximal') in 'folder' as the dictionary {dimension: file name}."""
+    pattern = re.compile(('maximal_' if maximal else '') + r'hypercubes_(\d+)\.txt(\.gz|\.xz)?')
+    files = dict()
+    for file_name in os.listdir(folder):
+        match = pattern.fullmatch(file_name)
+        if match is not None:
+            files[int(match.group(1))] = folder + '/' + file_name
+    return files
+
+
+def vertex_index_file_name(hypercube_file_name: str) -> str:
+    """Return the name of the vertex index of 'hypercube_file_name'."""
+    return hypercube_file_name + '.vtx'
+
+
+def canonical_genotype(genotype: str) -> str:
+    """Return 'genotype' with mutations ordered by positions, wild-type ('', 'wt' or '0Z') being '0Z'."""
+    mutations = [mutation for mutation in genotype.split(':') if mutation not in ('', 'wt') and
+                 mutation[-1] != 'Z']
+    if len(mutations) == 0:
+        return '0Z'
+    return ':'.join(sorted(mutations, key=lambda mutation: int(mutation[:-1])))
+
+
+def canonical_diagonal(diagonal: str) -> str:
+    """Return 'diagonal' with mutations ordered alphabetically as in the files with hypercubes."""
+    return ':'.join(sorted(diagonal.split(':')))
+
+
+def contains(line: str, genotype: str) -> bool:
+    """Return True if the hypercube of 'line' has the canonical 'genotype' as a vertex."""
+    diagonal, first, _ = line.rstrip('\n').split('\t')
+    changed = dict((int(mutation[1:-1]), (mutation[0], mutation[-1])) for mutation in diagonal.split(':'))
+    background = dict((int(mutation[:-1]), mutation[-1]) for mutation in first.split(':') if mutation[-1] != 'Z')
+    variants = dict((int(mutation[:-1]), mutation[-1]) for mutation in genotype.split(':') if mutation[-1] != 'Z')
+    for position in set(variants).union(background, changed):
+        variant = variants.get(position, 'Z')
+        if position in changed:
+            if variant not in changed[position]:
+                return False
+        elif variant != background.get(position, 'Z'):
+            return False
+    return True
+
+
+def read_sorted_group(file_name: str, key: str, start: int = 0) -> list:
+    """Return lines starting with 'key' of the uncompressed sorted file
+       'file_name' found by binary search, lines before the byte 'start' are skipped."""
+    lines = list()
+    encoded_key = key.encode()
+    with open(file_name, 'rb') as fh:
+        fh.seek(aux.find_line(fh, encoded_key, os.path.getsize(file_name), start))
+        for line in fh:
+            if not line.startswith(encoded_key):
+                break
+            lines.append(line.decode().rstrip('\r\n') + '\n')
+    return lines
+
+
+def header_size(file_name: str) -> int:
+    """Return the size in bytes of the header of the uncompressed file."""
+    with open(file_name, 'rb') as fh:
+        return len(fh.readline())
+
+
+def find_diagonal(hypercube_file_name: str, diagonal: str) -> list:
+    """Return lines of 'hypercube_file_name' with hypercubes having 'diagonal'."""
+    key = canonical_diagonal(diagonal) + '\t'
+    index_file_name = aux.index_file_name(hypercube_file_name)
+    if os.path.isfile(index_file_name):
+        entries = read_sorted_group(index_file_name, key, header_size(index_file_name))
+        if len(entries) == 0:
+            return list()
+        _, offset, count = entries[0].rstrip('\n').split('\t')
+        return list(ch.read_lines(hypercube_file_name, int(offset), int(count)))
+    if ch.compression_of(hypercube_file_name) is None:
+        return read_sorted_group(hypercube_file_name, key, header_size(hypercube_file_name))
+    return [line for line in ch.read_lines(hypercube_file_name) if line.startswith(key)]
+
+
+def find_genotype(hypercube_file_name: str, genotype: str) -> list:
+    """Return lines of 'hypercube_file_name' with hypercubes having 'genotype' as a vertex."""
+    genotype = canonical_genotype(genotype)
+    vertex_file_name = vertex_index_file_name(hypercube_file_name)
+    if os.path.isfile(vertex_file_name) and os.path.getmtime(vertex_file_name) >= os.path.getmtime(
+            hypercube_file_name):
+        return [line[len(genotype) + 1:] for line in read_sorted_group(vertex_file_name, genotype + '\t')]
+    return [line for line in ch.read_lines(hypercube_file_name) if contains(line, genotype)]
+
+
+def query_diagonal(folder: str, diagonal: str, maximal: bool = False) -> list:
+    """Return lines with hypercubes having 'diagonal' from the file of its
+       dimension in 'folder' (see 'hypercube_files')."""
+    file_name = hypercube_files(folder, maximal).get(len(diagonal.split(':')))
+    return list() if file_name is None else find_diagonal(file_name, diagonal)
+
+
+def query_genotype(folder: str, genotype: str, maximal: bool = False, dimensions: list = None) -> list:
+    """Return hypercubes having 'genotype' as a vertex from the files of
+       'dimensions' (all by default) in 'folder' as tuples (dimension, line)."""
+    found = list()
+    for dimension, file_name in sorted(hypercube_files(folder, maximal).items()):
+        if dimensions is None or dimension in dimensions:
+            found.extend((dimension, line) for line in find_genotype(file_name, genotype))
+    return found
+
+
+def hypercube_vertices(line: str) -> list:
+    """Return all genotypes of the hypercube of 'line' made by 'ex.apply_mutations'
+       for every variation of its diagonal, the first genotype included."""
+    diagonal, first, _ = line.rstrip('\n').split('\t')
+    diagonal_dict = ex.diagonal_to_dict(diagonal.split(':'))
+    return [ex.apply_mutations(diagonal_dict, variations, first) for variations in ex.get_combinations(diagonal_dict)]
+
+
+def iter_vertices(hypercube_file_name: str):
+    """Yield tuples (canonical genotype, line) for every vertex of every hypercube of 'hypercube_file_name'."""
+    for line in ch.read_lines(hypercube_file_name):
+        for vertex in hypercube_vertices(line):
+            yield canonical_genotype(vertex), line
+
+
+def build_vertex_index(hypercube_file_name: str, cores: int = 1) -> int:
+    """
+    Write the vertex index of 'hypercube_file_name' (see the description
+    of the module). Vertices are sorted in batches of BATCH_SIZE written
+    into temporary files merged on 'cores' cores.
+
+    Returns
+    -------
+        num_vertices : int
+            The number of written vertices.
+    """
+    output_file_name = vertex_index_file_name(hypercube_file_name)
+    sorted_file_names = list()
+    batch = list()
+    num_vertices = 0
+    for genotype, line in iter_vertices(hypercube_file_name):
+        batch.append(genotype + '\t' + line.rstrip('\n'))
+        if len(batch) >= BATCH_SIZE:
+            sorted_file_names.append(output_file_name + '.' + str(len(sorted_file_names)))
+            aux.write_sorted_lines(batch, sorted_file_names[-1])
+            num_vertices += len(batch)
+            batch = list()
+    if len(batch) > 0:
+        sorted_file_names.append(output_file_name + '.' + str(len(sorted_file_names)))
+        aux.write_sorted_lines(batch, sorted_file_names[-1])
+        num_vertices += len(batch)
+
+    open(output_file_name + '.tmp', 'w').close()
+    aux.merge_sorted_files(sorted_file_names, MAX_OPEN_FILES, output_file_name + '.tmp', None, cores)
+    os.replace(output_file_name + '.tmp', output_file_name)
+    return num_vertices
+
+
+def build_vertex_indices(folder: str, maximal: bool = False, cores: int = 1) -> dict:
+    """Build vertex indices of all files with hypercubes in 'folder', every
+       file on its own core, and return the numbers of vertices by dimensions."""
+    files = hypercube_files(folder, maximal)
+    dimensions = sorted(files)
+    if cores == 1 or len(dimensions) == 1:
+        return dict((dimension, build_vertex_index(files[dimension], cores)) for dimension in dimensions)
+    with mp.Pool(processes=min(cores, len(dimensions))) as pool:
+        counts = pool.map(build_vertex_index, [files[dimension] for dimension in dimensions])
+    return dict(zip(dimensions, counts))
+
+
+def export_sqlite(folder: str, database_file_name: str, maximal: bool = False) -> int:
+    """
+    Export hypercubes of the files in 'folder' together with their vertices
+    into the SQLite database 'database_file_name' (see the description of
+    the module). The database is written under a temporary name and renamed.
+
+    Returns
+    -------
+        num_hypercubes : int
+            The number of exported hypercubes.
+    """
+    if os.path.isfile(database_file_name + '.tmp'):
+        os.remove(database_file_name + '.tmp')
+    connection = sqlite3.connect(database_file_name + '.tmp')
+    connection.execute('CREATE TABLE hypercubes (id INTEGER PRIMARY KEY, dimension INTEGER, diagonal TEXT, '
+                       'first TEXT, last TEXT)')
+    connection.execute('CREATE TABLE vertices (genotype TEXT, hypercube INTEGER)')
+    num_hypercubes = 0
+    for dimension, file_name in sorted(hypercube_files(folder, maximal).items()):
+        hypercubes = list()
+        vertices = list()
+        for line in ch.read_lines(file_name):
+            num_hypercubes += 1
+            hypercubes.append([num_hypercubes, dimension] + line.rstrip('\n').split('\t'))
+            vertices.extend((canonical_genotype(genotype), num_hypercubes) for genotype in hypercube_vertices(line))
+            if len(vertices) >= BATCH_SIZE:
+                connection.executemany('INSERT INTO hypercubes VALUES (?, ?, ?, ?, ?)', hypercubes)
+                connection.executemany('INSERT INTO vertices VALUES (?, ?)', vertices)
+                hypercubes = list()
+                vertices = list()
+        connection.executemany('INSERT INTO hypercubes VALUES (?, ?, ?, ?, ?)', hypercubes)
+        connection.executemany('INSERT INTO vertices VALUES (?, ?)', vertices)
+    connection.execute('CREATE INDEX hypercubes_diagonal ON hypercubes (diagonal)')
+    connection.execute('CREATE INDEX vertices_genotype ON vertices (genotype)')
+    connection.commit()
+    connection.close()
+    os.replace(database_file_name + '.tmp', database_file_name)
+    return num_hypercubes
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+
+    parser = argparse.ArgumentParser(description='Find hypercubes (output of "HypercubeME.py") by diagonals and '
+                                                 'genotypes')
+    parser.add_argument('-d', '--folder', help='the folder with hypercubes, "hypercubes" by default',
+                        default='hypercubes')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--diagonal', help='print hypercubes with the diagonal (example: "A0C:A2T")')
+    group.add_argument('--genotype', help='print hypercubes having the genotype (example: "0C:2T", "wt" for '
+                                          'wild-type) as a vertex')
+    group.add_argument('--build', help='build vertex indices of all files with hypercubes', action='store_true')
+    group.add_argument('--sqlite', help='export hypercubes and their vertices into the SQLite database')
+    parser.add_argument('--dim', help='with --genotype, comma-separated dimensions of hypercubes, all by default')
+    parser.add_argument('--maximal', help='use the files with maximal hypercubes "maximal_hypercubes_*.txt"',
+                        action='store_true')
+    parser.add_argument('-c', '--cores', help='the number of cores to be used in building indices, one by default',
+                        type=int, default=1)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        print('ERROR: folder {0} doesn\'t exist'.format(args.folder))
+        exit(1)
+    if len(hypercube_files(args.folder, args.maximal)) == 0:
+        print('ERROR: folder {0} has no text files with hypercubes'.format(args.folder))
+        exit(1)
+
+    if args.diagonal is not None:
+        for line in query_diagonal(args.folder, args.diagonal, args.maximal):
+            print(line, end='')
+    elif args.genotype is not None:
+        try:
+            dimensions = None if args.dim is None else [int(dimension) for dimension in args.dim.split(',')]
+        except ValueError:
+            print('ERROR: Dimensions must look like "2,3", got "{0}"'.format(args.dim))
+            exit(1)
+        for dimension, line in query_genotype(args.folder, args.genotype, args.maximal, dimensions):
+            print(line, end='')
+    elif args.build:
+        print('Build vertex indices ================')
+        for dimension, num_vertices in sorted(build_vertex_indices(args.folder, args.maximal, args.cores).items()):
+            print('Dimension {0}: {1} vertices'.format(dimension, num_vertices))
+        print('Elapsed time: {0}'.format(time.time() - start_time))
+    else:
+        if sqlite3 is None:
+            print('ERROR: Python is built without the sqlite3 module')
+            exit(1)
+        if os.path.isfile(args.sqlite):
+            print('ERROR: file {0} already exists, please rename/remove existing file'.format(args.sqlite))
+            exit(1)
+        print('Export into SQLite ================')
+        print('Exported {0} hypercubes'.format(export_sqlite(args.folder, args.sqlite, args.maximal)))
+        print('Elapsed time: {0}'.format(time.time() - start_time))
+        print('Database saved as {0}'.format(args.sqlite))
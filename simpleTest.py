@@ -1,6 +1,25 @@
 import unittest
 import os
+import sys
+import subprocess
+import shutil
+import tempfile
 from utils import *
+import auxiliary as aux
+import binary_hypercubes as bh
+import compressed_hypercubes as ch
+import epistasis as ep
+import benchmark
+import direct_hypercubes as dh
+import expand_hypercubes as ex
+import query_hypercubes as qh
+import HypercubeME as hm
+from HypercubeME import iter_hypercubes
+
+
+def run_hypercubeme(*args):
+    """Run HypercubeME.py with the command line arguments 'args' and fail the test if it fails."""
+    subprocess.run([sys.executable, 'HypercubeME.py'] + list(args), check=True, stdout=subprocess.DEVNULL)
 
 
 class TestHypercubes(unittest.TestCase):
@@ -23,6 +42,399 @@ class TestHypercubes(unittest.TestCase):
             read_file_with_hypercubes('test_expected/hypercubes_3.txt'),
             read_file_with_hypercubes('test_complete_03/hypercubes_3.txt'))
 
+    def test_single_mutant_index(self):
+        genotypes = aux.read_genotypes('test_complete_03.txt')
+        mutations, encoded = aux.intern_genotypes(genotypes)
+        expected = set()
+        for i in range(len(genotypes)):
+            for j in range(i + 1, len(genotypes)):
+                direction, delta = aux.get_delta(genotypes[i], genotypes[j])
+                if len(delta) == 1:
+                    expected.add((delta[0], i, j) if direction == 'forward' else (delta[0], j, i))
+        found = set()
+        for position, members in aux.index_single_mutants(encoded, *aux.split_mutations(mutations)):
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    found.add((members[i][0] + position + members[j][0], members[i][1], members[j][1]))
+        self.assertEqual(expected, found)
+
+    def test_iter_hypercubes(self):
+        expected = list()
+        for dimension in range(1, 4):
+            with open('test_expected/hypercubes_{0}.txt'.format(dimension), 'r') as fh:
+                next(fh)
+                expected.extend(tuple(line.rstrip('\n').split('\t')) for line in fh)
+        self.assertEqual(expected, list(iter_hypercubes('test_complete_03.txt')))
+        self.assertEqual(expected[:12], list(iter_hypercubes('test_complete_03.txt', max_dim=1, cores=2)))
+        self.assertEqual([hypercube for hypercube in expected if len(hypercube[0].split(':')) == 2 and
+                          all(mutation[1:-1] in ('0', '1') for mutation in hypercube[0].split(':'))],
+                         list(iter_hypercubes('test_complete_03.txt', min_dim=2, positions=[0, 1])))
+
+    def test_compressed_file(self):
+        with open('test_expected/hypercubes_2.txt', 'r') as fh:
+            next(fh)
+            lines = [line.rstrip('\r\n') + '\n' for line in fh]
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = folder + '/hypercubes_2.txt.gz'
+            ch.write_hypercube_file(lines, file_name, 'gzip', True, aux.index_file_name(file_name))
+            self.assertEqual(lines, list(ch.read_lines(file_name)))
+            for diagonal, offset, count in aux.read_index(aux.index_file_name(file_name)):
+                self.assertEqual([line for line in lines if line.startswith(diagonal + '\t')],
+                                 list(ch.read_lines(file_name, offset, count)))
+
+    def test_update(self):
+        with open('test_complete_03.txt', 'r') as fh:
+            lines = fh.readlines()
+        with tempfile.TemporaryDirectory() as folder:
+            with open(folder + '/old.txt', 'w') as fh:
+                fh.writelines(lines[:5])
+            with open(folder + '/new.txt', 'w') as fh:
+                fh.writelines(lines[:1] + lines[3:])
+            hypercubes = dict()
+            for diagonal, start, end in iter_hypercubes(folder + '/old.txt'):
+                hypercubes.setdefault(len(diagonal.split(':')), list()).append('\t'.join((diagonal, start, end)) + '\n')
+            for dimension, dimension_lines in hypercubes.items():
+                file_name = folder + '/hypercubes_{0}.txt'.format(dimension)
+                ch.write_hypercube_file(dimension_lines, file_name, index_file_name=aux.index_file_name(file_name))
+            hm.update_hypercubes(1, folder + '/old.txt', folder + '/new.txt', folder, 1021)
+            for dimension in (1, 2, 3):
+                self.assertEqual(
+                    read_file_with_hypercubes('test_expected/hypercubes_{0}.txt'.format(dimension)),
+                    read_file_with_hypercubes(folder + '/hypercubes_{0}.txt'.format(dimension)))
+
+    def test_update_capped_run(self):
+        with open('test_complete_03.txt', 'r') as fh:
+            lines = fh.readlines()
+        with tempfile.TemporaryDirectory() as folder:
+            with open(folder + '/old.txt', 'w') as fh:
+                fh.writelines(lines[:1] + [line for ind, line in enumerate(lines[1:]) if ind % 5 > 0])
+            with open(folder + '/new.txt', 'w') as fh:
+                fh.writelines(lines[:1] + lines[1::5])
+            run_hypercubeme('-g', 'test_complete_03.txt', '-d', folder + '/full', '--max-dim', '2')
+            run_hypercubeme('-g', folder + '/old.txt', '-d', folder + '/run', '--max-dim', '2')
+            run_hypercubeme('-g', folder + '/old.txt', '--update', folder + '/new.txt', '-d', folder + '/run')
+            for dimension in (1, 2):
+                self.assertEqual(
+                    read_file_with_hypercubes(folder + '/full/hypercubes_{0}.txt'.format(dimension)),
+                    read_file_with_hypercubes(folder + '/run/hypercubes_{0}.txt'.format(dimension)))
+            self.assertFalse(os.path.exists(folder + '/run/hypercubes_3.txt'))
+
+    def test_update_batches(self):
+        with open('test_complete_03.txt', 'r') as fh:
+            lines = fh.readlines()
+        with tempfile.TemporaryDirectory() as folder:
+            with open(folder + '/old.txt', 'w') as fh:
+                fh.writelines(lines[:1] + [line for ind, line in enumerate(lines[1:]) if ind % 3 > 0])
+            with open(folder + '/first.txt', 'w') as fh:
+                fh.writelines(lines[:1] + lines[1::6])
+            with open(folder + '/second.txt', 'w') as fh:
+                fh.writelines(lines[:1] + lines[4::6])
+            run_hypercubeme('-g', folder + '/old.txt', '-d', folder + '/run')
+            # The batch applied again adds nothing, the second one is paired with the first one
+            for batch in ('first', 'first', 'second', 'second'):
+                run_hypercubeme('-g', folder + '/old.txt', '--update', folder + '/' + batch + '.txt', '-d',
+                                folder + '/run', '-c', '2')
+            for dimension in (1, 2, 3):
+                self.assertEqual(
+                    read_file_with_hypercubes('test_expected/hypercubes_{0}.txt'.format(dimension)),
+                    read_file_with_hypercubes(folder + '/run/hypercubes_{0}.txt'.format(dimension)))
+            self.assertEqual(len(lines), len(aux.read_genotypes(folder + '/run/genotypes.txt')) + 1)
+
+    def test_direct_dimension(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for dimension in (1, 2, 3):
+                file_name = folder + '/hypercubes_{0}.txt'.format(dimension)
+                dh.find_hypercubes('test_complete_03.txt', dimension, file_name, 2)
+                self.assertEqual(read_file_with_hypercubes('test_expected/hypercubes_{0}.txt'.format(dimension)),
+                                 read_file_with_hypercubes(file_name))
+            self.assertEqual(0, dh.find_hypercubes('test_complete_03.txt', 4, folder + '/hypercubes_4.txt'))
+
+    def test_query(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for dimension in (1, 2, 3):
+                shutil.copy('test_expected/hypercubes_{0}.txt'.format(dimension), folder)
+            lines = list(ch.read_lines(folder + '/hypercubes_2.txt'))
+            diagonal = lines[len(lines) // 2].split('\t')[0]
+            self.assertEqual([line for line in lines if line.startswith(diagonal + '\t')],
+                             qh.query_diagonal(folder, diagonal))
+            scanned = qh.query_genotype(folder, '0C:2T')
+            self.assertEqual(7, len(scanned))
+            qh.build_vertex_indices(folder)
+            self.assertEqual(scanned, qh.query_genotype(folder, '2T:0C'))
+
+    def test_landscapes(self):
+        self.assertEqual(27, len(set(benchmark.generate_landscape('complete:3:2'))))
+        sparse = benchmark.generate_landscape('sparse:10:3:500', seed=1)
+        self.assertEqual(500, len(set(sparse)))
+        dms = benchmark.generate_landscape('dms:20:19:1000', seed=1)
+        self.assertEqual(1000, len(set(dms)))
+        self.assertEqual(20 * 19, sum(1 for genotype in dms if len(genotype) == 1))
+
+    def test_shard_selection(self):
+        costs = [9, 1, 4, 4, 16, 1, 25, 1]
+        shards = [hm.select_shard(costs, shard, 3) for shard in range(1, 4)]
+        self.assertEqual(list(range(len(costs))), sorted(task for shard in shards for task in shard))
+        self.assertEqual([[6], [4, 1, 5], [0, 2, 3, 7]], shards)
+
+    def test_task_measurements(self):
+        mutations, genotypes = aux.intern_genotypes(aux.read_genotypes('test_complete_03.txt'))
+        lines, measurements = hm.call_measured((hm.get_pairs, genotypes, mutations, 0, len(genotypes)))
+        self.assertEqual(len(genotypes) * (len(genotypes) - 1) // 2, measurements['compared'])
+        self.assertEqual(len(lines), measurements['emitted'])
+        groups = hm.read_groups('test_complete_03/hypercubes_1.txt')
+        lines, measurements = hm.call_measured((hm.process_groups, [(diagonal, starts, ends) for diagonal,
+                                                                    (starts, ends) in groups.items()]))
+        self.assertEqual(len(lines), measurements['emitted'])
+        self.assertEqual(max(len(starts) for starts, ends in groups.values()),
+                         max(measurements['largest_groups'])[0])
+
+    def test_sorted_runs(self):
+        lines = [line.rstrip('\n') for line in ch.read_lines('test_complete_03/hypercubes_1.txt')]
+        with tempfile.TemporaryDirectory() as folder:
+            runs = aux.write_sorted_runs(reversed(lines), folder + '/chunk.txt', 3 * aux.LINE_OVERHEAD)
+            self.assertGreater(runs, 1)
+            self.assertEqual(['chunk.txt'], os.listdir(folder))
+            with open(folder + '/chunk.txt', 'r') as fh:
+                self.assertEqual(sorted(lines), [line.rstrip('\n') for line in fh])
+
+    def test_worker_pool(self):
+        expected = list(iter_hypercubes('test_complete_03.txt'))
+        with hm.worker_pool(2) as pool:
+            self.assertEqual(expected, list(iter_hypercubes('test_complete_03.txt', cores=2)))
+            self.assertIs(pool, hm.run_pool)
+        self.assertIsNone(hm.run_pool)
+
+    def test_expand(self):
+        # Diagonal mutations at positions wild-type in the first genotype are inserted by positions
+        self.assertEqual('Z0A:Z2C\t0Z, 2C, 0A, 0A:2C', ex.expand_line('Z0A:Z2C\t0Z\t0A:2C\n', dict()))
+        self.assertEqual('A1Z:Z3T\t1A:5G, 1A:3T:5G, 5G, 3T:5G', ex.expand_line('A1Z:Z3T\t1A:5G\t3T:5G\n', dict()))
+        diagonal = ex.diagonal_to_dict(['A1Z', 'Z3T'])
+        self.assertEqual('3T:5G', ex.apply_mutations(diagonal, ['1', '3'], '1A:5G'))
+        with tempfile.TemporaryDirectory() as folder:
+            ex.expand_hypercubes('test_complete_03/hypercubes_2.txt', folder + '/serial.txt')
+            ex.expand_hypercubes('test_complete_03/hypercubes_2.txt', folder + '/parallel.txt', cores=3)
+            with open(folder + '/serial.txt', 'rb') as serial, open(folder + '/parallel.txt', 'rb') as parallel:
+                self.assertEqual(serial.read(), parallel.read())
+
+    def test_sparse_landscapes(self):
+        # Workers pairing single mutants over the shared genotype table agree with comparing all pairs
+        for spec in ('sparse:6:2:300', 'dms:12:19:400'):
+            genotypes = benchmark.generate_landscape(spec, seed=1)
+            self.assertEqual(list(iter_hypercubes(genotypes, max_dim=3, all_pairs=True)),
+                             list(iter_hypercubes(genotypes, max_dim=3, cores=2)))
+            with tempfile.TemporaryDirectory() as folder:
+                benchmark.write_landscape(genotypes, folder + '/genotypes.txt')
+                merged = list()
+                for all_pairs in (True, False):
+                    _, file_names = hm.process_dimension_one(2, folder + '/genotypes.txt', folder, all_pairs)
+                    open(folder + '/merged.txt', 'w').close()
+                    aux.merge_sorted_files(hm.remove_empty_files(file_names), aux.MAX_OPEN_FILES,
+                                           folder + '/merged.txt')
+                    with open(folder + '/merged.txt', 'r') as fh:
+                        merged.append(fh.read())
+                self.assertEqual(merged[0], merged[1])
+
+    def test_bucket_pairing(self):
+        # Pairs of the single-mutant index are the pairs of first genotypes at distance 1
+        for spec in ('sparse:6:2:300', 'dms:12:19:400'):
+            groups = dict()
+            for diagonal, start, end in iter_hypercubes(benchmark.generate_landscape(spec, seed=1), max_dim=2):
+                groups.setdefault(diagonal, (list(), list()))
+                groups[diagonal][0].append(start)
+                groups[diagonal][1].append(end)
+            for diagonal, (starts, ends) in groups.items():
+                expected = list()
+                for i in range(len(starts) - 1):
+                    for j in range(i + 1, len(starts)):
+                        direction, delta = aux.get_delta(starts[i].split(':'), starts[j].split(':'))
+                        if len(delta) == 1 and diagonal.split(':')[-1] < delta[0]:
+                            first, last = (i, j) if direction == 'forward' else (j, i)
+                            expected.append(diagonal + ':' + delta[0] + '\t' + starts[first] + '\t' + ends[last])
+                self.assertEqual(sorted(expected), sorted(hm.process_diagonal(diagonal, starts, ends)))
+
+    def test_in_memory(self):
+        genotypes = aux.read_genotypes('test_complete_03.txt')
+        with tempfile.TemporaryDirectory() as folder:
+            _, groups, spilled_file_names = hm.process_dimension_one_in_memory(2, genotypes, folder, False, None)
+            self.assertEqual([], spilled_file_names)
+            hm.write_groups(groups, folder + '/hypercubes_1.txt', True)
+            self.assertEqual(read_file_with_hypercubes('test_expected/hypercubes_1.txt'),
+                             read_file_with_hypercubes(folder + '/hypercubes_1.txt'))
+            # The budget of a few bytes spills hypercubes of the dimension two to disk
+            _, spilled_groups, spilled_file_names = hm.process_dimension_in_memory(2, groups, folder, 1)
+            self.assertIsNone(spilled_groups)
+            self.assertGreater(len(spilled_file_names), 1)
+            ch.write_header(folder + '/hypercubes_2.txt')
+            aux.merge_sorted_files(spilled_file_names, aux.MAX_OPEN_FILES, folder + '/hypercubes_2.txt')
+            self.assertEqual(read_file_with_hypercubes('test_expected/hypercubes_2.txt'),
+                             read_file_with_hypercubes(folder + '/hypercubes_2.txt'))
+
+    def test_binary_format(self):
+        with open('test_expected/hypercubes_2.txt', 'r') as fh:
+            text = fh.read()
+        with tempfile.TemporaryDirectory() as folder:
+            with open(folder + '/hypercubes_2.txt', 'w') as fh:
+                fh.write(text)
+            self.assertEqual(text.count('\n') - 1, bh.text_to_binary(folder + '/hypercubes_2.txt',
+                                                                     folder + '/hypercubes_2.bin'))
+            self.assertTrue(bh.is_binary(folder + '/hypercubes_2.bin'))
+            bh.binary_to_text(folder + '/hypercubes_2.bin', folder + '/back.txt')
+            with open(folder + '/hypercubes_2.txt', 'rb') as fh, open(folder + '/back.txt', 'rb') as back_fh:
+                self.assertEqual(fh.read(), back_fh.read())
+
+            run_hypercubeme('-g', 'test_complete_03.txt', '-d', folder + '/binary', '-c', '2', '-f', 'binary')
+            for dimension in (1, 2, 3):
+                bh.binary_to_text(folder + '/binary/hypercubes_{0}.bin'.format(dimension), folder + '/back.txt')
+                self.assertEqual(read_file_with_hypercubes('test_expected/hypercubes_{0}.txt'.format(dimension)),
+                                 read_file_with_hypercubes(folder + '/back.txt'))
+
+    def test_index(self):
+        lines = list(ch.read_lines('test_complete_03/hypercubes_2.txt'))
+        with tempfile.TemporaryDirectory() as folder:
+            for part in range(3):
+                aux.write_sorted_lines([line.rstrip('\n') for line in lines[part::3]], folder + '/' + str(part))
+            file_name = folder + '/hypercubes_2.txt'
+            ch.write_header(file_name)
+            aux.merge_sorted_files([folder + '/' + str(part) for part in range(3)], aux.MAX_OPEN_FILES, file_name,
+                                   aux.index_file_name(file_name))
+            index = aux.read_index(aux.index_file_name(file_name))
+            self.assertEqual(sorted(set(line.split('\t')[0] for line in lines)), [diagonal for diagonal, _, _ in index])
+            self.assertEqual(len(lines), sum(count for _, _, count in index))
+            with open(file_name, 'r') as fh:
+                for diagonal, offset, count in index:
+                    fh.seek(offset)
+                    group = [fh.readline() for _ in range(count)]
+                    self.assertEqual([line for line in lines if line.startswith(diagonal + '\t')], group)
+
+    def test_parallel_merge(self):
+        lines = sorted(line.rstrip('\n') for dimension in (1, 2, 3)
+                       for line in ch.read_lines('test_complete_03/hypercubes_{0}.txt'.format(dimension)))
+        parallel_merge_size = aux.PARALLEL_MERGE_SIZE
+        aux.PARALLEL_MERGE_SIZE = 1
+        try:
+            with tempfile.TemporaryDirectory() as folder:
+                # Overlapping sorted files: every file takes lines from the whole range
+                file_names = [folder + '/' + str(part) for part in range(4)]
+                for part, file_name in enumerate(file_names):
+                    aux.write_sorted_lines(lines[part::4], file_name)
+                file_name = folder + '/merged.txt'
+                ch.write_header(file_name)
+                aux.merge_sorted_files(file_names, aux.MAX_OPEN_FILES, file_name, aux.index_file_name(file_name), 3)
+                self.assertEqual(lines, [line.rstrip('\n') for line in ch.read_lines(file_name)])
+                for diagonal, offset, count in aux.read_index(aux.index_file_name(file_name)):
+                    self.assertEqual([line for line in lines if line.startswith(diagonal + '\t')],
+                                     [line.rstrip('\n') for line in ch.read_lines(file_name, offset, count)])
+        finally:
+            aux.PARALLEL_MERGE_SIZE = parallel_merge_size
+
+    def test_schedule_chunks(self):
+        self.assertEqual([(0, 2, 2), (2, 2, 2), (4, 2, 2)], hm.schedule_chunks([1] * 6, 3))
+        # The huge group gets a task of its own dispatched first, cheap groups around it are packed
+        self.assertEqual([(2, 1, 50), (3, 4, 4), (0, 2, 2)], hm.schedule_chunks([1, 1, 50, 1, 1, 1, 1], 3))
+        self.assertEqual([(0, 1, 100), (1, 3, 3)], hm.schedule_chunks([100, 1, 1, 1], 3))
+        # More tasks than groups: every group is a task
+        self.assertEqual([(1, 1, 3), (0, 1, 2)], hm.schedule_chunks([2, 3], 5))
+        self.assertEqual([], hm.schedule_chunks([], 3))
+        costs = [9, 1, 4, 4, 16, 1, 25, 1]
+        tasks = hm.schedule_chunks(costs, 3)
+        self.assertEqual(list(range(len(costs))), sorted(unit for start, length, _ in tasks
+                                                         for unit in range(start, start + length)))
+        self.assertEqual([sum(costs[start:start + length]) for start, length, _ in tasks],
+                         [cost for _, _, cost in tasks])
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as folder:
+            manifest = hm.manifest_file_name(folder)
+            hm.record(manifest, 'run', 'text')
+            hm.record(manifest, 'plan', 1, 4)
+            hm.process_dimension_one(2, 'test_complete_03.txt', folder, True,
+                                     {'manifest': manifest, 'dimension': 1, 'tasks': 4, 'done': set()})
+            # Interrupt the run after two chunks: records and files of the other chunks are lost
+            with open(manifest, 'r') as fh:
+                records = fh.readlines()
+            self.assertGreater(len(records), 4)
+            with open(manifest, 'w') as fh:
+                fh.writelines(records[:4])
+            for record in records[4:]:
+                os.remove(folder + '/' + record.split('\t')[2])
+            run_hypercubeme('-g', 'test_complete_03.txt', '-d', folder, '-c', '2', '--all-pairs', '--resume')
+            for dimension in (1, 2, 3):
+                self.assertEqual(read_file_with_hypercubes('test_expected/hypercubes_{0}.txt'.format(dimension)),
+                                 read_file_with_hypercubes(folder + '/hypercubes_{0}.txt'.format(dimension)))
+            self.assertTrue(hm.read_manifest(manifest)['finished'])
+
+    def test_statistics(self):
+        with tempfile.TemporaryDirectory() as folder:
+            # Dimensions one and two are counted from their files, the dimension three by the workers
+            run_hypercubeme('-g', 'test_complete_03.txt', '-d', folder + '/stats', '-c', '2', '--stats',
+                            '--max-dim', '3')
+            self.assertFalse(any(file_name.startswith('hypercubes_') for file_name in os.listdir(folder + '/stats')))
+            summary = ['dimension hypercubes diagonals']
+            for dimension in (1, 2, 3):
+                diagonals = dict()
+                positions = dict()
+                with open('test_expected/hypercubes_{0}.txt'.format(dimension), 'r') as fh:
+                    next(fh)
+                    for line in fh:
+                        diagonal = line.split('\t')[0]
+                        diagonals[diagonal] = diagonals.get(diagonal, 0) + 1
+                        for mutation in diagonal.split(':'):
+                            positions[mutation[1:-1]] = positions.get(mutation[1:-1], 0) + 1
+                for histogram, file_name in zip((diagonals, positions), hm.statistics_file_names(folder + '/stats',
+                                                                                                 dimension)):
+                    with open(file_name, 'r') as fh:
+                        next(fh)
+                        self.assertEqual(histogram, dict((key, int(count)) for key, count in
+                                                         (line.rstrip('\n').split('\t') for line in fh)))
+                summary.append('{0}\t{1}\t{2}'.format(dimension, sum(diagonals.values()), len(diagonals)))
+            with open(folder + '/stats/statistics.txt', 'r') as fh:
+                self.assertEqual(summary, [line.rstrip('\n') for line in fh])
+
+    def test_maximal(self):
+        def vertices(line):
+            return set(qh.canonical_genotype(vertex) for vertex in qh.hypercube_vertices(line))
+
+        with tempfile.TemporaryDirectory() as folder:
+            run_hypercubeme('-g', 'test_complete_03.txt', '-d', folder + '/maximal', '-c', '2', '--maximal',
+                            '--keep-all')
+            self.assertFalse(os.path.exists(folder + '/maximal/hypercubes_4.txt'))
+            hypercubes = dict((dimension, list(ch.read_lines(folder + '/maximal/hypercubes_{0}.txt'.format(dimension))))
+                              for dimension in (1, 2, 3))
+            for dimension, lines in hypercubes.items():
+                # The hypercube is maximal if no hypercube of the next dimension contains all its vertices
+                higher = [vertices(line) for line in hypercubes.get(dimension + 1, list())]
+                self.assertEqual([line for line in lines if not any(vertices(line) <= other for other in higher)],
+                                 list(ch.read_lines(folder + '/maximal/' + hm.maximal_hypercube_file_name(dimension))))
+
+    def test_epistasis(self):
+        fitness = {'0Z': (1, 0.5), '1A': (2, 0.5), '2C': (3, 0.5), '1A:2C': (7, 0.5),
+                   '3G': (5, 1.5), '1A:3G': (4, 1.5), '2C:3G': (6, 1.5), '1A:2C:3G': (10, 1.5)}
+        # Signed sums of fitness over vertices, the first genotype having the sign (-1)^d
+        expected = {('A1Z:C2Z', '1A:2C'): (7 - 2 - 3 + 1, 1.0),
+                    ('A1Z:C2Z', '1A:2C:3G'): (10 - 4 - 6 + 5, 3.0),
+                    ('A1Z:G3Z', '1A:3G'): (4 - 2 - 5 + 1, 5 ** 0.5),
+                    ('A1Z:G3Z', '1A:2C:3G'): (10 - 7 - 6 + 3, 5 ** 0.5),
+                    ('C2Z:G3Z', '2C:3G'): (6 - 3 - 5 + 1, 5 ** 0.5),
+                    ('C2Z:G3Z', '1A:2C:3G'): (10 - 7 - 4 + 2, 5 ** 0.5),
+                    ('A1Z:C2Z:G3Z', '1A:2C:3G'): (-10 + 7 + 4 + 6 - 2 - 3 - 5 + 1, 10 ** 0.5)}
+        with tempfile.TemporaryDirectory() as folder:
+            with open(folder + '/genotypes.txt', 'w') as fh:
+                print('mut_list\tfitness\terror', file=fh)
+                for genotype, (value, error) in fitness.items():
+                    print('' if genotype == '0Z' else genotype, value, error, sep='\t', file=fh)
+            run_hypercubeme('-g', folder + '/genotypes.txt', '-d', folder + '/epistasis', '-c', '2', '--epistasis')
+            found = dict()
+            for dimension in (2, 3):
+                with open(folder + '/epistasis/' + ep.epistasis_file_name(dimension), 'r') as fh:
+                    self.assertEqual(ep.HEADER, next(fh).rstrip('\n'))
+                    for line in fh:
+                        diagonal, first, _, value, error = line.rstrip('\n').split('\t')
+                        found[(diagonal, first)] = (float(value), float(error))
+            self.assertEqual(sorted(expected), sorted(found))
+            for hypercube, (value, error) in expected.items():
+                self.assertAlmostEqual(value, found[hypercube][0])
+                self.assertAlmostEqual(error, found[hypercube][1])
+
 
 if __name__ == '__main__':
     if not os.path.exists('test_complete_03'):